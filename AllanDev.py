@@ -0,0 +1,195 @@
+# Python3 host code: frequency stability of a CrystalCal.py log with NumPy
+# overlapping Allan, modified Allan and time deviation at octave taus, and the
+# crystal's temperature coefficient from the degC column
+
+# CrystalCal.py prints 'epoch, ticks, dT, degC' every 2nd input pulse: ticks is
+# one input period in counter() steps, one every 2 CPU cycles (its loop is two
+# instructions), so with a 1 PPS reference
+#   y = 2 * ticks / (MFREQ * period) - 1   is the crystal's fractional frequency error.
+# Phase x = cumsum(y) * tau0, and its running sum X = cumsum(x), turn every
+# statistic into a few differences of shifted arrays: O(N) per tau, not O(N*m).
+# Note the log has dead time (one period measured out of two); ADEV from it is
+# exact for white FM and somewhat biased for the other noise types.
+
+# python3 AllanDev.py crystal.csv [MFREQ [period]]
+# python3 AllanDev.py --test          (synthetic noise of known slopes, a CrystalCal log, timing at 10^7 points)
+
+import sys
+import time
+import numpy as np
+from EncAnalyze import chunks
+
+MFREQ = 200_000_000     # CrystalCal.py's CPU clock; its counter runs at MFREQ / 2
+PERIOD = 1.0            # seconds per input pulse (1 PPS)
+
+# ---------------------------------------------
+def readLog(fname):   # -> epoch, ticks, degC arrays (empty if the log has none)
+    a = [c for c in chunks(fname) if len(c)]
+    if not a or a[0].ndim != 2 or a[0].shape[1] < 4:
+        e = np.zeros(0)
+        return e, e, e
+    a = np.concatenate(a)
+    return a[:, 0], a[:, 1], a[:, 3]
+
+def fracFreq(ticks, mfreq=MFREQ, period=PERIOD):   # fractional frequency error from counter ticks
+    return ticks / (mfreq / 2 * period) - 1
+
+def octaves(n, minTerms=4):   # m = 1, 2, 4, ... while there are enough terms for the slowest statistic
+    m = 1; out = []
+    while 3 * m + minTerms <= n + 1:
+        out.append(m)
+        m *= 2
+    return out
+
+def phase(y, tau0):   # x[0..N] from fractional frequency y[0..N-1]; the mean is taken out first
+    x = np.empty(len(y) + 1)
+    x[0] = 0.0
+    np.cumsum((y - y.mean()) * tau0, out=x[1:])
+    return x
+
+def oadev(x, tau0, ms):   # overlapping Allan deviation: [(tau, adev, terms)]
+    out = []
+    for m in ms:
+        d = x[2*m:] - x[m:-m]      # in place: one temporary per tau
+        d -= x[m:-m]
+        d += x[:-2*m]
+        tau = m * tau0
+        out.append((tau, np.sqrt(np.dot(d, d) / (2 * len(d))) / tau, len(d)))
+    return out
+
+def mdev(x, tau0, ms):    # modified Allan deviation, from the running sum of x
+    X = np.empty(len(x) + 1)
+    X[0] = 0.0
+    np.cumsum(x - x.mean(), out=X[1:])
+    out = []
+    for m in ms:
+        s = X[m:-2*m] - X[2*m:-m]  # X[j+3m] - 3X[j+2m] + 3X[j+m] - X[j]: m second differences summed
+        s *= 3
+        s += X[3*m:]
+        s -= X[:-3*m]
+        tau = m * tau0
+        out.append((tau, np.sqrt(np.dot(s, s) / (2 * m * m * len(s))) / tau, len(s)))
+    return out
+
+def tdev(md):             # time deviation, seconds, from mdev()'s list: tau/sqrt(3) * MDEV
+    return [(tau, tau * d / np.sqrt(3), n) for tau, d, n in md]
+
+def tempco(y, degC, t):
+    # least squares y = a + b*(degC - mean) + c*(t - mean): the drift term keeps ageing
+    # out of the tempco; returns (b, its standard error, c, residual y)
+    A = np.column_stack((np.ones_like(y), degC - degC.mean(), t - t.mean()))
+    coef, _, _, _ = np.linalg.lstsq(A, y, rcond=None)
+    r = y - A @ coef
+    cov = np.linalg.inv(A.T @ A) * np.dot(r, r) / max(len(y) - 3, 1)
+    return coef[1], np.sqrt(cov[1, 1]), coef[2], r
+
+def table(y, tau0):       # the three statistics side by side
+    x = phase(y, tau0)
+    ms = octaves(len(y))
+    ad = oadev(x, tau0, ms); md = mdev(x, tau0, ms); td = tdev(md)
+    return [(a[0], a[2], a[1], m[1], t[1]) for a, m, t in zip(ad, md, td)]
+
+def printTable(rows):
+    print("   tau s    terms      ADEV      MDEV   TDEV ns")
+    for tau, n, a, m, t in rows:
+        print("%8g %8d  %.3e %.3e %8.3f" % (tau, n, a, m, t * 1e9))
+
+# ---------------------------------------------
+def noise(kind, n, rng):   # fractional frequency y with a power-law spectrum
+    w = rng.normal(0.0, 1.0, n)
+    if kind == "whitePM":  # white phase: y is the difference of white phase
+        return np.diff(rng.normal(0.0, 1.0, n + 1))
+    if kind == "whiteFM":
+        return w
+    if kind == "flickerFM":   # 1/f: shape white noise through the FFT
+        F = np.fft.rfft(w, 2 * n)
+        f = np.arange(len(F), dtype=np.float64)
+        f[0] = 1.0
+        y = np.fft.irfft(F / np.sqrt(f), 2 * n)[:n]
+        return y / y.std()
+    if kind == "rwFM":
+        return np.cumsum(w)
+    raise ValueError(kind)
+
+# ADEV and MDEV slopes for each noise type
+SLOPES = {"whitePM": (-1.0, -1.5), "whiteFM": (-0.5, -0.5), "flickerFM": (0.0, 0.0), "rwFM": (0.5, 0.5)}
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--test":
+        rng = np.random.default_rng(7)
+        # 1. against the textbook loops, on a short series
+        y = rng.normal(0.0, 1e-9, 300)
+        x = phase(y, 2.0)
+        for m, (tau, a, n), (_, md, _) in zip((1, 4, 16), oadev(x, 2.0, (1, 4, 16)), mdev(x, 2.0, (1, 4, 16))):
+            N = len(x)
+            sa = sum((x[i+2*m] - 2*x[i+m] + x[i])**2 for i in range(N - 2*m))
+            sm = sum(sum(x[i+2*m] - 2*x[i+m] + x[i] for i in range(j, j + m))**2 for j in range(N - 3*m + 1))
+            assert abs(a * tau / np.sqrt(sa / (2 * (N - 2*m))) - 1) < 1e-9
+            assert abs(md * tau / np.sqrt(sm / (2 * m * m * (N - 3*m + 1))) - 1) < 1e-9
+        print("matches the direct sums")
+        # 2. white FM: ADEV(tau) = sigma / sqrt(m)
+        s = 1e-9
+        rows = table(rng.normal(0.0, s, 1 << 18), 1.0)
+        for tau, n, a, md, t in rows[:8]:
+            assert abs(a * np.sqrt(tau) / s - 1) < 0.05, (tau, a)
+        print("white FM level: sigma/sqrt(tau) within 5%% up to tau %g" % rows[7][0])
+        # 3. slopes of each noise type, over the well-populated taus
+        for kind, (sa, sm) in SLOPES.items():
+            rows = table(noise(kind, 1 << 18, rng), 1.0)
+            ad = [(r[0], r[2]) for r in rows if r[1] > 2000]
+            md = [(r[0], r[3]) for r in rows if r[1] > 2000]
+            ga = np.polyfit(np.log([a[0] for a in ad]), np.log([a[1] for a in ad]), 1)[0]
+            gm = np.polyfit(np.log([a[0] for a in md]), np.log([a[1] for a in md]), 1)[0]
+            print("%-9s ADEV slope %5.2f (%5.2f)   MDEV slope %5.2f (%5.2f)" % (kind, ga, sa, gm, sm))
+            assert abs(ga - sa) < 0.1 and abs(gm - sm) < 0.1
+        # 4. tempco: +0.3 ppm/degC on a daily temperature swing, with ageing and white FM
+        n = 200_000; tau0 = 2.0
+        t = np.arange(n) * tau0
+        degC = 25 + 3 * np.sin(2 * np.pi * t / 86400) + rng.normal(0.0, 0.2, n)
+        y = 12e-6 + 0.3e-6 * (degC - 25) + 1e-12 * t + rng.normal(0.0, 1e-8, n)
+        b, se, c, r = tempco(y, degC, t)
+        print("tempco %.5f +/- %.1g ppm/degC (0.3), ageing %.3g /s (1e-12)" % (b * 1e6, se * 1e6, c))
+        assert abs(b - 0.3e-6) < 4 * se + 1e-10 and abs(c - 1e-12) < 1e-13
+        # 5. a log as CrystalCal.py prints it: a crystal +10 ppm fast, +0.5 ppm/degC
+        import os
+        import tempfile
+        fd, fname = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w") as f:
+            f.write("epoch, ticks, dT, degC\n# Pulse Time v1 14-April-2021 J.Beale  Board_ID: E6605838833B4A2E\n")
+            for i in range(400):
+                deg = 25 + 2 * np.sin(i / 40)
+                aSum = round(MFREQ / 2 * (1 + 10e-6 + 0.5e-6 * (deg - 25)))
+                f.write("%d,%8d,%2d,%5.2f\n" % (670000000 + 2 * i, aSum, (-1) ** i, deg))
+                if i == 200:
+                    f.write("# 3 edges lost: buffer full\n")
+        epoch, ticks, degC = readLog(fname)
+        os.remove(fname)
+        y = fracFreq(ticks)
+        b, se, c, r = tempco(y, degC, epoch)
+        y25 = y.mean() - b * (degC.mean() - 25)
+        print("CrystalCal log: %d readings, crystal %+.3f ppm at 25 degC (+10), tempco %+.3f ppm/degC (+0.5)"
+              % (len(y), y25 * 1e6, b * 1e6))
+        assert len(y) == 400 and abs(y25 - 10e-6) < 0.02e-6 and abs(b - 0.5e-6) < 0.02e-6
+        # 6. speed at 10^7 points
+        y = rng.normal(0.0, 1e-9, 10_000_000)
+        t0 = time.perf_counter()
+        rows = table(y, 2.0)
+        print("10^7 points, %d taus: %.2f s" % (len(rows), time.perf_counter() - t0))
+    else:
+        fname = sys.argv[1]
+        mfreq = float(sys.argv[2]) if len(sys.argv) > 2 else MFREQ
+        period = float(sys.argv[3]) if len(sys.argv) > 3 else PERIOD
+        epoch, ticks, degC = readLog(fname)
+        if len(epoch) < 8:
+            sys.exit("%s: %d readings of 'epoch, ticks, ?, degC', too few (8 at least)" % (fname, len(epoch)))
+        tau0 = float(np.median(np.diff(epoch))) if len(epoch) > 1 else 2 * period
+        y = fracFreq(ticks, mfreq, period)
+        gaps = int(np.count_nonzero(np.diff(epoch) > 1.5 * tau0))
+        print("# %s: %d readings every %g s, %.1f h; crystal %+.3f ppm, %.2f..%.2f degC%s"
+              % (fname, len(y), tau0, len(y) * tau0 / 3600, y.mean() * 1e6, degC.min(), degC.max(),
+                 ", %d gaps (treated as contiguous)" % gaps if gaps else ""))
+        b, se, c, r = tempco(y, degC, epoch)
+        print("# tempco %+.4f +/- %.2g ppm/degC, drift %+.3g ppm/day" % (b * 1e6, se * 1e6, c * 86400e6))
+        printTable(table(y, tau0))
+        print("# after taking out the tempco and drift:")
+        printTable(table(r, tau0))
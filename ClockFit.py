@@ -0,0 +1,222 @@
+# Python3 host code: Pico tick counts -> corrected UTC, by fitting the device clock to host time
+# Host_Log_Pico.py stamps each line with time.time() when readline() returns,
+# which is late by the USB buffering delay (a few ms, never negative).  The
+# Pico's own ticks (ticks_us, ticks_ms, or PIO counts) are much finer but have
+# no wall-clock anchor, and roll over.  clockFit unwraps the ticks, fits
+#     host = t0 + X + a + b*X        (X: device seconds, b: crystal error)
+# by least squares with exponential forgetting (time constant tau).  As in NTP,
+# only the least delayed line of each block goes into the fit, and the offset
+# is the lower edge of those over the last 'window' blocks, not their mean,
+# since the USB delay only ever adds.  Each line is then stamped
+# t0 + X + a + b*X + edge - latency.
+
+# Wraps: ticks_ms/ticks_us (ticks_diff) wrap at 2^30, the raw 1 MHz timer and
+# PIO counts (rollFix(), FreqEst.unwrap()) at 2^32.  The host time between two
+# lines says how many whole wraps went by, so gaps longer than a wrap are fine.
+# A line far off the fit (resetTol) means the Pico restarted: the fit starts over.
+# LogWriter.py keeps whole epoch seconds only; then quantum = 1 (set by itself
+# from the log), the edge is of host + 1, and blocks are 256 lines: a few ms.
+
+# python3 ClockFit.py pLog.csv COL [RATE [BITS]]   (COL: payload column with the ticks; prints 'utc, line')
+# python3 ClockFit.py --test                        (synthetic drifting clock: stamp error)
+
+import math
+import sys
+import numpy as np
+
+# ---------------------------------------------
+class tickClock:   # raw tick counts -> device seconds since the first, through rollovers
+
+    def __init__(self, rate=1e6, bits=32):
+        self.rate = rate
+        self.period = 1 << bits
+        self.last = None           # raw count and host time of the last line
+        self.hLast = 0.0
+        self.ticks = 0             # unwrapped count since the first line
+        self.wraps = 0
+
+    def seconds(self, raw, host):
+        if self.last is None:
+            self.last = raw; self.hLast = host
+            return 0.0
+        d = (raw - self.last) % self.period
+        n = round(((host - self.hLast) * self.rate - d) / self.period)  # whole wraps in between
+        if n > 0:
+            d += n * self.period
+        self.wraps += (raw < self.last) + max(n, 0)
+        self.ticks += d
+        self.last = raw; self.hLast = host
+        return self.ticks / self.rate
+
+    def restart(self):
+        self.last = None
+        self.ticks = 0
+
+class clockFit:
+
+    def __init__(self, rate=1e6, bits=32, tau=600.0, block=32, window=8, latency=0.0,
+                 quantum=0.0, resetTol=1.0):
+        self.clock = tickClock(rate, bits)
+        self.tau = tau             # device seconds: fit forgets with this time constant
+        self.block = block         # lines: the least delayed one of each goes into the fit
+        self.window = window       # blocks for the lower edge
+        self.latency = latency     # shortest USB delay, s, if known (it cannot be seen in the data)
+        self.quantum = quantum     # resolution of the host stamps: 0, or 1 for whole seconds
+        self.resetTol = resetTol   # s off the fit: the device restarted
+        self.resets = 0
+        self.start()
+
+    def start(self):
+        self.clock.restart()
+        self.t0 = None             # host time of the first line
+        self.xa = 0.0              # x in the sums is X - xa
+        self.S = [0.0] * 5         # weighted sums of 1, x, y, x*x, x*y over the block minima
+        self.Xl = 0.0
+        self.a = 0.0; self.b = 0.0
+        self.edge = 0.0            # lower edge of the block minima about the fit
+        self.best = None           # (residual, X, Y) of the least delayed line in this block
+        self.X = np.zeros(self.window); self.Y = np.zeros(self.window)
+        self.n = 0
+        self.nb = 0
+
+    def add(self, raw, host):   # one line: raw tick count and host time; returns its corrected UTC
+        if self.t0 is None:
+            self.t0 = host
+        X = self.clock.seconds(raw, host)
+        Y = host - self.t0 - X + self.quantum
+        r = Y - self.a - self.b * X
+        if self.nb > 8 and abs(r - self.edge) > self.resetTol + self.quantum:
+            self.resets += 1
+            self.start()
+            return self.add(raw, host)
+        if self.best is None or r < self.best[0]:
+            self.best = (r, X, Y)
+        self.n += 1
+        if self.n % self.block == 0 or self.nb < 2:
+            self._fit(*self.best[1:])
+            self.best = None
+        return self.utc(X)
+
+    def _fit(self, X, Y):   # one block minimum into the sums; new a, b and edge
+        S = self.S
+        w = math.exp(-(X - self.Xl) / self.tau)    # forget
+        for j in range(5):
+            S[j] *= w
+        self.Xl = X
+        if X - self.xa > self.tau:                  # keep x small: move the origin
+            d = X - self.xa
+            S[4] -= d * S[2]
+            S[3] -= 2 * d * S[1] - d * d * S[0]
+            S[1] -= d * S[0]
+            self.xa = X
+        x = X - self.xa
+        S[0] += 1; S[1] += x; S[2] += Y; S[3] += x * x; S[4] += x * Y
+        det = S[0] * S[3] - S[1] * S[1]
+        if self.nb > 8 and det > 1e-12 * S[0] * S[3]:   # slope once there are a few blocks
+            b = (S[0] * S[4] - S[1] * S[2]) / det
+            self.a = (S[2] - b * S[1]) / S[0] - b * self.xa
+            self.b = b
+        else:
+            self.a = S[2] / S[0] - self.b * X
+        i = self.nb % self.window
+        self.X[i] = X; self.Y[i] = Y
+        self.nb += 1
+        m = min(self.nb, self.window)
+        self.edge = float((self.Y[:m] - self.a - self.b * self.X[:m]).min())
+
+    def utc(self, X):   # corrected UTC at X device seconds since the first line
+        return self.t0 + X + self.a + self.b * X + self.edge - self.latency
+
+    def report(self):
+        return {"n": self.n, "ppm": self.b * 1e6, "offset": self.a + self.edge - self.latency,
+                "wraps": self.clock.wraps, "resets": self.resets}
+
+# ---------------------------------------------
+def restampLog(fname, col, rate=1e6, bits=32, out=sys.stdout):
+    # Host_Log_Pico.py lines 'date, epoch, board, payload': one fit per board
+    fits = {}
+    with open(fname) as f:
+        for line in f:
+            v = line.split(",")
+            if len(v) < 4 + col:
+                continue
+            try:
+                host = float(v[1]); raw = int(v[3 + col])
+            except ValueError:
+                continue
+            board = v[2].strip()
+            if board not in fits:
+                whole = "." not in v[1]
+                fits[board] = clockFit(rate, bits, block=256 if whole else 32, quantum=float(whole))
+            out.write("%.6f, %s" % (fits[board].add(raw, host), line))
+    return fits
+
+def driftingClock(hours=12.0, every=1.0, rate=1e6, bits=32, ppm=30.0, tempPpm=1.0, tempHours=24.0,
+                  lat0=1e-3, latMean=3e-3, whole=False, gap=None, reset=None, seed=1):
+    # lines every 'every' s of true UTC; the device crystal is off by ppm, plus a
+    # swing of tempPpm over tempHours (room temperature); the host stamp is late by lat0 + exponential(latMean).
+    # gap: (start h, length h) with no lines; reset: hour at which the device restarts
+    rng = np.random.default_rng(seed)
+    t = 1619445791.0 + np.arange(0.0, hours * 3600, every)
+    t += rng.uniform(0, every, len(t))                     # lines come when they come
+    if gap is not None:
+        t = t[((t - t[0]) < gap[0] * 3600) | ((t - t[0]) >= (gap[0] + gap[1]) * 3600)]
+    s = t - t[0]
+    w = 2 * math.pi / (tempHours * 3600)
+    dev = s * (1 + ppm * 1e-6) - tempPpm * 1e-6 / w * (np.cos(w * s) - 1)   # device seconds
+    dev += 1234.5                                          # it was powered up earlier
+    if reset is not None:
+        r = s >= reset * 3600
+        dev[r] = (s[r] - s[r][0]) * (1 + ppm * 1e-6) + 0.2   # ticks start again
+    ticks = (np.floor(dev * rate).astype(np.int64)) % (1 << bits)
+    host = t + lat0 + rng.exponential(latMean, len(t))
+    if whole:
+        host = np.floor(host)
+    return t, ticks, host
+
+def trial(name, t, ticks, host, skip=3600.0, **kw):   # stamp error after the first 'skip' seconds
+    cf = clockFit(**kw)
+    utc = np.array([cf.add(int(r), float(h)) for r, h in zip(ticks.tolist(), host.tolist())])
+    keep = (t - t[0]) >= skip
+    err = utc[keep] - t[keep]
+    raw = host[keep] - t[keep]
+    r = cf.report()
+    print("%-24s rms %7.1f us, max %7.1f us  (host stamps: rms %6.0f us);  %+.3f ppm, %d wraps, %d resets"
+          % (name, math.sqrt((err ** 2).mean()) * 1e6, np.abs(err).max() * 1e6,
+             math.sqrt((raw ** 2).mean()) * 1e6, r["ppm"], r["wraps"], r["resets"]))
+    return err, r
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--test":
+        import time
+        tm = time.perf_counter()
+        # ticks_us (2^30), 1 line/s, 12 h; the 1 ms least delay is given as latency
+        t, k, h = driftingClock(bits=30)
+        e, r = trial("ticks_us, 1 line/s", t, k, h, bits=30, latency=1e-3)
+        assert np.abs(e).max() < 150e-6 and r["wraps"] == (np.diff(k) < 0).sum()
+        # a fast swing: 2 ppm in 6 h, as next to a window
+        t, k, h = driftingClock(bits=30, tempPpm=2.0, tempHours=6.0)
+        e, r = trial("2 ppm in 6 h", t, k, h, bits=30, latency=1e-3)
+        assert np.abs(e).max() < 500e-6
+        # PIO counts at 100 MHz wrap every 43 s, and a 30-minute gap in the log
+        t, k, h = driftingClock(rate=100e6, gap=(4, 0.5))
+        e, r = trial("PIO 100 MHz, gap 30 min", t, k, h, rate=100e6, latency=1e-3)
+        assert np.abs(e).max() < 150e-6 and r["wraps"] > (np.diff(k) < 0).sum()
+        # the Pico restarts at hour 6
+        t, k, h = driftingClock(bits=30, reset=6)
+        e, r = trial("device reset at 6 h", t, k, h, bits=30, latency=1e-3)
+        s = (t - t[0])[t - t[0] >= 3600]
+        assert r["resets"] == 1 and np.abs(e[s > 7 * 3600]).max() < 150e-6
+        # LogWriter.py's whole-second stamps, 10 lines/s
+        t, k, h = driftingClock(every=0.1, whole=True, bits=30)
+        e, r = trial("whole seconds, 10 lines/s", t, k, h, bits=30, latency=1e-3, quantum=1.0, block=256)
+        assert math.sqrt((e ** 2).mean()) < 5e-3
+        print("%.1f s" % (time.perf_counter() - tm))
+    else:
+        col = int(sys.argv[2])
+        rate = float(sys.argv[3]) if len(sys.argv) > 3 else 1e6
+        bits = int(sys.argv[4]) if len(sys.argv) > 4 else 32
+        for board, cf in restampLog(sys.argv[1], col, rate, bits).items():
+            r = cf.report()
+            print("# %s: %d lines, crystal %+.3f ppm, %d wraps, %d resets"
+                  % (board, r["n"], r["ppm"], r["wraps"], r["resets"]), file=sys.stderr)
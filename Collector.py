@@ -0,0 +1,305 @@
+# Python3 host code: TCP collector for the ESP8266 forwarders, in place of 'nc -l 8889'
+# One asyncio loop takes any number of connections at once.  Each device's
+# lines go to its own log (<logDir>/<device>.csv, rotated at maxBytes), with
+# the same 'date, epoch, device, line' prefix as Host_Log_Pico.py (LogWriter.py).
+
+# Framing (Spool.py, ESP8266-Serial2Net.py):
+#   # HELLO <device> <boot> <version>      first line on a connection
+#   # START ... / data lines / # END_PACKET n
+# A packet is written when its END_PACKET line arrives, and then answered
+# with '# ACK n', so the forwarder can let it go.  Packet numbers are checked
+# per device and boot: a number already seen is a resend and is dropped, a
+# jump is a gap, noted in the log as '# GAP a..b'.  A packet cut off by a
+# lost connection is dropped too, since the forwarder sends it again.  Only
+# the latest boot of a device is kept: the spool starts a new one only when
+# the old one's packets are all gone.  A HELLO or END line whose numbers do
+# not read is counted in 'errors' and kept as a line of data.
+# Senders without HELLO (ESP8266-Port-Data.py's 'End of packet n', nc-style)
+# are named by IP address, are not sent ACKs, and their last partial packet
+# is written as it is.
+
+# python3 Collector.py [PORT [LOGDIR]]      (default 8889, ./logs; a stats line every minute)
+# python3 Collector.py --load [N [SEC]]     (N simulated forwarders for SEC seconds)
+
+import asyncio
+import os
+import sys
+import time
+from LogWriter import batchWriter
+
+END = b"# END_PACKET "
+ENDOLD = b"End of packet "   # ESP8266-Port-Data.py
+MAXPKT = 100_000             # lines held for one packet, at most
+
+# ---------------------------------------------
+class deviceLog:   # one device's log file, rotated by size: name, name.1, ... name.<keep>
+
+    def __init__(self, fname, maxBytes=64 << 20, keep=5, flushMs=200):
+        self.fname = fname
+        self.maxBytes = maxBytes
+        self.keep = keep
+        self.flushMs = flushMs
+        self.rotations = 0
+        self.w = batchWriter(open(fname, "ab"), 65536, flushMs)
+
+    def add(self, absSec, dev, line):
+        self.w.add(absSec, dev, line)
+
+    def flush(self):   # out to the file now; rotate if it is full
+        self.w.flush()
+        if self.w.f.tell() >= self.maxBytes:
+            self.w.f.close()
+            for i in range(self.keep - 1, 0, -1):
+                if os.path.exists("%s.%d" % (self.fname, i)):
+                    os.replace("%s.%d" % (self.fname, i), "%s.%d" % (self.fname, i + 1))
+            os.replace(self.fname, self.fname + ".1")
+            self.w.f = open(self.fname, "ab")
+            self.rotations += 1
+
+    def poll(self):
+        if self.w.timeout() == 0.0:
+            self.flush()
+
+    def close(self):
+        self.flush()
+        self.w.f.close()
+
+class collector:
+
+    def __init__(self, logDir="logs", maxBytes=64 << 20, keep=5, flushMs=200):
+        self.logDir = logDir
+        os.makedirs(logDir, exist_ok=True)
+        self.maxBytes = maxBytes
+        self.keep = keep
+        self.flushMs = flushMs
+        self.logs = {}             # device -> deviceLog
+        self.last = {}             # device -> (boot, last packet number written)
+        self.clients = 0           # connections open now
+        self.maxClients = 0
+        self.connects = 0
+        self.packets = 0           # packets written
+        self.lines = 0             # lines written
+        self.dups = 0              # packets dropped as already written
+        self.gaps = 0              # jumps in packet numbers
+        self.missing = 0           # packets in those jumps
+        self.partial = 0           # packets cut off by a lost connection
+        self.errors = 0            # HELLO or END lines that could not be read
+
+    def log(self, dev):
+        w = self.logs.get(dev)
+        if w is None:
+            name = "".join(c if c.isalnum() or c in "-_." else "_" for c in dev.decode("ascii", "replace"))
+            w = deviceLog(os.path.join(self.logDir, name + ".csv"), self.maxBytes, self.keep, self.flushMs)
+            self.logs[dev] = w
+        return w
+
+    def packet(self, dev, boot, n, lines, now):   # a complete packet: check its number, write it
+        b, last = self.last.get(dev, (boot, None))
+        if b != boot or (boot is None and n == 1):
+            last = None                            # no HELLO: numbers from 1 again after a restart
+        if last is not None and n <= last:
+            self.dups += 1
+            return
+        w = self.log(dev)
+        if last is not None and n > last + 1:
+            self.gaps += 1
+            self.missing += n - last - 1
+            w.add(now, dev, b"# GAP %d..%d" % (last + 1, n - 1))
+        self.last[dev] = (boot, n)
+        for ln in lines:
+            w.add(now, dev, ln)
+        self.packets += 1
+        self.lines += len(lines)
+
+    async def handle(self, reader, writer):
+        dev = writer.get_extra_info("peername")[0].encode()
+        boot = None                # set by HELLO; then ACKs are sent
+        pkt = []                   # lines of the packet so far
+        part = b""
+        self.clients += 1; self.connects += 1
+        self.maxClients = max(self.maxClients, self.clients)
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                now = time.time()
+                lines = (part + data).split(b"\n")
+                part = lines.pop()
+                ack = 0
+                for ln in lines:
+                    ln = ln.rstrip()               # '\r', and '# END_PACKET 1 ' from a bridge
+                    if not ln:
+                        continue
+                    if ln.startswith(b"# HELLO "):
+                        w = ln.split()
+                        try:
+                            boot = int(w[3]); dev = w[2]
+                            pkt = []
+                            continue
+                        except (IndexError, ValueError):
+                            self.errors += 1       # kept as a line of data
+                    pkt.append(ln)
+                    if ln.startswith(END) or ln.startswith(ENDOLD):
+                        try:
+                            n = int(ln.split()[-1])
+                        except ValueError:
+                            self.errors += 1       # not an end after all: a line of data
+                            continue
+                        self.packet(dev, boot, n, pkt, now)
+                        ack = n
+                        pkt = []
+                    elif len(pkt) >= MAXPKT:       # no framing at all: write as it comes
+                        for p in pkt:
+                            self.log(dev).add(now, dev, p)
+                        self.lines += len(pkt)
+                        pkt = []
+                if ack and boot is not None:
+                    self.log(dev).flush()          # on disk (in the OS) before the ACK
+                    writer.write(b"# ACK %d\n" % ack)
+                    await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.clients -= 1
+            if pkt:
+                if boot is None:                   # nobody will send it again
+                    w = self.log(dev)
+                    for ln in pkt:
+                        w.add(time.time(), dev, ln)
+                    w.add(time.time(), dev, b"# INCOMPLETE PACKET")
+                    self.lines += len(pkt)
+                else:
+                    self.partial += 1
+            writer.close()
+
+    async def ticker(self, reportSec=None):   # flush logs on time; a stats line now and then
+        t = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flushMs / 1000)
+            for w in self.logs.values():
+                w.poll()
+            if reportSec and time.monotonic() - t >= reportSec:
+                t = time.monotonic()
+                print(self.summary(), flush=True)
+
+    def summary(self):
+        return ("# %s clients %d (max %d), %d packets, %d lines, %d dups, %d gaps (%d missing), %d partial, "
+                "%d bad framing lines"
+                % (time.strftime("%Y-%m-%d_%H:%M:%S"), self.clients, self.maxClients, self.packets,
+                   self.lines, self.dups, self.gaps, self.missing, self.partial, self.errors))
+
+    async def serve(self, host="0.0.0.0", port=8889, reportSec=60, ready=None):
+        srv = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        tick = asyncio.ensure_future(self.ticker(reportSec))
+        if ready is not None:
+            ready(srv.sockets[0].getsockname()[1])
+        try:
+            async with srv:
+                await srv.serve_forever()
+        finally:
+            tick.cancel()
+            for w in self.logs.values():
+                w.close()
+
+# ---------------------------------------------
+def loadServer(logDir, q, stop):   # collector in its own process, for --load
+    async def run():
+        c = collector(logDir)
+        task = asyncio.ensure_future(c.serve("127.0.0.1", 0, None, q.put))
+        t0 = None                  # CPU time counts from the first connection
+        while not stop.is_set():
+            await asyncio.sleep(0.1)
+            if t0 is None and c.connects:
+                t0 = (time.monotonic(), time.process_time())
+        t1 = (time.monotonic(), time.process_time())
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        t0 = t0 or t1
+        q.put({"packets": c.packets, "lines": c.lines, "dups": c.dups, "gaps": c.gaps,
+               "missing": c.missing, "maxClients": c.maxClients, "errors": c.errors,
+               "cpu": (t1[1] - t0[1]) / max(1e-9, t1[0] - t0[0])})
+    asyncio.run(run())
+
+async def forwarders(port, N, seconds, lines=40, period=1.0):
+    # N ESP8266-Serial2Net.py-like senders: one packet of 'lines' lines a period, waiting for each ACK.
+    # Sender i%10 == 3 skips a number once (a gap), i%10 == 7 sends one packet twice (a resend),
+    # i%10 == 9 sends a garbled HELLO and END once, and ends that packet with a trailing space.
+    body = b"".join(b"669402085,%d, 0.015, 0.0163, 641877536, 3905201192, 2714268494, 2488562100\n" % j
+                    for j in range(lines))
+    lat = []
+    sent = [0] * N
+    async def one(i):
+        await asyncio.sleep(period * i / N)                 # spread out over the period
+        r, w = await asyncio.open_connection("127.0.0.1", port)
+        w.write(b"# HELLO esp%d 1 load\n" % i)
+        n = 0
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < seconds:
+            n += 1
+            if i % 10 == 3 and n == 5:
+                n += 1
+            for rep in range(2 if (i % 10 == 7 and n == 5) else 1):
+                ts = time.monotonic()
+                if i % 10 == 9 and n == 5:
+                    w.write(b"# HELLO esp%d x load\n# START 2021-03-18 17:01:21\n" % i + body
+                            + END + b"%dx\n" % n + END + b"%d \n" % n)
+                else:
+                    w.write(b"# START 2021-03-18 17:01:21\n" + body + END + b"%d\n" % n)
+                await w.drain()
+                ackLn = await r.readline()
+                assert ackLn == b"# ACK %d\n" % n, ackLn
+                lat.append(time.monotonic() - ts)
+            sent[i] += 1
+            await asyncio.sleep(max(0.0, t0 + n * period - time.monotonic()))
+        w.close()
+    await asyncio.gather(*(one(i) for i in range(N)))
+    return sent, lat
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--load":
+        import multiprocessing as mp
+        import shutil
+        import tempfile
+        N = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+        sec = float(sys.argv[3]) if len(sys.argv) > 3 else 20.0
+        d = tempfile.mkdtemp()
+        q = mp.Queue(); stop = mp.Event()
+        p = mp.Process(target=loadServer, args=(d, q, stop))
+        p.start()
+        port = q.get()
+        t0 = time.monotonic()
+        sent, lat = asyncio.run(forwarders(port, N, sec))
+        wall = time.monotonic() - t0
+        stop.set()
+        r = q.get(); p.join()
+        lat.sort()
+        nPk = sum(sent)
+        print("%d forwarders, %.0f s: %d packets (%.0f/s), %d lines (%.0f/s)"
+              % (N, wall, r["packets"], r["packets"] / wall, r["lines"], r["lines"] / wall))
+        print("ACK latency p50 %.1f ms, p99 %.1f ms; collector CPU %.0f%% of one core (senders share the core)"
+              % (lat[len(lat) // 2] * 1e3, lat[int(0.99 * (len(lat) - 1))] * 1e3, r["cpu"] * 100))
+        print("resends dropped %d, gaps %d (%d missing), bad framing lines %d, most clients at once %d"
+              % (r["dups"], r["gaps"], r["missing"], r["errors"], r["maxClients"]))
+        expect = sum(1 for i in range(N) if i % 10 == 7 and sent[i] >= 5)
+        assert r["packets"] == nPk and r["dups"] == expect
+        assert r["gaps"] == sum(1 for i in range(N) if i % 10 == 3 and sent[i] >= 5)
+        assert r["errors"] == 2 * sum(1 for i in range(N) if i % 10 == 9 and sent[i] >= 5)
+        files = [f for f in os.listdir(d) if f.endswith(".csv")]
+        assert len(files) == N
+        with open(os.path.join(d, "esp7.csv"), "rb") as f:
+            ends = [ln for ln in f if END in ln]
+        assert len(ends) == sent[7] and len(set(ends)) == len(ends)
+        print("%d device logs, every packet once" % len(files))
+        shutil.rmtree(d)
+    else:
+        port = int(sys.argv[1]) if len(sys.argv) > 1 else 8889
+        logDir = sys.argv[2] if len(sys.argv) > 2 else "logs"
+        print("Collecting on port %d into %s/" % (port, logDir))
+        try:
+            asyncio.run(collector(logDir).serve("0.0.0.0", port))
+        except KeyboardInterrupt:
+            pass
@@ -10,6 +10,7 @@ from rp2 import asm_pio, StateMachine, PIO  # state machine
 from time import sleep_ms, time  # delay, and RTC time/date
 import array  # for circular data buffers
 import math   # for sqrt in standard deviation
+from PicoRing import ringBuf  # circular buffer shared with the IRQ handler
 
 MFREQ = 200_000_000  # CPU frequency in Hz (typ. 125 MHz; Overclocks to 250 MHz)
 VERSION = "Pulse Time v1 14-April-2021 J.Beale"
@@ -37,7 +38,7 @@ def trigger():
     set(pins, 0)     # and return it low
                      # and loop around again
 
-@asm_pio(sideset_init=PIO.OUT_LOW)
+@asm_pio(sideset_init=PIO.OUT_LOW, fifo_join=PIO.JOIN_RX)  # 8-word RX FIFO: room for 3 pairs + 1
 def counter():    
     wait(1, pin, 2)    # initial synchronization with edge flag
     
@@ -61,16 +62,10 @@ def counter():
     wrap()               # ----- repeat forever
 
 # ----------------------------------------------------------------------------------
-ASIZE = 1023                         # size of circular data buffers (dataT, dataB)
-dataT = array.array("I", [0]*ASIZE)  # store UINT32 loop count data
-dataB = array.array("B", [0]*ASIZE)  # store UCHAR bits (Ch.A, Ch.B values)
-dIdx = 0                             # current index into buffers
+ring = ringBuf(1024)   # circular buffer of (Ch.A,Ch.B bits, UINT32 timing) records
 
 def counter_handler(sm):   # SM interrupt: store A,B levels & pulse time in circular buffers
-    global dIdx
-    dataB[dIdx] = sm.get() & 0b11    # input levels: chA, chB
-    dataT[dIdx] = sm.get() + 4       # pulse time value, and account for loop overhead
-    dIdx = (dIdx + 1) % ASIZE        # increment index in circular buffer
+    ring.drain(sm)   # all waiting (chA,chB levels, timer value + loop overhead) pairs
     
     
 # Background: interrupt routine counter_handler() stores levels and timing in circular buffers
@@ -78,7 +73,6 @@ def counter_handler(sm):   # SM interrupt: store A,B levels & pulse time in circ
 # --------------------------------------------
 def main():
   global led1
-  global dIdx      # index into data buffers, updated in interrupt routine
 
   machine.freq(MFREQ)
   led1 = Pin(25, Pin.OUT)
@@ -107,17 +101,16 @@ def main():
   aHighOld = 0; aLowOld = 0  # previous value of counts
   
   rCount = 0  # total number of pulses received
-  i = 0  # starting index into circular buffers 
 
   while True:          # this just gets the first 4 readings, both high & low
-      if (dIdx != i):  # any new data in the buffer?
-        if (dataB[i] & 0x01):   # is input A high or low level now?
-            aHigh = dataT[i]
+      if ring.avail():  # any new data in the buffer?
+        bits, tval = ring.get()
+        if (bits & 0x01):   # is input A high or low level now?
+            aHigh = tval
             aLowOld = aLow
         else:
-            aLow = dataT[i]
+            aLow = tval
             aHighOld = aHigh
-        i = (i+1) % ASIZE
         if (aHighOld > 0) and (aLowOld > 0):
             aSumOld = aHigh + aLow
             break
@@ -127,12 +120,16 @@ def main():
 
   while True:  # main loop: get data from buffers, print every other full cycle
       
-      if (dIdx != i):  # if they're different, we aren't caught up with new data
-          if (dataB[i] & 0x01):   # is input A at high or low level now?
-              aHigh = dataT[i]    # high pulse time duration from buffer
+      if ring.avail():  # any new data we haven't caught up with?
+          bits, tval = ring.get()
+          n = ring.lost()
+          if n:
+              print("# %d edges lost: buffer full" % n)
+          if (bits & 0x01):   # is input A at high or low level now?
+              aHigh = tval        # high pulse time duration from buffer
           else:
               rCount += 1             # count total pulses
-              aLow = dataT[i]         # low pulse time from buffer
+              aLow = tval             # low pulse time from buffer
               aSum = aHigh + aLow     # total pulse period = high + low durations
               aDiff = aSum - aSumOld  # difference in clock ticks between alternate pulses
               
@@ -145,7 +142,6 @@ def main():
               aHighOld = aHigh
               aLowOld = aLow
               aSumOld = aSum
-          i = (i+1) % ASIZE  # advance circular buffer index
 
 # ---------------
 main()
@@ -0,0 +1,355 @@
+# Python3 host code: convert the loggers' CSV into chunked columnar .npy files
+# as the lines arrive, so analysis loads only the columns and row ranges it
+# needs instead of parsing the whole CSV again
+
+# Understands the lines these scripts write:
+#   Host_Log_Pico.py  '2021-04-26_14:03:11, 1619445791, ttyACM0, <payload>'
+#                     -> columns 'epoch' and 'board', then the payload's
+#   TempDataLog.py, ESP8266 forwarder sinks, raw Pico output: just the payload
+# A payload of names only ('epoch, degC', 'msec,t00,...') is a header: it names
+# the columns of the next new layout that wide.  '#' lines ('# Start: ...',
+# '# Pendulum v2 ...') are kept as metadata with the row they came before.
+
+# Layout on disk, one directory per line layout (column count and types):
+#   out/<layout>/000042.<column>.npy    one chunk of one column (int64, float64 or str)
+#   out/<layout>/chunks.jsonl           per chunk: rows, first line, min/max of each column
+#   out/meta.jsonl                      comments and headers, with line and row numbers
+#   out/state.json                      source bytes converted so far: a rerun resumes there
+# Chunks are written every chunkRows rows, and at least every flushSec when following
+# a live log, so a query never waits long for recent rows.
+
+# python3 CsvColumnar.py pLog.csv out/ [--follow]   (convert; --follow: keep reading appends)
+# python3 CsvColumnar.py - out/                      (from stdin, eg. nc -l 5000 | ...)
+# python3 CsvColumnar.py --test                      (synthetic logs: round trip, skipping, resume)
+
+import json
+import os
+import re
+import sys
+import time
+import numpy as np
+
+CHUNKROWS = 65536
+FLUSHSEC = 10.0
+PREFIX = re.compile(r"^\d{4}-\d\d-\d\d_\d\d:\d\d:\d\d$")   # LogWriter.py date field
+
+def isNum(s):
+    try:
+        float(s)
+        return True
+    except ValueError:
+        return False
+
+# ---------------------------------------------
+class layout:   # rows of one column layout, waiting to become a chunk
+
+    def __init__(self, out, key, names, prefix):
+        self.dir = os.path.join(out, key)
+        self.key = key
+        self.names = names
+        self.prefix = prefix       # the first 2 columns are epoch, board
+        self.rows = []             # lists of field strings
+        self.first = None          # source line number of the first waiting row
+        self.last = 0              # ... and of the last row in a written chunk
+        self.chunks = 0            # chunks written so far
+        self.total = 0             # rows written so far
+        os.makedirs(self.dir, exist_ok=True)
+        idx = os.path.join(self.dir, "chunks.jsonl")
+        if os.path.exists(idx):    # resuming: carry on from the last chunk
+            with open(idx) as f:
+                for ln in f:
+                    c = json.loads(ln)
+                    self.chunks = c["chunk"] + 1
+                    self.total = c["row0"] + c["rows"]
+                    self.last = c["lineN"]
+
+    def add(self, fields, lineNo):
+        if lineNo <= self.last:    # resumed from before a chunk this layout already wrote
+            return
+        if not self.rows:
+            self.first = lineNo
+        self.rows.append(fields)
+        self.lineN = lineNo
+
+    def write(self):
+        if not self.rows:
+            return
+        cols = list(zip(*self.rows))
+        stats = {}
+        for name, v in zip(self.names, cols):
+            a = column(v)
+            np.save(os.path.join(self.dir, "%06d.%s.npy" % (self.chunks, name)), a)
+            if a.dtype.kind in "if":
+                ok = a[a == a] if a.dtype.kind == "f" else a
+                stats[name] = [ok.min().item(), ok.max().item()] if len(ok) else [None, None]
+            else:
+                stats[name] = [min(v), max(v)]
+        rec = {"chunk": self.chunks, "row0": self.total, "rows": len(self.rows),
+               "line0": self.first, "lineN": self.lineN, "names": self.names, "stats": stats}
+        with open(os.path.join(self.dir, "chunks.jsonl"), "a") as f:
+            f.write(json.dumps(rec) + "\n")
+        self.chunks += 1
+        self.total += len(self.rows)
+        self.last = self.lineN
+        self.rows = []
+
+def column(v):   # field strings -> int64 if all whole numbers, else float64, else str
+    try:
+        return np.array(v, dtype=np.int64)
+    except (ValueError, OverflowError):
+        pass
+    try:
+        return np.array(v, dtype=np.float64)
+    except ValueError:
+        return np.array(v)
+
+# ---------------------------------------------
+class csvColumnar:
+
+    def __init__(self, out, chunkRows=CHUNKROWS, flushSec=FLUSHSEC):
+        self.out = out
+        self.chunkRows = chunkRows
+        self.flushSec = flushSec
+        os.makedirs(out, exist_ok=True)
+        self.layouts = {}          # key -> layout
+        self.names = {}            # (prefix, width) -> column names from the last header
+        self.meta = open(os.path.join(out, "meta.jsonl"), "a")
+        self.offset = 0            # source bytes taken
+        self.lines = 0             # source lines taken
+        self.metaLast = 0          # line of the last metadata record
+        self.tFlush = time.monotonic()
+        st = os.path.join(out, "state.json")
+        if os.path.exists(st):     # resume where every layout was last written out
+            with open(st) as f:
+                s = json.load(f)
+            self.offset = s["offset"]; self.lines = s["lines"]
+            self.names = {(p, w): n for p, w, n in s["names"]}
+            for key, names in s["layouts"].items():
+                self.layouts[key] = layout(out, key, names, key.startswith("P"))
+            with open(os.path.join(out, "meta.jsonl")) as f:
+                for ln in f:
+                    self.metaLast = json.loads(ln)["line"]
+        self.safe = (self.offset, self.lines)
+
+    def feed(self, line):   # one line, bytes with its '\n'
+        self.offset += len(line)
+        self.lines += 1
+        f = [x.strip() for x in line.decode("utf-8", "replace").rstrip("\r\n").split(",")]
+        pre = []
+        if len(f) >= 3 and PREFIX.match(f[0]) and f[1].isdigit():
+            pre = f[1:3]            # epoch, board; the date is the epoch again
+            f = f[3:]
+            if f and f[0].startswith("#") and len(f) > 1:   # a comment with commas in it
+                f = [", ".join(f)]
+        if not f or f == [""]:
+            return
+        if f[0].startswith("#"):
+            self.note("comment", f[0], pre)
+            return
+        num = [isNum(x) for x in f]
+        if not any(num):                         # header: names the next layout this wide
+            names = [re.sub(r"\W", "_", x) or "c%d" % i for i, x in enumerate(f)]
+            self.names[(bool(pre), len(f))] = names
+            self.note("header", ",".join(f), pre)
+            return
+        key = ("P_" if pre else "") + "".join("n" if k else "s" for k in num)
+        lay = self.layouts.get(key)
+        if lay is None:
+            names = self.names.get((bool(pre), len(f))) or ["c%d" % i for i in range(len(f))]
+            if pre:
+                names = ["epoch", "board"] + names
+            seen = {}
+            for i, nm in enumerate(names):         # 'epoch, degC' under the host's epoch: epoch_2
+                seen[nm] = seen.get(nm, 0) + 1
+                if seen[nm] > 1:
+                    names[i] = "%s_%d" % (nm, seen[nm])
+            lay = self.layouts[key] = layout(self.out, key, names, bool(pre))
+            self.saveState()
+        lay.add(pre + f, self.lines)
+        if len(lay.rows) >= self.chunkRows:
+            lay.write()
+            self.saveState()
+
+    def note(self, kind, text, pre):
+        if self.lines <= self.metaLast:
+            return
+        rec = {"line": self.lines, "kind": kind, "text": text,
+               "rows": {k: l.total + len(l.rows) for k, l in self.layouts.items()}}
+        if pre:
+            rec["epoch"] = int(pre[0]); rec["board"] = pre[1]
+        self.meta.write(json.dumps(rec) + "\n")
+
+    def poll(self):   # from a live loop: write what has waited flushSec
+        if time.monotonic() - self.tFlush >= self.flushSec:
+            self.flush()
+
+    def flush(self):  # every waiting row to disk; state.json then points past them
+        for lay in self.layouts.values():
+            lay.write()
+        self.meta.flush()
+        self.saveState()
+        self.tFlush = time.monotonic()
+
+    def saveState(self):
+        # the resume point only moves once no layout has rows waiting; lines
+        # read again after it are dropped by line number (layout.add, note)
+        if not any(l.rows for l in self.layouts.values()):
+            self.meta.flush()
+            self.safe = (self.offset, self.lines)
+        s = {"offset": self.safe[0], "lines": self.safe[1],
+             "layouts": {k: l.names for k, l in self.layouts.items()},
+             "names": [[p, w, n] for (p, w), n in self.names.items()]}
+        tmp = os.path.join(self.out, "state.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(s, f)
+        os.replace(tmp, os.path.join(self.out, "state.json"))
+
+    def close(self):
+        self.flush()
+        self.meta.close()
+
+def convert(src, out, follow=False, chunkRows=CHUNKROWS, flushSec=FLUSHSEC):
+    cv = csvColumnar(out, chunkRows, flushSec)
+    if src == "-":
+        inp = sys.stdin.buffer
+    else:
+        inp = open(src, "rb")
+        inp.seek(cv.offset)
+    try:
+        part = b""
+        while True:
+            ln = inp.readline()
+            if ln.endswith(b"\n"):
+                cv.feed(part + ln)
+                part = b""
+                if cv.lines % 4096 == 0:
+                    cv.poll()
+                continue
+            part += ln                          # nothing, or a line still being written
+            if not follow:
+                break
+            cv.poll()
+            time.sleep(0.2)
+        if part and not follow:
+            cv.feed(part)
+    finally:
+        cv.close()
+        if src != "-":
+            inp.close()
+    return cv
+
+# ---------------------------------------------
+class colStore:   # read side: column arrays for a row range, skipping chunks by their min/max
+
+    def __init__(self, out):
+        self.out = out
+
+    def layouts(self):
+        return sorted(d for d in os.listdir(self.out) if os.path.isdir(os.path.join(self.out, d)))
+
+    def chunks(self, key):
+        with open(os.path.join(self.out, key, "chunks.jsonl")) as f:
+            return [json.loads(ln) for ln in f]
+
+    def meta(self):
+        with open(os.path.join(self.out, "meta.jsonl")) as f:
+            return [json.loads(ln) for ln in f]
+
+    def scan(self, key, cols=None, where=None):
+        # where = {column: (lo, hi)}, inclusive; returns ({column: array}, chunks read, chunks skipped)
+        where = where or {}
+        got = {}; read = skipped = 0
+        for c in self.chunks(key):
+            cols = cols or c["names"]
+            if any(c["stats"][k][0] is None or c["stats"][k][1] < lo or c["stats"][k][0] > hi
+                   for k, (lo, hi) in where.items()):
+                skipped += 1
+                continue
+            read += 1
+            need = set(cols) | set(where)
+            a = {k: np.load(os.path.join(self.out, key, "%06d.%s.npy" % (c["chunk"], k)), mmap_mode="r")
+                 for k in need}
+            ok = np.ones(c["rows"], dtype=bool)
+            for k, (lo, hi) in where.items():
+                ok &= (a[k] >= lo) & (a[k] <= hi)
+            for k in cols:
+                got.setdefault(k, []).append(np.asarray(a[k][ok]))
+        return {k: np.concatenate(v) for k, v in got.items()}, read, skipped
+
+# ---------------------------------------------
+def synthLog(fname, n, t0=1619445791, append=False):   # Host_Log_Pico.py lines from two boards
+    from datetime import datetime
+    rng = np.random.default_rng(len(fname) + n)
+    with open(fname, "a" if append else "w") as f:
+        if not append:
+            f.write("%s, %d, ttyACM0, msec,t00,t10,t20,t11,diff,sum\n"
+                    % (datetime.fromtimestamp(t0).strftime("%Y-%m-%d_%H:%M:%S"), t0))
+            f.write("%s, %d, ttyACM0, # Start: 2021-04-26 14:03:11  Pendulum v2.1 28-APR-2021 J.Beale\n"
+                    % (datetime.fromtimestamp(t0).strftime("%Y-%m-%d_%H:%M:%S"), t0))
+            f.write("%s, %d, ttyACM1, epoch, degC\n" % (datetime.fromtimestamp(t0).strftime("%Y-%m-%d_%H:%M:%S"), t0))
+        sec = None
+        for i in range(n):
+            t = t0 + i // 2
+            if t != sec:
+                sec = t
+                d = datetime.fromtimestamp(t).strftime("%Y-%m-%d_%H:%M:%S")
+            if i % 2:
+                f.write("%s, %d, ttyACM1, %d, %.3f\n" % (d, t, t - 946684800, 20 + rng.normal()))
+            else:
+                q = rng.integers(20_000_000, 30_000_000, 4)
+                f.write("%s, %d, ttyACM0, %d,%d,%d,%d,%d, %d, %d\n"
+                        % (d, t, i * 500, q[0], q[1], q[2], q[3], q[1] - q[3], q.sum()))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--test":
+        import shutil
+        import tempfile
+        d = tempfile.mkdtemp()
+        src = os.path.join(d, "pLog.csv"); out = os.path.join(d, "cols")
+        n = 400_000
+        synthLog(src, n)
+        t = time.perf_counter()
+        cv = convert(src, out, chunkRows=16384)
+        dt = time.perf_counter() - t
+        print("%d lines, %.1f MB: %.1f s (%.0f lines/s)" % (cv.lines, os.path.getsize(src) / 1e6, dt, cv.lines / dt))
+        st = colStore(out)
+        print("layouts:", ", ".join("%s (%s)" % (k, ",".join(st.chunks(k)[0]["names"])) for k in st.layouts()))
+        # round trip: every column back, as the CSV has it
+        dual = [k for k in st.layouts() if st.chunks(k)[0]["names"][2] == "msec"][0]
+        temp = [k for k in st.layouts() if st.chunks(k)[0]["names"][2] == "epoch_2"][0]
+        a, _, _ = st.scan(dual)
+        b, _, _ = st.scan(temp)
+        ref = {"ttyACM0": [], "ttyACM1": []}
+        with open(src) as f:
+            for ln in f:
+                v = [x.strip() for x in ln.split(",")]
+                if v[3][:1].isdigit():
+                    ref[v[2]].append([int(v[1])] + [float(x) for x in v[3:]])
+        r0 = np.array(ref["ttyACM0"]); r1 = np.array(ref["ttyACM1"])
+        assert len(a["msec"]) == len(r0) == n // 2 and len(b["degC"]) == len(r1) == n // 2
+        assert np.array_equal(a["epoch"], r0[:, 0]) and np.array_equal(a["sum"], r0[:, 7])
+        assert np.array_equal(a["t10"], r0[:, 3]) and np.array_equal(b["degC"], r1[:, 2])
+        assert a["sum"].dtype == np.int64 and b["degC"].dtype == np.float64 and a["board"][0] == "ttyACM0"
+        m = st.meta()
+        assert [x["kind"] for x in m] == ["header", "comment", "header"] and m[1]["text"].startswith("# Start:")
+        print("round trip: %d + %d rows equal to the CSV; %d metadata lines" % (len(a["msec"]), len(b["degC"]), len(m)))
+        # an hour out of the middle: only the chunks that hold it are read
+        t0 = 1619445791 + 100_000
+        t = time.perf_counter()
+        h, read, skipped = st.scan(temp, ["epoch", "degC"], {"epoch": (t0, t0 + 3599)})
+        dt = time.perf_counter() - t
+        assert len(h["epoch"]) == 3600 and h["epoch"].min() == t0
+        print("one hour: %d rows from %d chunks, %d chunks skipped, %.1f ms" % (len(h["epoch"]), read, skipped, dt * 1e3))
+        assert read <= 2
+        # the logger appends; a rerun converts only the new lines
+        synthLog(src, 1000, t0=1619445791 + n // 2, append=True)
+        cv = convert(src, out, chunkRows=16384)
+        b, _, _ = st.scan(temp)
+        assert len(b["degC"]) == n // 2 + 500 and np.all(np.diff(b["epoch"]) == 1)
+        print("resume: %d more lines converted, no row twice" % (cv.lines - n - 3))
+        shutil.rmtree(d)
+    else:
+        follow = "--follow" in sys.argv
+        args = [a for a in sys.argv[1:] if a != "--follow"]
+        cv = convert(args[0], args[1], follow)
+        print("%d lines; layouts: %s" % (cv.lines, ", ".join(sorted(cv.layouts))))
@@ -0,0 +1,248 @@
+# Stream a PIO RX FIFO into a RAM ring with DMA, for the edge timers
+# MicroPython for Raspberry Pi Pico (RP2040), v1.21 or later (rp2.DMA)
+# Host side: simDMA stands in for rp2.DMA, fed by a PioSim state machine
+
+"""
+The counter() programs push 2 words per edge (bits, ticks).  Instead of a
+Python IRQ doing sm.get() for each word, two DMA channels take turns
+copying the RX FIFO into the two halves of one buffer, each chaining to
+the other when its half is full.  The only Python that runs per half is a
+tiny hard IRQ handler that points the finished channel back at the start
+of its half.  The main loop takes whole blocks with read().
+
+    cap = dmaCapture(4, words=2048)     # sm4 = PIO1 SM0
+    while True:
+        blk = cap.read()                # memoryview of new words, pairs only
+        for k in range(0, len(blk), 2):
+            bits = blk[k] & 0b11
+            ticks = blk[k+1] + 4
+
+read() hands out a finished half as soon as it is complete, and otherwise
+whatever pairs are already in the half being filled, so slow signals
+(pendulum: 4 edges/s) still come out promptly.  A block is only valid
+until DMA comes back around to it, half a buffer later; if the main loop
+is slower than that, read() skips ahead and counts the words in 'lost'.
+"""
+
+import array
+
+try:
+    import rp2
+    from uctypes import addressof
+except ImportError:          # CPython: only simDMA is available
+    rp2 = None
+    addressof = None
+
+PIO_BASE = (0x50200000, 0x50300000)
+RXF0 = 0x020                 # RX FIFO of SM0; +4 for each next SM
+DREQ_PIO_RX0 = (4, 12)       # DREQ number of SM0 RX, for PIO0 and PIO1
+CMASK = 0xFFFFF              # half-buffer counters wrap here (small ints in the IRQ)
+
+# -----------------------------------------
+class dmaCapture:
+
+    def __init__(self, smId, words=2048, dma=None):
+        if dma is None:
+            dma = rp2.DMA
+        self.addressof = getattr(dma, "addressof", None) or addressof
+        self.half = words // 2 & ~1          # words per half, whole pairs
+        self.buf = array.array("I", [0]*(2*self.half))
+        self.mv = memoryview(self.buf)
+        base = self.addressof(self.buf)
+        self.start = (base, base + 4*self.half)   # address of each half
+        self.done = 0            # halves completed by DMA (IRQ handler only)
+        self.hi = 0              # half being read (consumer only)
+        self.off = 0             # words of it already returned
+        self.lost = 0            # words overwritten before they were read
+        blk = smId // 4
+        rxf = PIO_BASE[blk] + RXF0 + 4*(smId % 4)
+        treq = DREQ_PIO_RX0[blk] + smId % 4
+        self.ch = (dma(), dma())
+        for k in (1, 0):         # B first, so it is ready when A chains to it
+            ch = self.ch[k]
+            ctrl = ch.pack_ctrl(size=2, inc_read=False, inc_write=True, treq_sel=treq,
+                                chain_to=self.ch[1-k].channel, irq_quiet=False)
+            ch.config(read=rxf, write=self.start[k], count=self.half, ctrl=ctrl,
+                      trigger=(k == 0))
+            ch.irq(self._irq, hard=True)
+
+    def _irq(self, ch):        # a half is full: rewind that channel, for its next turn
+        k = 0 if ch is self.ch[0] else 1
+        ch.write = self.start[k]
+        self.done = (self.done + 1) & CMASK
+
+    def fill(self):   # words DMA has put in the half now being written
+        d = self.done
+        ch = self.ch[d & 1]
+        n = (ch.write - self.start[d & 1]) >> 2
+        if n < 0 or n > self.half:   # channel was rewound just now
+            return 0
+        return n
+
+    def read(self, partial=True):
+        # new words since the last read, as a memoryview of whole pairs;
+        # empty if there is nothing new.  partial=False: only finished halves.
+        ahead = (self.done - self.hi) & CMASK
+        if ahead >= 2:           # DMA has come round onto data we had not read
+            self.lost += (ahead - 1) * self.half - self.off
+            self.hi = (self.done - 1) & CMASK
+            self.off = 0
+            ahead = 1
+        h = self.hi & 1
+        if ahead == 1:           # half is complete: the rest of it
+            a = self.off
+            self.hi = (self.hi + 1) & CMASK
+            self.off = 0
+            return self.mv[h*self.half + a:(h+1)*self.half]
+        if not partial:
+            return self.mv[0:0]
+        n = self.fill() & ~1     # half still filling: the pairs in so far
+        a = self.off
+        if n <= a:
+            return self.mv[0:0]
+        self.off = n
+        return self.mv[h*self.half + a:h*self.half + n]
+
+    def close(self):
+        for ch in self.ch:
+            ch.active(0)
+            ch.close()
+
+# -----------------------------------------
+class simDMA:   # enough of rp2.DMA for dmaCapture, on PioSim RX FIFOs
+    channels = []
+    ram = {}                     # fake address -> array, from addressof()
+    nextAddr = 0x20000000
+
+    @classmethod
+    def addressof(cls, buf):
+        for a, b in cls.ram.items():
+            if b is buf:
+                return a
+        a = cls.nextAddr
+        cls.ram[a] = buf
+        cls.nextAddr += (4*len(buf) + 0xFFF) & ~0xFFF
+        return a
+
+    @classmethod
+    def reset(cls):
+        cls.channels = []
+        cls.ram = {}
+        cls.nextAddr = 0x20000000
+
+    def __init__(self):
+        self.channel = len(simDMA.channels)
+        simDMA.channels.append(self)
+        self.read = 0
+        self.write = 0
+        self.count = 0
+        self.reload = 0
+        self.ctrl = {}
+        self.busy = False
+        self.handler = None
+        self.transfers = 0       # words moved, for statistics
+
+    def pack_ctrl(self, **kw):
+        return dict(kw)
+
+    def config(self, read=None, write=None, count=None, ctrl=None, trigger=False):
+        if read is not None:
+            self.read = read
+        if write is not None:
+            self.write = write
+        if count is not None:
+            self.count = self.reload = count
+        if ctrl is not None:
+            self.ctrl = ctrl
+            treq = ctrl.get("treq_sel", 0x3F)
+            import PioSim
+            for blk in (0, 1):
+                if DREQ_PIO_RX0[blk] <= treq < DREQ_PIO_RX0[blk] + 4:
+                    sm = PioSim.sim._smById(4*blk + treq - DREQ_PIO_RX0[blk])
+                    sm.rxDreq = simDMA.dreq
+        if trigger:
+            self.active(1)
+
+    def active(self, value=None):
+        if value is None:
+            return self.busy
+        if value and not self.busy:
+            self.busy = True
+            self.count = self.reload
+        elif not value:
+            self.busy = False
+
+    def irq(self, handler=None, hard=False):
+        self.handler = handler
+
+    def close(self):
+        self.busy = False
+
+    @staticmethod
+    def dreq(sm):    # the SM pushed: busy channels reading its FIFO take the words now
+        rxf = PIO_BASE[sm.id // 4] + RXF0 + 4*(sm.id % 4)
+        while sm.rx:
+            for ch in simDMA.channels:
+                if ch.busy and ch.read == rxf:
+                    break
+            else:
+                return
+            base = max(a for a in simDMA.ram if a <= ch.write)
+            simDMA.ram[base][(ch.write - base) >> 2] = sm.rx.pop(0)
+            ch.write += 4
+            ch.count -= 1
+            ch.transfers += 1
+            if ch.count == 0:
+                ch.busy = False
+                nxt = ch.ctrl.get("chain_to", ch.channel)
+                if nxt != ch.channel:
+                    simDMA.channels[nxt].active(1)
+                if (ch.handler is not None) and not ch.ctrl.get("irq_quiet", True):
+                    ch.handler(ch)
+
+# -----------------------------------------
+if __name__ == "__main__":   # IRQ-per-edge vs DMA capture, on QuadEnc-Full.py's counter()
+    import PioSim
+    MFREQ = 200_000_000
+    rate = 400_000               # edges per second, in a 20 ms burst
+    nEdges = 8000
+    latency = 10e-6              # Python IRQ latency on the Pico, roughly
+
+    def run(useDMA):
+        progs = PioSim.loadPio("QuadEnc-Full.py")
+        sim = PioSim.sim
+        sim.reset(MFREQ)
+        sim.irqLatency = sim.cycles(latency)
+        simDMA.reset()
+        steps = [(0.001 + j / rate, 1) for j in range(nEdges)]
+        a, b = PioSim.quadrature(steps)
+        sim.drive(14, a)
+        sim.drive(15, b)
+        sm2 = PioSim.StateMachine(2, progs["trigger"], freq=MFREQ, in_base=14, set_base=16)
+        sm2.active(1)
+        sm3 = PioSim.StateMachine(3, progs["trigger"], freq=MFREQ, in_base=15, set_base=16)
+        sm3.active(1)
+        sm4 = PioSim.StateMachine(4, progs["counter"], freq=MFREQ, in_base=14, jmp_pin=16, sideset_base=22)
+        ticks = []
+        if useDMA:
+            cap = dmaCapture(4, words=8192, dma=simDMA)  # 5 ms per half
+        else:
+            def counter_handler(sm):
+                sm.get()
+                ticks.append(sm.get() + 4)
+            sm4.irq(counter_handler)
+        sm4.active(1)
+        for _ in range(30):
+            sim.run(0.001)
+            if useDMA:           # main loop: one block per millisecond
+                blk = cap.read()
+                for k in range(1, len(blk), 2):
+                    ticks.append(blk[k] + 4)
+        return ticks, (cap.lost if useDMA else sm4.rxDropped)
+
+    expect = MFREQ / 2 / rate
+    for useDMA in (False, True):
+        t, lost = run(useDMA)
+        good = sum(1 for x in t[1:] if abs(x - expect) <= 2)
+        print("%-13s %5d of %d edges read, %5d with the right interval (%d ticks), %d words lost"
+              % ("DMA capture:" if useDMA else "IRQ per edge:", len(t), nEdges - 1, good, expect, lost))
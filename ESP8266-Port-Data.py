@@ -1,6 +1,7 @@
 # Socket data transfer Tx/Rx, J.Beale March 16 2021
 # ESP8266 device is client, and expects remote server to be listening already.
-# for example running 'nc -l <port>' on remote host
+# for example running 'nc -l <port>' on remote host,
+# or 'python3 Collector.py <port>' (one log per device, packet gaps noted)
 
 # https://stackoverflow.com/questions/21233340/sending-string-via-socket-python
 
@@ -9,14 +10,15 @@ import socket, errno  # NTP via wifi
 import time    # RTC time/date stamp
 import utime   # msec() and usec()
 import uerrno  # list of symbolic OSError codes
-import ntptime # get current time of day
+from NtpSync import ntpSync   # get current time of day, and keep it
 
 server = '192.168.1.105'  # remote server to send data (rp49.local)
 port = 8889
 
-ntptime.settime()
-print("UTC time：%s" % str(time.localtime())) # UTC time after sync
-print("UTC epoch： ", time.time() )
+ntp = ntpSync('pool.ntp.org')
+ntp.sync()
+print("UTC time：%s" % str(time.localtime(ntp.time()))) # UTC time after sync
+print("UTC epoch： ", ntp.time() )
 
 s = socket.socket()
 try:
@@ -31,7 +33,7 @@ pktNumber = 0
 while True:
     try:
       pktNumber += 1
-      ts = str(time.localtime())
+      ts = str(time.localtime(ntp.time()))
       print("%s Packet %d" % (ts,pktNumber))
       s.send((ts+'\n').encode())
       for i in range(10):  # just send out a bunch of time data, as strings
@@ -45,6 +47,7 @@ while True:
       machine.soft_reset()  # stop. Micropython has no exit() as there is no OS
        
     # print("Reply: ",s.recv(1024).decode())  # get reply data from host
+    ntp.poll()     # sync again when it is time
     time.sleep(2)
     
 s.close()
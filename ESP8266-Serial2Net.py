@@ -1,6 +1,7 @@
 # ESP8266 Receives data on UART, and sends out via Wifi (network socket)
-# as client. This presumes a remote server is listening already on the socket.
-#  (eg. 'nc -l <port>' on remote host)
+# as client. Each packet is kept in a spool on flash until the server
+# acknowledges it (Spool.py), over one connection that is reopened as needed.
+#  (a plain 'nc -l <port>' on remote host never acknowledges: set ACKS = False)
 # See: stackoverflow.com/questions/21233340/sending-string-via-socket-python
 
 # save this file as 'main.py' on ESP8266 FLASH device, eg. with Thonny
@@ -8,59 +9,35 @@
 #  J.Beale March 18 2021
 
 import machine        # hardware pins
-import socket, errno  # NTP via wifi
 import time      # RTC time/date stamp
 import utime     # msec() and usec()
-import uerrno    # list of symbolic OSError codes
 #import ntptime   # stock version fixed to 'pool.ntp.org'
 import uos       # disable REPL on uart
 import network   # check on network status
+from Spool import spool, forwarder   # store-and-forward packet queue
+from LineArena import lineArena, HALT, EXIT, FULL   # UART lines in one fixed buffer
+from UartPoll import uartPoll, rxbufFor   # read while bytes wait, sleep longer while none do
+from NtpSync import ntpSync   # NTP now and then, drift fitted and slewed out
 
 # ----------------------------------------------------------------------
 server = '192.168.1.105'    # LAN server to send data (rp49.local)
 port = 8889                 # network port to communicate through
 NTP_host = '192.168.1.212'  # local NTP server with fixed IP address
+DEVICE = 'esp1'             # name sent to the server on connecting
+SPOOL = 'spool'             # flash directory for packets not yet acknowledged
+SPOOL_BYTES = 65536         # oldest packets are dropped past this
+ACKS = True                 # server answers '# ACK n'; False for 'nc -l'
+PUMP_MS = 2000              # time to spend sending after each packet
+ARENA_BYTES = 8192          # UART lines held; a longer packet goes to the spool in parts
+BAUD = 115200               # UART from the Pico
+UART_STALL_MS = 100         # longest away from the UART mid-packet (arena part to flash): sizes rxbuf
 
 VERSION = 'Serial-Wifi Transfer v0.2 JPB 2021-03-18'
 
 led = machine.Pin(2, machine.Pin.OUT)  # onboard LED
 # ----------------------------------------------------------------------
 
-# Modified version of ntptime.py to use local NTP server
-# https://github.com/micropython/micropython-infineon/blob/master/esp8266/scripts/ntptime.py
-try:
-    import ustruct as struct
-except:
-    import struct
-
-# (date(2000, 1, 1) - date(1900, 1, 1)).days * 24*60*60
-NTP_DELTA = 3155673600
-
-def NTP_time(nhost):
-    NTP_QUERY = bytearray(48)
-    NTP_QUERY[0] = 0x1b
-    #addr = socket.getaddrinfo(NTP_host, 123)[0][-1]    
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    s.settimeout(1)
-    #res = s.sendto(NTP_QUERY, addr)
-    res = s.sendto(NTP_QUERY, (nhost, 123))
-    msg = s.recv(48)
-    s.close()
-    val = struct.unpack("!I", msg[40:44])[0]
-    return val - NTP_DELTA
-
-# --------------------------------------------------------
-
-# There's currently no timezone support in MicroPython, so
-# utime.localtime() will return UTC time (as if it was .gmtime())
-def NTP_settime(nhost):
-    t = NTP_time(nhost)
-    import machine
-    import utime
-    tm = utime.localtime(t)
-    tm = tm[0:3] + (0,) + tm[3:6] + (0,)
-    machine.RTC().datetime(tm)
-    #print(utime.localtime())
+ntp = ntpSync(NTP_host)     # time.time() from the ms ticks, kept on the NTP server's time
 # -------------------------------------------------------
 def vBlink(t):      # variable-length blink of duration t seconds
      led.value(0)   # 0 means LED on
@@ -96,27 +73,11 @@ def startNet():                  # make sure we're online, check IP address
        shortBlink()   
 
 def getTS():  # get a timestamp with current date & time
-  t=time.localtime() #  wlan = network.WLAN(network.STA_IF)
+  t=time.localtime(ntp.time()) #  wlan = network.WLAN(network.STA_IF)
   ts = '# START {:02d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}'.format(
     t[0], t[1], t[2], t[3], t[4], t[5])
   return(ts)
 
-def openNet():  # open network port
- s = socket.socket()
- try:
-    s.connect((server,port))
-    return(s)
- except OSError as err:         # errno.ECONNRESET:    
-    uos.dupterm(machine.UART(0, 115200), 1) # restore REPL
-    utime.sleep(5) # allow time to remove signal on ESP UART Rx pin
-    if err.args[0] == uerrno.ECONNRESET:
-        longBlink()
-        #print("Unable to connect to %s" % server)
-    longBlink()
-    #print("UART-Network test stopped.")
-    utime.sleep(30)
-    machine.reset()  # hard reset
-
 # -----------------------------------------------------------
 def main():
 
@@ -124,63 +85,68 @@ def main():
  #print("%s" % ts)
  #print("ESP8266-UART Receive to Network Socket starting")
 
- NTP_settime(NTP_host)   # custom version, using my local NTP server 
- 
- shortBlink()       # show NTP call returned
+ if ntp.sync():     # my local NTP server; again at 64 .. 1024 s, between packets
+     shortBlink()   # show NTP call returned
+ else:
+     longBlink()    # no answer: RTC time until one comes
  ts = getTS()       # Date/Time string at program start
  #print("Current time: %s" % ts)
  #print("Y2K epoch： ", time.time() )
  
 # -----------------------------------------------------
- try:
-     stm = openNet()  # open network stream & send data 
-     stm.send(("# %s\n" % VERSION).encode())
-     stm.send(("%s  Y2K epoch: %d\n" % (ts,time.time())).encode())     
-     utime.sleep_ms(50) 
-     shortBlink()       # show Network call returned    
-     stm.close()
- except Exception:
-     longBlink()
-     utime.sleep(30)       # wait for awhile in case server comes back online
-     stm.close()
-     machine.reset()  # start over with hard reset
+ sp = spool(SPOOL, SPOOL_BYTES)   # packets left from before a reset go out first
+ fwd = forwarder(sp, server, port, DEVICE, VERSION, acks=ACKS)
+ sp.put(("# %s\n%s  Y2K epoch: %d\n" % (VERSION,ts,ntp.time())).encode())
+ if fwd.pump(PUMP_MS) == 0:
+     shortBlink()       # show Network call returned
+ else:
+     longBlink()        # server away: packets wait in the spool
 # ----------------------------------------------------- 
  
  # stm.close(); return   # ============  DEBUG  ============================
     
  time.sleep(2)
  uos.dupterm(None, 1) # disable REPL on UART(0), allowing ext. input
- uart = machine.UART(0, rxbuf=64)                 
- uart.init(115200, timeout=100) # timeout in msec
+ rxbuf = rxbufFor(BAUD, UART_STALL_MS)   # 2048 at 115200: 64 fills in 5.5 ms
+ uart = machine.UART(0, rxbuf=rxbuf)
+ uart.init(BAUD, timeout=100) # timeout in msec
+ poll = uartPoll(uart, BAUD, rxbuf)
+ overflows = 0
+
+ shortBlink()       # show UART ready
 
- pktNumber = 0
- shortBlink()       # show Network call returned    
+ arena = lineArena(ARENA_BYTES)   # lines as they come, no str per line
+ rx = bytearray(256)              # UART reads land here
+ mvRx = memoryview(rx)
+ p = n = 0                        # rx[p:n] not taken in yet (may follow a '**HALT')
+ head = None                      # START line of the packet, as bytes
 
  while True:    # overall main loop, alternating UART Rx & Net Tx
      
-    recLines = []  # list to hold input lines from UART
     try:
-      loopCnt = 0
+      lineCnt = 0
       while True:      # ======= loop to check for UART input =====
-        if uart.any():        
-          hostMsg = uart.readline(120)          
-          if hostMsg is not None:
-            rawMsg = hostMsg.decode().rstrip()
-            if (loopCnt == 0):
-              ts = getTS()     # get current timestamp on 1st line
-            loopCnt += 1        
-            strMsg = str(time.time()) + "," + rawMsg
-            if rawMsg[0:6] == "**HALT":
-                break  # end of serial input packet
-            if rawMsg[0:6] == "**EXIT":  # only used when debugging, with USB connected
-                uos.dupterm(machine.UART(0, 115200), 1) # restore local REPL
-                utime.sleep_ms(500)
-                return                
-            else:                        
-                recLines.append(strMsg)
-        utime.sleep_ms(15)        
-        if (loopCnt > 20000):  # <== TIMEOUT sets max duration UART packet (20k = 5 minutes)
-          stm.close()  # close the port and quit.
+        if p == n:
+          n = poll.read(rx)     # what is waiting; if nothing, a sleep of 1, 2, 4 .. 50 ms
+          p = 0
+        while p < n:
+          if head is None:
+            head = (getTS() + "\n").encode()   # get current timestamp on 1st line
+          p = arena.feed(mvRx, p, n, ntp.time())
+          if arena.event == FULL:          # arena full: this part to the spool, go on
+            lineCnt += arena.lines
+            sp.put(arena.chunks(head))
+            arena.clear()
+          elif arena.event:
+            break
+        if arena.event == HALT:
+          break  # end of serial input packet
+        if arena.event == EXIT:  # only used when debugging, with USB connected
+          uos.dupterm(machine.UART(0, 115200), 1) # restore local REPL
+          utime.sleep_ms(500)
+          return
+        if (lineCnt + arena.lines > 20000):  # <== TIMEOUT sets max duration UART packet (20k = 5 minutes)
+          fwd.close()  # close the port and quit.
           longBlink()
           longBlink()
           utime.sleep(60)  # don't reboot too quickly
@@ -188,9 +154,10 @@ def main():
           break
                 
     except Exception as ex:  # (in practice, haven't seen UART exceptions)
-        stm.close()
+        fwd.close()
         uos.dupterm(machine.UART(0, 115200), 1) # restore local REPL
         longBlink()
+        p = n = 0
         utime.sleep(5) # allow time to remove signal on ESP UART Rx pin
         #machine.soft_reset()  # stop
 
@@ -198,29 +165,19 @@ def main():
 #   Done with UART, either error, timeout, or end of packet signal
 
     vBlink(0.1)
-    if (len(recLines) > 0):   # if there was any UART data received
-     try:
-      pktNumber += 1      
+    if arena.lines:           # if there was any UART data received
+      sp.put(arena.chunks(head))   # written to flash straight from the arena; spool adds '# END_PACKET n'
+    arena.clear()
+    head = None
+    if poll.overflows != overflows:   # rxbuf was found full: bytes lost, say so in the log
+      overflows = poll.overflows
+      sp.put((poll.report() + "\n").encode())
+    if ntp.poll():            # UART quiet: sync the clock if it is time, and log how far off it was
+      sp.put((ntp.report() + "\n").encode())
 # ----------------------------------------------------- 
-      stm = openNet()  # open network stream & send data      
-      vBlink(0.1)      # short delay may be needed here?
-      stm.send((ts+'\n').encode())
-      for outs in recLines:   # transmit each stored line
-        outs1 = outs + '\n'  
-        stm.send(outs1.encode())
-      stm.send(("# END_PACKET %d\n" % pktNumber).encode())
-      stm.close()
-# -----------------------------------------------------       
-              
-     except Exception as err:         # errno.ECONNRESET:
-      stm.close()
-      uos.dupterm(machine.UART(0, 115200), 1)
-      #utime.sleep(5) # allow time to remove signal on ESP UART Rx pin
-      
-      if err.args[0] == uerrno.ECONNRESET:
-        #print("Connection to %s reset by remote host." % server)
-        longBlink()
-      machine.soft_reset()  # stop. Micropython has no exit() as there is no OS
+    if sp.waiting():          # send, resend after a lost connection, or wait for the server
+      if fwd.pump(PUMP_MS):
+        longBlink()           # still waiting: try again after the next packet
            
 # ----- end of main ---------------------------------------------------
 
@@ -228,18 +185,24 @@ startNet()  # check we're online; wait if we aren't
 main()
 
 """
-One-line server on host using netcat:
+Server on host: Collector.py sends the ACKs, and keeps one log per device
+
+  python3 Collector.py 8889 logs
+
+or the one-line server using netcat (with ACKS = False):
 
   while true; do nc -l 8889; done
 
 
 Example output to network port:
  
-# Serial-Wifi Transfer v0.1 JPB 2021-03-17
+# HELLO esp1 31772 Serial-Wifi Transfer v0.2 JPB 2021-03-18
+# Serial-Wifi Transfer v0.2 JPB 2021-03-18
 # START 2021-03-18 17:01:18  Y2K epoch: 669402078
+# END_PACKET 1
 # START 2021-03-18 17:01:21
 669402085,8, 0.015, 0.0163, 641877536, 3905201192, 2714268494, 2488562100
 669402086,9, 0.016, 0.0163, 2030968062, 968025008, 2613939105, 3481190652
 669402086,10, 0.016, 0.0162, 3177975081, 3659030163, 4095404096, 347380111
-# END_PACKET 1 
+# END_PACKET 2
 """
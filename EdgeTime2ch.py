@@ -19,6 +19,8 @@ https://datasheets.raspberrypi.org/pico/pico-datasheet.pdf
 import rp2                 # rp2.PIO, rp2.asm_pio
 import machine as m        # m.freq, m.Pin
 import utime               # utime.sleep, utime.ticks
+from QuadDecode import LU  # quadrature lookup, 4 bit index of last & current value of A,B
+from OutStage import outStage, TIMED  # batched, decimated CSV lines
 
 #MFREQ = 250000000  # CPU frequency in Hz (typ. 125 MHz; Overclock to 250 MHz)
 MFREQ = 125000000  # CPU frequency in Hz (typ. 125 MHz; Overclock to 250 MHz)
@@ -165,10 +167,6 @@ def main():
     led2.off()
     led3.off()
     
-    # quadrature encoder pin-state lookup, 4 bit index of last & current value of A,B inputs
-    #          0  1  2  3  4  5  6  7  8  9  10  11  12  13  14  15
-    luTable = [0,-1,+1, 0,+1, 0, 0,-1,-1, 0, 0,  +1,  0, +1, -1,  0]    
-
     
     vBlink(led1,150,3)     # program-starting signal from onboard LED
     print("Encoder Timer v0.02 23-March-2021 J.Beale")
@@ -216,7 +214,7 @@ def main():
     pinData=0
     errorCount =0  # how many encoder errors detected
 
-    tLast = utime.ticks_us()    # time since printing encoder position
+    st = outStage(TIMED, ms=2500)   # encPos,errorCount lines, batched
     maxTimerCount = 1<<32  # 32 bit counter rolls over here  2^32 = 4,294,967,296
 
     #(oldTicks,oldPins) = pulsein.read_blocking(1)[0]  # first call sets previous values
@@ -257,15 +255,14 @@ def main():
             #outs += '\n'         # end of line char concludes each line
         
             # uart.write(outs)
-            inc = luTable[inState]
+            inc = LU[inState]
             encPos += inc
             if (inc == 0):
-                print("Encoder Error: state = %d" % inState)
                 errorCount += 1
+                if errorCount <= 10:   # after that, only the count in each output line
+                    st.text("Encoder Error: state = %d" % inState)
             # print("%d,%d" % (inc,inState))
             #if abs(encPos - lastPos) > 20:
-            tNow = utime.ticks_us()
-            tDelta = (tNow - tLast) % (1<<30)
             #b2 = (encPos >> 2) % 2
             #b3 = (encPos >> 3) % 2
             b4 = (encPos >> 4) % 2
@@ -279,14 +276,10 @@ def main():
             else:
                 led2.off()
                 
-            if (tDelta > 2500000):         
-              #tNow = utime.ticks_us()
-              #tDelta = (tNow - tLast) % (1<<30)
-              #print("%d,%d" % (tDelta,encPos))
-              print("%d,%d" % (encPos,errorCount))
-              lastPos = encPos
-              tLast = tNow
+            st.put(encPos, encPos, errorCount)  # a line every 2.5 seconds
             pcount += 1
+        else:
+            st.poll()
             
         # utime.sleep_ms(5)    
          
@@ -0,0 +1,333 @@
+# Python3 host code: analyze quadrature encoder capture files with NumPy
+# reads the file in chunks through mmap, so memory use stays bounded
+# no matter how many rows (10^8 rows is a ~2 GB file)
+
+# understands two capture formats:
+#  'n,msec,pos'  one line per edge, from QuadEncSimple.py (QuadEncData-Mar26.csv)
+#  'tDelta,b1,b2,b3,b4,tickSum'  one line per 4 edges: (A,B) bits after each
+#       edge and the summed PIO tick count, from QuadHoru1.py (QuadHoru1-data1.csv)
+
+# python3 EncAnalyze.py QuadEncData-Mar26.csv
+# python3 EncAnalyze.py --bench 100000000     (writes a synthetic capture, times analysis)
+# python3 EncAnalyze.py --test                (a capture with broken lines reads as the clean one)
+
+import io
+import mmap
+import os
+import sys
+import time
+import numpy as np
+
+# quadrature encoder pin-state lookup, 4 bit index of last & current value of A,B inputs
+#                   0  1  2  3  4  5  6  7  8  9  10  11  12  13  14  15
+LU = np.array(     [0,-1,+1, 0,+1, 0, 0,-1,-1, 0, 0,  +1,  0, +1, -1,  0], dtype=np.int8)
+
+CHUNK = 1 << 25         # bytes of CSV text parsed at a time (32 MB)
+W = 16                  # edges in the velocity window (msec resolution needs a few)
+countRate = 100e6       # PIO counts/sec in QuadHoru1.py: 200 MHz, 2 cycles per count
+RBINS = np.linspace(0.0, 2.0, 201)   # bins for interval / local-mean-interval
+
+# ---------------------------------------------
+def dataLines(text, ncol):
+    # only the lines of text that are ncol numbers: header, '#' lines, stray text and truncated
+    # lines (a short line would shift every later row of the chunk) are dropped, without a loop per line
+    if not text:
+        return text
+    b = np.frombuffer(text, dtype=np.uint8)
+    ends = np.flatnonzero(b == 10) + 1               # each line with its newline
+    if not len(ends) or ends[-1] != len(b):
+        ends = np.append(ends, len(b))               # the last line has none
+    ends = np.concatenate(([0], ends))
+    good = np.diff(np.searchsorted(np.flatnonzero(b == 44), ends)) == ncol - 1   # commas per line
+    bad = (b > 57) | (b == 47)                       # a data line is only '0-9 , - . ' and space
+    bad |= (b < 44) & (b != 10) & (b != 32)
+    bad = np.flatnonzero(bad)
+    if len(bad):
+        good &= np.diff(np.searchsorted(bad, ends)) == 0
+    if good.all():
+        return text
+    return b[np.repeat(good, np.diff(ends))].tobytes()
+
+def chunks(fname, chunk=CHUNK):
+    # yield 2D arrays of numbers, one row per CSV line, skipping header, # lines and broken lines
+    with open(fname, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return                       # nothing to map
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pos = 0
+            n = len(mm)
+            ncol = None
+            while pos < n:
+                end = min(pos + chunk, n)
+                if end < n:
+                    end = mm.rfind(b"\n", pos, end) + 1
+                    if end <= pos:   # one line longer than a chunk
+                        end = mm.find(b"\n", pos + chunk) + 1 or n
+                text = mm[pos:end].replace(b"\r", b"")
+                pos = end
+                if ncol is None:     # from the first line that starts with a number
+                    first = next((ln for ln in text.split(b"\n") if ln[:1] and ln[:1] in b"-0123456789"), None)
+                    if first is None:
+                        continue
+                    ncol = first.count(b",") + 1
+                text = dataLines(text, ncol)
+                if not text.strip():
+                    continue
+                try:
+                    a = np.loadtxt(io.BytesIO(text), delimiter=",", ndmin=2)
+                except ValueError:   # numbers that do not read (eg. '1,,2'): line by line
+                    a = [r for r in (ln.split(b",") for ln in text.split(b"\n")) if len(r) == ncol]
+                    a = np.array([[float(v) for v in r] for r in a if all(isNum(v) for v in r)]).reshape(-1, ncol)
+                if len(a):
+                    yield a
+        finally:
+            mm.close()
+
+def isNum(s):
+    try:
+        float(s)
+        return True
+    except ValueError:
+        return False
+
+def histFrom(x, bins):
+    h, _ = np.histogram(x, bins=bins)
+    return h
+
+class runStats:  # count, mean, rms, min, max of a series, fed in pieces
+    def __init__(self):
+        self.n = 0; self.s = 0.0; self.s2 = 0.0
+        self.lo = np.inf; self.hi = -np.inf
+    def add(self, x):
+        if len(x) == 0:
+            return
+        self.n += len(x)
+        self.s += float(x.sum())
+        self.s2 += float(np.dot(x, x))
+        self.lo = min(self.lo, float(x.min()))
+        self.hi = max(self.hi, float(x.max()))
+    def summary(self):
+        if self.n == 0:
+            return "n=0"
+        m = self.s / self.n
+        sd = np.sqrt(max(self.s2 / self.n - m*m, 0.0))
+        return "n=%d mean=%.6g sd=%.6g min=%.6g max=%.6g" % (self.n, m, sd, self.lo, self.hi)
+
+# ---------------------------------------------
+class edgeAnalyzer:  # 'n,msec,pos' captures: one row per encoder edge
+
+    def __init__(self):
+        self.carry = None          # last W+1 rows of the previous chunk
+        self.lastDir = 0           # direction of last moving edge (+1/-1)
+        self.rows = 0
+        self.errors = 0            # edges where pos did not change by exactly 1
+        self.missed = 0            # edges skipped, from |dpos| > 1
+        self.gaps = 0              # lines missing, from jumps in n
+        self.reversals = 0
+        self.vel = runStats()      # edges/sec over W edges
+        self.acc = runStats()      # edges/sec^2
+        self.rHist = np.zeros((4, len(RBINS)-1), dtype=np.int64)  # per edge phase
+
+    def add(self, a):
+        new = len(a)
+        if self.carry is not None:
+            a = np.concatenate((self.carry, a))
+        k0 = len(a) - new            # rows already counted last time
+        self.rows += new
+        n = a[:, 0]; t = a[:, 1] * 1e-3; p = a[:, 2].astype(np.int64)
+
+        dp = np.diff(p)[max(0, k0-1):]
+        adp = np.abs(dp)
+        self.errors += int(np.count_nonzero(adp != 1))
+        self.missed += int((adp[adp > 1] - 1).sum())
+        self.gaps += int(np.count_nonzero(np.diff(n)[max(0, k0-1):] != 1))
+
+        s = np.sign(dp[dp != 0])     # direction reversals, across chunk edges too
+        if len(s):
+            if self.lastDir != 0:
+                s = np.concatenate(([self.lastDir], s))
+            self.reversals += int(np.count_nonzero(s[1:] != s[:-1]))
+            self.lastDir = int(s[-1])
+
+        if len(p) > W:               # velocity over W edges, acceleration from its slope
+            dtW = t[W:] - t[:-W]
+            ok = dtW > 0
+            v = np.where(ok, (p[W:] - p[:-W]) / np.where(ok, dtW, 1.0), np.nan)
+            tm = 0.5 * (t[W:] + t[:-W])              # window midpoints
+            j0 = max(0, k0 - W)
+            vv = v[j0:]
+            self.vel.add(vv[~np.isnan(vv)])
+            if len(v) > 1:
+                dtv = np.diff(tm)
+                acc = np.full(len(v) - 1, np.nan)
+                okA = (dtv > 0) & ~np.isnan(v[1:]) & ~np.isnan(v[:-1])
+                acc[okA] = np.diff(v)[okA] / dtv[okA]
+                acc = acc[max(0, j0-1):]
+                self.acc.add(acc[~np.isnan(acc)])
+
+        if len(t) > 4:               # jitter: each interval vs. mean of the last 4
+            dt = np.diff(t)
+            s4 = t[4:] - t[:-4]
+            ok = s4 > 0
+            r = np.where(ok, 4.0 * dt[3:] / np.where(ok, s4, 1.0), np.nan)
+            ph = (p[4:] & 3)
+            j0 = max(0, k0 - 4)
+            r = r[j0:]; ph = ph[j0:]
+            for k in range(4):
+                rk = r[(ph == k) & ~np.isnan(r)]
+                self.rHist[k] += histFrom(rk, RBINS)
+
+        self.carry = a[-(W+1):]
+
+    def report(self):
+        out = ["rows: %d" % self.rows,
+               "edge errors: %d (%.3g%%), missed edges: %d, line gaps: %d"
+               % (self.errors, 100.0 * self.errors / max(1, self.rows - 1), self.missed, self.gaps),
+               "direction reversals: %d" % self.reversals,
+               "velocity (edges/s, %d-edge window): %s" % (W, self.vel.summary()),
+               "acceleration (edges/s^2): %s" % self.acc.summary()]
+        c = 0.5 * (RBINS[1:] + RBINS[:-1])
+        for k in range(4):   # spread of interval ratio by edge phase
+            h = self.rHist[k]
+            if h.sum():
+                m = (h * c).sum() / h.sum()
+                sd = np.sqrt((h * (c - m)**2).sum() / h.sum())
+                out.append("edge phase %d: interval/mean %.4f, jitter sd %.4f (%d edges)"
+                           % (k, m, sd, h.sum()))
+        return "\n".join(out)
+
+# ---------------------------------------------
+class tickAnalyzer:  # 'tDelta,b1,b2,b3,b4,tickSum' captures: one row per 4 edges
+
+    def __init__(self):
+        self.lastBits = None
+        self.pos = 0
+        self.lastDir = 0
+        self.rows = 0
+        self.edges = 0
+        self.errors = 0            # illegal or no-change transitions
+        self.reversals = 0
+        self.vel = runStats()      # edges/sec
+        self.acc = runStats()
+        self.lastV = None
+        self.tickHist = []         # last 4 tick sums, for the jitter reference
+        self.rHist = np.zeros(len(RBINS)-1, dtype=np.int64)
+
+    def add(self, a):
+        self.rows += len(a)
+        bits = a[:, 1:5].astype(np.int64).ravel() & 3   # b1,b2,b3,b4 of each row, in order
+        ticks = a[:, 5]
+        prev = np.empty_like(bits)
+        prev[1:] = bits[:-1]
+        prev[0] = bits[0] if self.lastBits is None else self.lastBits
+        inc = LU[(prev << 2) | bits].astype(np.int64)
+        if self.lastBits is None:
+            inc[0] = 0; skip = 1
+        else:
+            skip = 0
+        self.lastBits = int(bits[-1])
+        self.edges += len(bits) - skip
+        self.errors += int(np.count_nonzero(inc[skip:] == 0))
+        s = np.sign(inc[inc != 0])
+        if len(s):
+            if self.lastDir != 0:
+                s = np.concatenate(([self.lastDir], s))
+            self.reversals += int(np.count_nonzero(s[1:] != s[:-1]))
+            self.lastDir = int(s[-1])
+        dpos = inc.reshape(-1, 4).sum(axis=1)
+        self.pos += int(dpos.sum())
+        dt = ticks / countRate
+        ok = dt > 0
+        v = dpos[ok] / dt[ok]
+        self.vel.add(v)
+        if len(v):
+            vv = v if self.lastV is None else np.concatenate(([self.lastV], v))
+            acc = np.diff(vv) / dt[ok][len(dt[ok]) - len(vv) + 1:]
+            self.acc.add(acc)
+            self.lastV = float(v[-1])
+        tk = np.concatenate((self.tickHist, ticks))     # jitter: sum vs mean of previous 4
+        if len(tk) > 4:
+            c = np.cumsum(np.concatenate(([0.0], tk)))
+            m4 = (c[4:-1] - c[:-5]) / 4.0
+            r = tk[4:] / np.where(m4 > 0, m4, np.nan)
+            self.rHist += histFrom(r[~np.isnan(r)], RBINS)
+        self.tickHist = list(tk[-4:])
+
+    def report(self):
+        c = 0.5 * (RBINS[1:] + RBINS[:-1])
+        h = self.rHist
+        out = ["rows: %d, edges: %d, final position: %d" % (self.rows, self.edges, self.pos),
+               "edge errors: %d (%.3g%%)" % (self.errors, 100.0 * self.errors / max(1, self.edges)),
+               "direction reversals: %d" % self.reversals,
+               "velocity (edges/s): %s" % self.vel.summary(),
+               "acceleration (edges/s^2): %s" % self.acc.summary()]
+        if h.sum():
+            m = (h * c).sum() / h.sum()
+            sd = np.sqrt((h * (c - m)**2).sum() / h.sum())
+            out.append("4-edge period / previous mean: %.4f, jitter sd %.4f" % (m, sd))
+        return "\n".join(out)
+
+# ---------------------------------------------
+def analyze(fname):   # return analyzer object with the results, after reading whole file
+    an = None
+    for a in chunks(fname):
+        if an is None:
+            an = edgeAnalyzer() if a.shape[1] == 3 else tickAnalyzer()
+        an.add(a)
+    return an
+
+def synthetic(fname, rows, seed=1, block=1_000_000):
+    # write an 'n,msec,pos' capture: encoder swinging back and forth, with a few errors
+    rng = np.random.default_rng(seed)
+    with open(fname, 'w') as f:
+        f.write("n,msec,pos\n# synthetic capture\n")
+        pos = 0; ms = 0.0; n = 0
+        while n < rows:
+            k = min(block, rows - n)
+            i = np.arange(n, n + k)
+            step = np.where(np.sin(i * 2e-4) >= 0, 1, -1)           # reverses every ~15k edges
+            step[rng.random(k) < 1e-4] *= 2                          # missed edges
+            p = pos + np.cumsum(step)
+            ms = ms + np.cumsum(rng.exponential(0.25, k))            # ~4 kHz edge rate
+            np.savetxt(f, np.column_stack((i, ms.astype(np.int64), p)), fmt="%d", delimiter=",")
+            pos = int(p[-1]); ms = float(ms[-1]); n += k
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--bench":
+        rows = int(float(sys.argv[2]))
+        fname = sys.argv[3] if len(sys.argv) > 3 else "/tmp/enc-synth.csv"
+        t0 = time.time()
+        synthetic(fname, rows)
+        t1 = time.time()
+        an = analyze(fname)
+        t2 = time.time()
+        print(an.report())
+        print("# %d rows: generate %.1f s, analyze %.1f s (%.2f M rows/s)"
+              % (rows, t1 - t0, t2 - t1, rows / (t2 - t1) / 1e6))
+    elif len(sys.argv) > 1 and sys.argv[1] == "--test":
+        import tempfile
+        d = tempfile.mkdtemp()
+        clean = os.path.join(d, "clean.csv"); broken = os.path.join(d, "broken.csv")
+        synthetic(clean, 20000)
+        with open(clean, "rb") as f:
+            lines = f.read().split(b"\n")
+        lines[1000:1000] = [b"500,50"]                   # cut off mid-line by a reset
+        lines[5000:5000] = [b"# a comment", b"MicroPython v1.15 on 2021-04-18; Raspberry Pi Pico"]
+        lines[9000] += b"\r"
+        lines[12000:12000] = [b"", b"17,3,4,5", b"1,,2"]
+        with open(broken, "wb") as f:
+            f.write(b"\n".join(lines))
+        for chunk in (CHUNK, 4096):                      # and with lines cut across chunks
+            a = np.concatenate(list(chunks(broken, chunk)))
+            assert np.array_equal(a, np.concatenate(list(chunks(clean, chunk)))) and len(a) == 20000
+        r = analyze(broken).report()
+        print(r)
+        assert r == analyze(clean).report() and "line gaps: 0" in r
+        print("broken lines dropped: same rows and report as the clean capture")
+        os.remove(clean); os.remove(broken); os.rmdir(d)
+    else:
+        for fname in sys.argv[1:]:
+            print("== %s" % fname)
+            an = analyze(fname)
+            print("no data" if an is None else an.report())
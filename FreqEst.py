@@ -0,0 +1,178 @@
+# Python3 host code: frequency from gapless PIO timestamps (RecipCounter1.py, GAPLESS = True)
+# one timestamp per EDGES rising edges, in counts of 2 CPU cycles, wrapping at 2^32
+
+# Three estimators, each over gates of m timestamp intervals:
+#   Pi      endpoints only: (edges in gate) / (t[m] - t[0]), as a gated counter gives
+#   Lambda  mean of the overlapping half-gate intervals t[i+m/2] - t[i]
+#   Omega   least-squares slope of t against edge number, over all m+1 stamps
+# For white timing noise, Pi error falls as 1/tau, Lambda and Omega as tau^-3/2.
+
+# python3 FreqEst.py capture.csv        (frequency at several gate times)
+# python3 FreqEst.py --sim              (PIO simulator: gapless timestamps vs. the gated counter)
+
+import sys
+import numpy as np
+
+WRAP = 1 << 32
+
+# ---------------------------------------------
+def unwrap(c):   # 32-bit counts -> monotonic int64 counts
+    c = np.asarray(c, dtype=np.int64)
+    d = np.diff(c) % WRAP
+    return np.concatenate(([0], np.cumsum(d))) + c[0]
+
+def readStamps(fname):
+    # 'n,msec,count' CSV with a '# gapless EDGES=.. MCAL=..' line; returns
+    # (timestamps in seconds from the first, edges per timestamp)
+    edges = 1; mcal = 250e6; rows = []
+    with open(fname) as f:
+        for line in f:
+            if line.startswith("#"):
+                for w in line.split():
+                    if w.startswith("EDGES="):
+                        edges = int(w[6:])
+                    elif w.startswith("MCAL="):
+                        mcal = float(w[5:])
+                continue
+            v = line.strip().split(",")
+            if len(v) == 3 and v[0].isdigit():
+                rows.append(int(v[2]))
+    if not rows:
+        return np.zeros(0), edges
+    c = unwrap(rows)
+    return (c - c[0]) * (2.0 / mcal), edges
+
+def blocks(t, m):   # gates of m intervals: rows of m+1 timestamps, each from its own start
+    nb = (len(t) - 1) // m
+    idx = np.arange(nb)[:, None] * m + np.arange(m + 1)[None, :]
+    b = t[idx]
+    return b - b[:, :1]
+
+def piEst(t, m, edges=1):
+    b = blocks(t, m)
+    return edges * m / b[:, -1]
+
+def lambdaEst(t, m, edges=1):
+    h = m // 2
+    b = blocks(t, 2 * h)
+    span = (b[:, h:] - b[:, :h + 1]).mean(axis=1)   # the h+1 overlapping half-gates
+    return edges * h / span
+
+def omegaEst(t, m, edges=1):
+    b = blocks(t, m)
+    j = np.arange(m + 1) - m / 2.0
+    slope = (b * j).sum(axis=1) / (j * j).sum()     # seconds per timestamp
+    return edges / slope
+
+ESTIMATORS = (("Pi", piEst), ("Lambda", lambdaEst), ("Omega", omegaEst))
+
+def report(t, edges, gates=None):   # mean and spread of each estimator at each gate time
+    T = t[-1] / (len(t) - 1)        # mean seconds per timestamp
+    if gates is None:
+        gates = [g for g in (0.01, 0.1, 1.0, 10.0, 100.0) if g / T >= 2 and g / T <= (len(t) - 1) / 4]
+    out = []
+    for g in gates:
+        m = max(2, int(round(g / T)) & ~1)
+        for name, est in ESTIMATORS:
+            f = est(t, m, edges)
+            out.append((g, name, len(f), f.mean(), f.std(ddof=1) / f.mean() if len(f) > 1 else np.nan))
+    return out
+
+# ---------------------------------------------
+def simGapless(fin, seconds, jitter, F=250_000_000, edges=1, seed=1):
+    # RecipCounter1.py's timestamp() in the PIO simulator, on a square wave with
+    # white timing jitter; returns (timestamps in seconds, true edge times)
+    import PioSim
+    rng = np.random.default_rng(seed)
+    progs = PioSim.loadPio("RecipCounter1.py")
+    sim = PioSim.sim
+    sim.reset(F)
+    n = int(seconds * fin)
+    tr = 1e-4 + np.arange(n) / fin + rng.normal(0.0, jitter, n)
+    wave = []
+    for a in tr:
+        wave += [(float(a), 1), (float(a + 0.5 / fin), 0)]
+    sim.drive(15, wave)
+    sm = PioSim.StateMachine(3, progs["timestamp"], freq=F, jmp_pin=PioSim.Pin(15))
+    sm.put(edges - 1)
+    sm.active(1)
+    got = []
+    while sim.seconds() < seconds:
+        sim.run(0.002)               # the Pico main loop reads the FIFO this often
+        while sm.rx_fifo():
+            got.append((-sm.get()) & (WRAP - 1))
+        if PioSim.mem32[0x50200008] & (1 << 3):
+            raise RuntimeError("timestamps lost: FIFO full")
+    c = unwrap(got)
+    return (c - c[0]) * (2.0 / F), tr
+
+def simGated(fin, seconds, jitter, F=250_000_000, latency=20e-6, seed=1):
+    # RecipCounter1.py's gate/clock_count/pulse_count and counter_handler, same input;
+    # returns (frequency estimates, fraction of the time inside a gate)
+    import PioSim
+    rng = np.random.default_rng(seed)
+    progs = PioSim.loadPio("RecipCounter1.py")
+    sim = PioSim.sim
+    sim.reset(F)
+    sim.irqLatency = sim.cycles(latency)
+    n = int(seconds * fin)
+    tr = 1e-4 + np.arange(n) / fin + rng.normal(0.0, jitter, n)
+    wave = []
+    for a in tr:
+        wave += [(float(a), 1), (float(a + 0.5 / fin), 0)]
+    sim.drive(15, wave)
+    gateVal = F // 10000
+    maxc = WRAP - 1
+    pin15, pin14, pin13 = PioSim.Pin(15), PioSim.Pin(14), PioSim.Pin(13)
+    sim.writePins(14, 1, 1)
+    sim.writePins(13, 1, 1)
+    sm0 = PioSim.StateMachine(0, progs["gate"], freq=F, in_base=pin15, sideset_base=pin14)
+    sm0.put(gateVal); sm0.exec("pull()")
+    sm1 = PioSim.StateMachine(1, progs["clock_count"], freq=F, in_base=pin14, jmp_pin=pin13)
+    sm1.put(maxc); sm1.exec("pull()")
+    sm2 = PioSim.StateMachine(2, progs["pulse_count"], freq=F, in_base=pin14, sideset_base=pin13, jmp_pin=pin14)
+    sm2.put(maxc - 1); sm2.exec("pull()")
+    res = []
+
+    def counter_handler(sm):
+        sm0.put(gateVal)
+        sm0.exec("pull()")
+        res.append((maxc - sm1.get(), maxc - sm2.get()))
+
+    sm0.irq(counter_handler)
+    sm1.active(1); sm2.active(1); sm0.active(1)
+    sim.run(seconds)
+    r = np.array(res, dtype=np.float64)
+    f = r[:, 1] * F / (2 * r[:, 0])
+    return f, 2 * r[:, 0].sum() / F / seconds
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--sim":
+        fin = 1234.5; secs = 4.0; jit = 20e-9
+        t, tr = simGapless(fin, secs, jit)
+        print("# gapless: %d timestamps in %.1f s of %.1f Hz, %.0f ns rms edge jitter" % (len(t), secs, fin, jit * 1e9))
+        # every timestamp is there: intervals are one input period, to the count
+        d = np.diff(t) * fin
+        assert np.all(np.abs(d - 1) < 1e-3), "missing or extra timestamps"
+        err = t - (tr[:len(t)] - tr[0])
+        print("# timestamp error vs. true edge times: rms %.1f ns" % (err.std() * 1e9))
+        byName = {}
+        for g, name, n, fm, sd in report(t, 1, gates=(0.02, 0.1, 0.5)):
+            print("gate %5.2f s  %-6s %4d estimates  mean %.6f Hz  rms %.3g" % (g, name, n, fm, sd))
+            byName[(g, name)] = sd
+            assert abs(fm - fin) / fin < 1e-6
+        for g in (0.02, 0.1, 0.5):
+            assert byName[(g, "Omega")] < byName[(g, "Pi")]
+            assert byName[(g, "Lambda")] < byName[(g, "Pi")]
+        f, cover = simGated(fin, secs, jit)
+        print("# gated counter (1 period per gate): %d estimates in %.1f s, rms %.3g, gate open %.0f%% of the time"
+              % (len(f), secs, f.std(ddof=1) / f.mean(), cover * 100))
+    else:
+        for fname in sys.argv[1:]:
+            t, edges = readStamps(fname)
+            if len(t) < 3:
+                print("== %s: %d timestamps, too few to estimate a frequency" % (fname, len(t)))
+                continue
+            print("== %s: %d timestamps, %d edges each, %.1f s" % (fname, len(t), edges, t[-1]))
+            for g, name, n, fm, sd in report(t, edges):
+                print("gate %6.2f s  %-6s %6d estimates  mean %.7f Hz  rms %.3g" % (g, name, n, fm, sd))
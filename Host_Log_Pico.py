@@ -3,49 +3,219 @@
 
 # print and log timestamped output from Pico via USB serial port
 # 2nd column in CSV file will be Unix Epoch time
-# appends new data to log file each run, 
+# 3rd column is the board (serial port name) the line came from, eg.
+#   2021-04-26_14:03:11, 1619445791, ttyACM0, <line from the Pico>
+# logs written before this column was added have the Pico's line from the
+# 3rd column on: readers that skip 3 columns (PendulumPipe.py) must tell them apart
+# appends new data to log file each run,
 # does not over-write existing data from previous runs
 
+# all boards found are read at once from a single selectors loop,
+# so a busy board can't starve the others.  Boards that reset and
+# re-enumerate are picked up again as soon as they reappear (PicoDevices.py)
+# lines are written out in batches, at most flushMs after they arrive (LogWriter.py)
+
+# python3 Host_Log_Pico.py            (log every Pico, as they come and go)
+# python3 Host_Log_Pico.py --test     (1..8 boards on pty pairs: no line lost or
+#                                      mixed up, and lines/s against board count)
+
 # 26-April-2021 J.Beale
 
 # ---------------------------------------------
+import os
+import selectors               # wait on all serial ports at once
 import serial
-import serial.tools.list_ports 
-from datetime import datetime  # for Y-M-D H:M:S time format
+from PicoDevices import picoWatcher
+from LogWriter import batchWriter
 import time                    # for seconds since epoch
 
 logFileName = "/home/pi/Documents/pico/pLog.csv"
-fRate = 5      # input lines before we flush the file to disk
-
-picoDev = [] # haven't found any serial port Pico devices yet
-
-while True:
-  for port in serial.tools.list_ports.comports():
-    if (port.vid == 0x2e8a) and (port.pid == 0x0005): # Pico Serial        
-        picoDev.append(port.name)
-
-  if len(picoDev) != 0:  # quit if there is at least one
-    break
-  time.sleep(1)  # wait and try again, until a pico is connected
-
-
-ser = []  # will contain serial device for each pico found
-for pd in picoDev:        
-    print("Found pico device: %s" % pd)
-    ser.append( serial.Serial(port='/dev/'+pd) )
-
-print("Writing output to %s" % logFileName)
-   
-with open(logFileName,'a') as f:
-  lCount = 0   # count of lines received on serial port
-  
-  while True:
-    tNow = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")  
-    absSec = time.time()
-    inLine = ser[0].readline().rstrip().decode('utf-8')
-    lCount += 1
-    f.write("%s, %d, %s\n" % (tNow,absSec,inLine)) 
-    if (lCount % fRate == 0):
-      f.flush()
-    print("%d, %s" % (absSec, inLine))    
-  
+flushBytes = 65536  # write to disk once this much is waiting...
+flushMs = 200       # ...or once the oldest line has waited this long
+splitLogs = False # True: one log per board (pLog-ttyACM0.csv, ...)  False: one merged log
+
+# ---------------------------------------------
+class picoReader:  # one Pico serial port, read without blocking and split into lines
+
+    def __init__(self, name, dev=None):
+        self.name = name                  # board ID written to the log
+        self.nameB = name.encode()
+        if dev is None:
+            dev = '/dev/' + name          # dev can also be a pty, for testing
+        self.ser = serial.Serial(port=dev, timeout=0)  # timeout=0: never block
+        self.fd = self.ser.fileno()
+        self.part = b""                   # incomplete line from last read
+        self.lines = 0                    # count of lines received
+
+    def readLines(self):  # return list of complete lines now waiting on the port
+        data = os.read(self.fd, 65536)
+        if not data:                      # readable but empty: port has gone away
+            raise OSError("%s disconnected" % self.name)
+        lines = (self.part + data).split(b"\n")
+        self.part = lines.pop()           # keep trailing partial line for next time
+        self.lines += len(lines)
+        return lines
+
+    def close(self):
+        self.ser.close()
+
+# ---------------------------------------------
+def logName(board):   # log file used for this board
+  if not splitLogs:
+      return logFileName
+  base, ext = os.path.splitext(logFileName)
+  return "%s-%s%s" % (base, board, ext)
+
+def logAll(readers, watcher=None, echo=True):
+  # log lines from all readers; with a watcher, boards may come and go and
+  # this runs forever, otherwise it returns once every reader is gone
+  sel = selectors.DefaultSelector()
+  logs = {}        # batchWriter for each log name
+  boards = {}      # reader for each attached board name
+
+  def attach(r):
+      boards[r.name] = r
+      sel.register(r.fd, selectors.EVENT_READ, r)
+      if logName(r.name) not in logs:
+          logs[logName(r.name)] = batchWriter(open(logName(r.name), 'ab'),
+                                              flushBytes, flushMs)
+
+  def addPort(name):   # watcher callback: new board found
+      try:
+          r = picoReader(name)
+      except (OSError, serial.SerialException):
+          return False     # not ready yet, watcher will retry
+      print("Found pico device: %s" % name)
+      attach(r)
+      return True
+
+  def dropPort(name):  # watcher callback, or read error: board gone
+      r = boards.pop(name, None)
+      if r is not None:
+          print("Lost pico device: %s" % name)
+          sel.unregister(r.fd)
+          r.close()
+
+  def bootMode(path, present):
+      if present:
+          print("Pico in bootloader mode at USB %s" % path)
+
+  for r in readers:
+      attach(r)
+  tCheck = time.monotonic()   # time of last watcher scan
+  if watcher is not None:
+      watcher.onAdd = addPort
+      watcher.onRemove = dropPort
+      watcher.onBoot = bootMode
+      for name in boards:
+          watcher.ports.add(name)
+      if watcher.fileno() is not None:
+          sel.register(watcher.fileno(), selectors.EVENT_READ, watcher)
+      watcher.check()
+
+  try:
+    while (watcher is not None) or (len(boards) > 0):
+      tOut = None
+      if watcher is not None:
+        tOut = watcher.timeout()
+      for w in logs.values():   # wake up in time for the next flush deadline
+        t = w.timeout()
+        if (t is not None) and ((tOut is None) or (t < tOut)):
+          tOut = t
+      for key, _ in sel.select(tOut):
+        r = key.data
+        if r is watcher:
+            watcher.check()
+            tCheck = time.monotonic()
+            continue
+        if boards.get(r.name) is not r:
+            continue       # dropped by the watcher during this pass
+        try:
+            lines = r.readLines()
+        except OSError:
+            dropPort(r.name)
+            if watcher is not None:
+                watcher.forget(r.name)   # so a re-enumeration is seen as new
+                tCheck = 0               # and look for it straight away
+            continue
+        absSec = time.time()
+        w = logs[logName(r.name)]
+        for ln in lines:
+            ln = ln.rstrip()
+            w.add(absSec, r.nameB, ln)
+            if echo:
+              print("%d, %s, %s" % (absSec, r.name, ln.decode('utf-8', 'replace')))
+      for w in logs.values():
+        w.poll()
+      if watcher is not None:   # polling, or retrying a port: scan on schedule
+        tOut = watcher.timeout()
+        if (tOut is not None) and (time.monotonic() - tCheck >= tOut):
+            watcher.check()
+            tCheck = time.monotonic()
+  finally:
+    for r in list(boards.values()):
+        r.close()
+    for w in logs.values():
+        w.close()
+    sel.close()
+
+# ---------------------------------------------
+if __name__ == "__main__":
+  import sys
+  if len(sys.argv) > 1 and sys.argv[1] == "--test":
+    import pty
+    import shutil
+    import tempfile
+    import threading
+    import tty
+    rate = 5000       # lines/s each board sends, in bursts of 50
+    sec = 1.0
+    d = tempfile.mkdtemp()
+    logFileName = os.path.join(d, "pLog.csv")
+
+    def board(m, i, n):   # the Pico on master fd m: n lines, paced at 'rate'
+      t0 = time.monotonic()
+      for k in range(0, n, 50):
+        b = b"".join(b"%d,%d, 0.015, 0.0163\r\n" % (i, j) for j in range(k, min(k + 50, n)))
+        while b:
+          b = b[os.write(m, b):]
+        time.sleep(max(0.0, t0 + (k + 50) / rate - time.monotonic()))
+
+    for N in range(1, 9):
+      open(logFileName, "wb").close()
+      pairs = [pty.openpty() for i in range(N)]
+      readers = []
+      for i, (m, s) in enumerate(pairs):
+        tty.setraw(s)
+        readers.append(picoReader("pty%d" % i, os.ttyname(s)))
+      n = int(rate * sec)
+      t0 = time.monotonic()
+      log = threading.Thread(target=logAll, args=(readers,), kwargs={"echo": False})
+      log.start()
+      senders = [threading.Thread(target=board, args=(m, i, n)) for i, (m, s) in enumerate(pairs)]
+      for t in senders:
+        t.start()
+      for t in senders:
+        t.join()
+      while sum(r.lines for r in readers) < N * n and time.monotonic() - t0 < 10 * sec:
+        time.sleep(0.001)           # all read before the masters close: the rest would be lost
+      wall = time.monotonic() - t0
+      for m, s in pairs:            # unplugged: logAll drops each board, and returns
+        os.close(m)
+        os.close(s)
+      log.join()
+      got = {}
+      with open(logFileName, "rb") as f:
+        for ln in f:
+          date, epoch, name, line = ln.rstrip(b"\n").split(b", ", 3)
+          i, j = line.split(b",")[:2]
+          assert name == b"pty" + i, ln       # under the board that sent it
+          got.setdefault(int(i), []).append(int(j))
+      assert all(got.get(i) == list(range(n)) for i in range(N))   # each line once, in order
+      print("%d boards: %6d lines in %.2f s, %6.0f lines/s (%4.0f per board, sent at %d)"
+            % (N, N * n, wall, N * n / wall, n / wall, rate))
+      assert wall < 1.2 * sec + 0.1               # kept up: lines/s grows with the boards
+    shutil.rmtree(d)
+  else:
+    print("Writing output to %s" % logName("*" if splitLogs else ""))
+    logAll([], picoWatcher())   # boards are attached as they are found
@@ -0,0 +1,272 @@
+# Fixed-size line store for the ESP8266 serial bridge (ESP8266-Serial2Net.py)
+# MicroPython for ESP8266; runs under CPython too
+# UART bytes go straight into one preallocated bytearray, each line behind a
+# 4-byte timestamp and a length byte, instead of a new str per line in a list.
+
+"""
+Record layout in the arena:  ts (uint32, little-endian) | n (1 byte) | n line bytes
+The line is stored without its '\\n' and trailing blanks, as rstrip() did.
+A line longer than LINEMAX is split, as readline(120) did.
+
+feed() copies from the UART's receive buffer, a line at a time; when a line
+ends with '**HALT' or '**EXIT' it sets 'event' (the line is not kept), and
+when there is no room for another full line it sets FULL: send the packet
+and clear().  chunks() gives the packet as text, 'ts,line\\n' per line as
+before, in pieces of one small output buffer, for a file or a socket.
+Nothing here makes an object per line but a memoryview slice, which is
+freed at once, so the heap does not fill or fragment with line-sized strings.
+
+    arena = lineArena(8192)
+    rx = bytearray(256); mvRx = memoryview(rx)
+    ...
+    n = uart.readinto(rx, min(uart.any(), len(rx)))    # what is there, without waiting
+    p = 0
+    while p < n:
+        p = arena.feed(mvRx, p, n, time.time())
+        if arena.event: ...                # HALT: sp.put(arena.chunks(startLine)); arena.clear()
+
+    python3 LineArena.py --test    (peak heap, old list-of-str loop vs. the arena, with tracemalloc)
+"""
+
+LINEMAX = 120                # longest line kept whole (readline(120) in the old loop)
+HALT = 1                     # 'event' values
+EXIT = 2
+FULL = 3
+
+class lineArena:
+
+    def __init__(self, size=8192, outSize=512):
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.out = bytearray(outSize)      # chunks() builds text here
+        self.mvOut = memoryview(self.out)
+        self.dig = bytearray(12)           # 'ts,' of the last timestamp formatted
+        self.nDig = 0
+        self.tsDig = -1
+        self.clear()
+
+    def clear(self):
+        self.used = 0            # bytes of complete records
+        self.end = 5             # end of the line being received (its record starts at 'used')
+        self.lines = 0
+        self.event = 0
+
+    def feed(self, src, p, n, ts):
+        # take bytes src[p:n] (a memoryview) up to and including one '\n'; returns the new p
+        buf = self.buf
+        o = self.used
+        if o + 5 + LINEMAX > len(buf):
+            self.event = FULL
+            return p
+        q = p
+        while q < n and src[q] != 10:
+            q += 1
+        k = q - p
+        room = o + 5 + LINEMAX - self.end
+        if k > room:
+            k = room
+            q = p + k                          # split here: the rest makes the next line
+        buf[self.end:self.end + k] = src[p:p + k]
+        self.end += k
+        if q == n:
+            return n                           # line continues in the next read
+        if src[q] == 10:
+            q += 1
+        e = self.end
+        while e > o + 5 and buf[e - 1] in (32, 9, 13):
+            e -= 1                             # rstrip()
+        self.end = o + 5
+        if e - o - 5 >= 6 and buf[o + 5] == 42 and buf[o + 6] == 42:   # '**'
+            if self._is(o + 7, b"HALT"):
+                self.event = HALT
+                return q
+            if self._is(o + 7, b"EXIT"):
+                self.event = EXIT
+                return q
+        buf[o] = ts & 255; buf[o + 1] = (ts >> 8) & 255
+        buf[o + 2] = (ts >> 16) & 255; buf[o + 3] = (ts >> 24) & 255
+        buf[o + 4] = e - o - 5
+        self.used = e
+        self.end = e + 5
+        self.lines += 1
+        return q
+
+    def _is(self, i, word):
+        buf = self.buf
+        for j in range(len(word)):
+            if buf[i + j] != word[j]:
+                return False
+        return True
+
+    def _ts(self, ts):   # 'ts,' as digits in self.dig, formatted once per second
+        if ts != self.tsDig:
+            dig = self.dig
+            j = 0
+            v = ts
+            while True:
+                dig[j] = 48 + v % 10
+                j += 1
+                v //= 10
+                if v == 0:
+                    break
+            i = 0
+            while i < j - 1 - i:               # reverse in place
+                dig[i], dig[j - 1 - i] = dig[j - 1 - i], dig[i]
+                i += 1
+            dig[j] = 44                        # ','
+            self.nDig = j + 1
+            self.tsDig = ts
+        return self.nDig
+
+    def chunks(self, head=None):
+        # the packet as text: head (bytes), then 'ts,line\n' per line; each piece is a
+        # memoryview of one buffer, good until the next is asked for
+        if head:
+            yield head
+        buf = self.buf; mv = self.mv
+        out = self.out; dig = self.dig
+        o = 0
+        p = 0
+        while p < self.used:
+            ts = buf[p] | (buf[p + 1] << 8) | (buf[p + 2] << 16) | (buf[p + 3] << 24)
+            k = buf[p + 4]
+            if o + 13 + k > len(out):
+                yield self.mvOut[:o]
+                o = 0
+            nd = self._ts(ts)
+            for i in range(nd):
+                out[o + i] = dig[i]
+            o += nd
+            out[o:o + k] = mv[p + 5:p + 5 + k]
+            o += k
+            out[o] = 10
+            o += 1
+            p += 5 + k
+        if o:
+            yield self.mvOut[:o]
+
+# -----------------------------------------
+if __name__ == "__main__":
+    import random
+    import sys
+    import tracemalloc
+
+    class fakeUart:   # bytes as they would come in at 115200 baud; reads of whatever is waiting
+        def __init__(self, data, seed=1):
+            self.data = data
+            self.p = 0
+            self.rng = random.Random(seed)
+        def any(self):
+            return len(self.data) - self.p
+        def readline(self, n):
+            q = self.data.find(b"\n", self.p, self.p + n)
+            q = self.p + n if q < 0 else q + 1
+            b = self.data[self.p:q]
+            self.p = q
+            return b
+        def readinto(self, buf, nbytes=None):
+            k = min(nbytes or len(buf), self.any(), self.rng.randint(1, 172))   # 15 ms of 115200 baud at most
+            buf[:k] = self.data[self.p:self.p + k]
+            self.p += k
+            return k
+
+    def stream(lines, seed=2):   # one UART packet, as the Pico sends it
+        rng = random.Random(seed)
+        out = []
+        for i in range(lines):
+            out.append(b"%d, 0.015, 0.0163, %d, %d, %d, %d  \r\n"
+                       % (i, rng.getrandbits(32), rng.getrandbits(32), rng.getrandbits(32), rng.getrandbits(32)))
+        return b"".join(out) + b"**HALT\n"
+
+    class clock:   # time.time() on the ESP8266: whole seconds since 2000, a second every 'step' calls
+        def __init__(self, step=0):
+            self.t = 669402085
+            self.n = 0
+            self.step = step
+        def time(self):
+            self.n += 1
+            if self.step and self.n % self.step == 0:
+                self.t += 1
+            return self.t
+
+    class packets:   # where packets go: kept, to compare
+        def __init__(self):
+            self.pk = []; self.cur = bytearray()
+        def write(self, c):
+            self.cur.extend(c)
+        def end(self):
+            self.pk.append(bytes(self.cur)); self.cur = bytearray()
+
+    class digest:    # where packets go: only a hash and a byte count, so the heap is the loop's own
+        def __init__(self):
+            import hashlib
+            self.h = hashlib.sha1(); self.n = 0
+        def write(self, c):
+            self.h.update(c); self.n += len(c)
+        def end(self):
+            pass
+
+    def oldLoop(uart, head, sink, step=0):   # ESP8266-Serial2Net.py's loop: a str per line, joined at the end
+        time = clock(step)
+        recLines = []
+        while uart.any():
+            hostMsg = uart.readline(120)
+            rawMsg = hostMsg.decode().rstrip()
+            strMsg = str(time.time()) + "," + rawMsg
+            if rawMsg[0:6] == "**HALT":
+                break
+            recLines.append(strMsg)
+        recLines.append("")
+        sink.write((head + "\n" + "\n".join(recLines)).encode())
+        sink.end()
+
+    def arenaLoop(uart, head, sink, size, step=0):   # the same with the arena; a packet each time it fills
+        time = clock(step)
+        arena = lineArena(size)
+        rx = bytearray(256); mvRx = memoryview(rx)
+        headB = (head + "\n").encode()
+        p = n = 0
+        while True:
+            if p == n:
+                n = uart.readinto(rx); p = 0
+            while p < n:
+                p = arena.feed(mvRx, p, n, time.time())
+                if arena.event:
+                    for c in arena.chunks(headB):
+                        sink.write(c)          # the flash spool file, or the socket
+                    sink.end()
+                    if arena.event != FULL:
+                        return
+                    arena.clear()
+
+    def peak(fn, *args):
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(*args)
+        cur, pk = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return pk - base
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--test":
+        head = "# START 2021-03-18 17:01:21"
+        # the same bytes out as the old loop
+        data = stream(300)
+        a = packets(); oldLoop(fakeUart(data), head, a)
+        b = packets(); arenaLoop(fakeUart(data), head, b, 65536)
+        assert a.pk == b.pk
+        c = packets(); arenaLoop(fakeUart(data), head, c, 4096)
+        strip = lambda pk: [ln for ln in pk.split(b"\n") if ln and not ln.startswith(b"# START")]
+        assert sum((strip(x) for x in c.pk), []) == strip(a.pk[0]) and len(c.pk) > 1
+        d = packets(); arenaLoop(fakeUart(data), head, d, 65536, step=3)
+        ts = [int(ln.split(b",")[0]) for ln in strip(d.pk[0])]
+        assert ts == sorted(ts) and ts[-1] > ts[0] + 50
+        print("arena output matches the old loop; a 4 KB arena splits the packet (%d packets), no line lost"
+              % len(c.pk))
+        # peak heap while one packet comes in and goes out
+        print("  lines   packet bytes   old loop peak   arena 8 KB peak   (CPython heap, tracemalloc)")
+        for lines in (100, 1000, 5000, 20000):
+            data = stream(lines)
+            so = digest(); pOld = peak(oldLoop, fakeUart(data), head, so)
+            sn = digest(); pNew = peak(arenaLoop, fakeUart(data), head, sn, 8192)
+            print("%7d %14d %13d B %15d B" % (lines, so.n, pOld, pNew))
+            assert pNew < 12000
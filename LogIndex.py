@@ -0,0 +1,227 @@
+# Python3 host code: sparse time index for the append-only Pico logs
+# pLog.csv (Host_Log_Pico.py) has the Unix epoch second in column 2; the index
+# keeps (epoch, byte offset) for every N-th line in a small sidecar file, so a
+# time range is found with a binary search over the index, then over the N
+# lines between two entries, and read through mmap without scanning the log.
+# update() only reads what was appended since last time.
+
+# Index file: <log>.idx, int64 pairs (epoch, offset), appended to.  The epoch
+# kept is the running maximum, so the keys stay sorted even if the host clock
+# steps back; lines logged during such a step may fall outside a query.
+
+# python3 LogIndex.py pLog.csv "2021-04-26 14:00" "2021-04-26 15:00"   (print that hour)
+# python3 LogIndex.py --test [GB]     (synthetic logs up to GB gigabytes: lookup cost vs size)
+
+import mmap
+import os
+import sys
+import time
+import numpy as np
+
+EVERY = 1024               # lines per index entry
+CHUNK = 1 << 26            # bytes scanned at a time when indexing
+
+# ---------------------------------------------
+def lineEpoch(mm, p):   # epoch in 'date, epoch, board, ...' of the line at p, or None
+    a = mm.find(b",", p, p + 64)
+    if a < 0:
+        return None
+    b = mm.find(b",", a + 1, a + 24)
+    try:
+        return int(mm[a + 1:b])
+    except ValueError:
+        return None
+
+class logIndex:
+
+    def __init__(self, fname, every=EVERY):
+        self.fname = fname
+        self.iname = fname + ".idx"
+        self.every = every
+        self.f = open(fname, "rb")
+        self.mm = None
+        self.size = 0
+        self.idx = np.zeros((0, 2), dtype=np.int64)
+        self.probes = 0            # index entries and lines read by the last find()
+        self.scanned = 0           # log bytes read by the last update()
+        self.update()
+
+    def _map(self):
+        size = os.fstat(self.f.fileno()).st_size
+        if size != self.size or self.mm is None:
+            if self.mm is not None:
+                self.mm.close()
+            self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+            self.size = size
+
+    def _load(self):
+        if os.path.exists(self.iname) and os.path.getsize(self.iname) >= 16:
+            n = os.path.getsize(self.iname) // 16
+            self.idx = np.memmap(self.iname, dtype=np.int64, mode="r", shape=(n, 2))
+        else:
+            self.idx = np.zeros((0, 2), dtype=np.int64)
+
+    def update(self):   # index the lines appended since the last entry; returns new entries
+        self._map()
+        self._load()
+        if self.mm is None:
+            return 0
+        n = len(self.idx)
+        if n:
+            pos = int(self.idx[-1, 1]); key = int(self.idx[-1, 0]); line = 0
+        else:
+            pos = 0; key = -1; line = 0
+        # line counts from the last entry (line 0 there), which is read again
+        mm = self.mm
+        new = []
+        start = pos
+        while pos < self.size:
+            end = min(pos + CHUNK, self.size)
+            nl = np.flatnonzero(np.frombuffer(mm, dtype=np.uint8, count=end - pos, offset=pos) == 10)
+            if len(nl) == 0:
+                if end == self.size:
+                    break                                  # a line still being written
+                pos = end; continue
+            starts = np.concatenate(([pos], nl[:-1] + pos + 1))   # complete lines in this piece
+            k = (-line) % self.every                              # next entry among them
+            for p in starts[k::self.every]:
+                e = lineEpoch(mm, int(p))
+                if e is not None and e > key:
+                    key = e
+                new.append((max(key, 0), int(p)))
+            line += len(starts)
+            pos += int(nl[-1]) + 1
+        self.scanned = pos - start
+        if n:
+            new = new[1:]                                  # the last entry, read again
+        if new:
+            with open(self.iname, "ab") as f:
+                f.write(np.array(new, dtype=np.int64).tobytes())
+            self._load()
+        return len(new)
+
+    def find(self, t):   # byte offset of the first line with epoch >= t
+        keys = self.idx[:, 0] if len(self.idx) else None
+        if keys is None:
+            return 0
+        lo, hi = 0, len(keys)          # binary search, counting the entries it reads
+        self.probes = 0
+        while lo < hi:
+            mid = (lo + hi) // 2
+            self.probes += 1
+            if keys[mid] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return 0
+        a = int(self.idx[lo - 1, 1])   # entry before: its line is < t
+        b = int(self.idx[lo, 1]) if lo < len(keys) else self.size
+        nl = np.flatnonzero(np.frombuffer(self.mm, dtype=np.uint8, count=b - a, offset=a) == 10)
+        if len(nl) == 0:
+            return a
+        starts = np.concatenate(([a], nl + a + 1))   # the lines between, and where the last ends
+        i, j = 1, len(starts) - 1      # then the same search over those lines
+        while i < j:
+            mid = (i + j) // 2
+            self.probes += 1
+            e = lineEpoch(self.mm, int(starts[mid]))
+            if e is not None and e < t:
+                i = mid + 1
+            else:
+                j = mid
+        return int(starts[i])
+
+    def range(self, t0, t1):   # (start, end) bytes of the lines with t0 <= epoch < t1
+        return self.find(t0), self.find(t1)
+
+    def lines(self, t0, t1):   # those lines, as one bytes object straight from the mapping
+        a, b = self.range(t0, t1)
+        return self.mm[a:b]
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        self.f.close()
+
+# ---------------------------------------------
+def synthLog(fname, nbytes, t0=1619445791, perSec=10, append=False, block=1 << 21):
+    # Host_Log_Pico.py-style fixed-width lines, built as byte arrays: perSec lines a second
+    tmpl = np.frombuffer(b"2021-04-26_14:03:11, 1619445791, ttyACM0, 000000,000000\n", dtype=np.uint8)
+    W = len(tmpl)
+    n = nbytes // W
+    mode = "ab" if append else "wb"
+    first = 0
+    if append:
+        first = os.path.getsize(fname) // W
+    p10 = 10 ** np.arange(9, -1, -1, dtype=np.int64)
+    p6 = 10 ** np.arange(5, -1, -1, dtype=np.int64)
+    with open(fname, mode) as f:
+        for s in range(first, first + n, block):
+            m = min(block, first + n - s)
+            ln = np.arange(s, s + m, dtype=np.int64)
+            e = t0 + ln // perSec
+            a = np.tile(tmpl, (m, 1))
+            secs = np.arange(e[0], e[-1] + 1).astype("datetime64[s]")
+            d = np.char.replace(np.datetime_as_string(secs).astype("S19"), b"T", b"_")
+            a[:, 0:19] = np.frombuffer(d.tobytes(), dtype=np.uint8).reshape(-1, 19)[e - e[0]]
+            a[:, 21:31] = (e[:, None] // p10) % 10 + 48
+            a[:, 42:48] = (ln[:, None] // p6) % 10 + 48
+            a[:, 49:55] = ((ln * 7919)[:, None] // p6) % 10 + 48
+            f.write(a.tobytes())
+    return n
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--test":
+        import random
+        import tempfile
+        gb = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+        d = tempfile.mkdtemp()
+        fn = os.path.join(d, "pLog.csv")
+        rng = random.Random(1)
+        t0 = 1619445791
+        print("    size     lines  entries  index s  probes  lookup us")
+        for size in [s for s in (1e7, 1e8, 1e9, 1e10) if s <= gb * 1e9 * 1.001]:
+            for p in (fn, fn + ".idx"):
+                if os.path.exists(p):
+                    os.remove(p)
+            n = synthLog(fn, int(size), t0)
+            t = time.perf_counter()
+            ix = logIndex(fn)
+            tIdx = time.perf_counter() - t
+            tEnd = t0 + (n - 1) // 10
+            qs = [rng.randint(t0, tEnd) for _ in range(2000)]
+            t = time.perf_counter()
+            probes = 0
+            for q in qs:
+                ix.find(q)
+                probes += ix.probes
+            us = (time.perf_counter() - t) / len(qs) * 1e6
+            for q in qs[:200]:              # the line found is the first at or after q
+                p = ix.find(q)
+                assert lineEpoch(ix.mm, p) == q
+                if p:
+                    assert lineEpoch(ix.mm, ix.mm.rfind(b"\n", 0, p - 1) + 1) == q - 1
+            print("%8.0e %9d %8d %8.1f %7.1f %10.1f" % (size, n, len(ix.idx), tIdx, probes / len(qs), us))
+            ix.close()
+        # the logger appends: update() reads only the new bytes
+        ix = logIndex(fn)
+        synthLog(fn, 10_000_000, t0, append=True)
+        t = time.perf_counter()
+        added = ix.update()
+        dt = time.perf_counter() - t
+        print("append 10 MB: %d new entries, %.1f MB read, %.2f s" % (added, ix.scanned / 1e6, dt))
+        assert added > 0 and ix.scanned < 11e6
+        n = os.path.getsize(fn) // 56
+        tLast = t0 + (n - 1) // 10
+        hour = ix.lines(tLast - 3600, tLast)
+        assert hour.count(b"\n") == 36000 and int(hour[21:31]) == tLast - 3600
+        print("last hour: %d lines, %.1f MB, straight from the mapping" % (hour.count(b"\n"), len(hour) / 1e6))
+        ix.close()
+        os.remove(fn); os.remove(fn + ".idx"); os.rmdir(d)
+    else:
+        from datetime import datetime
+        ix = logIndex(sys.argv[1])
+        t0 = int(datetime.strptime(sys.argv[2], "%Y-%m-%d %H:%M").timestamp())
+        t1 = int(datetime.strptime(sys.argv[3], "%Y-%m-%d %H:%M").timestamp())
+        sys.stdout.buffer.write(ix.lines(t0, t1))
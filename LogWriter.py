@@ -0,0 +1,160 @@
+# Python3 host code: batched writer for the Pico CSV logs
+# lines are copied into one preallocated buffer, and written out when
+# it holds flushBytes, or when the oldest line has waited flushMs,
+# whichever comes first.  The date/time prefix is only formatted again
+# when the second changes, not for every line.
+
+# output lines look like:  2021-04-26_14:03:11, 1619445791, ttyACM0, <line>
+
+# ---------------------------------------------
+import time
+from datetime import datetime
+
+class batchWriter:  # buffered, bounded-latency writer for one log file
+
+    def __init__(self, f, flushBytes=65536, flushMs=200, clock=time.monotonic):
+        self.f = f                  # file opened in binary mode, eg. open(name,'ab')
+        self.flushBytes = flushBytes
+        self.flushSec = flushMs / 1000.0
+        self.clock = clock          # time source for the flush deadline
+        self.buf = bytearray(2 * flushBytes + 4096)  # room for one more line past the limit
+        self.mv = memoryview(self.buf)
+        self.n = 0                  # bytes now in buf
+        self.tFirst = None          # clock time of oldest unwritten line
+        self.sec = None             # epoch second of cached prefix
+        self.stamp = b""            # cached "date_time, epoch, " prefix
+        self.lines = 0              # count of lines added
+        self.flushes = 0            # count of writes to the file
+
+    def prefix(self, absSec):  # "Y-M-D_H:M:S, epoch, " for this second
+        sec = int(absSec)
+        if sec != self.sec:
+            self.sec = sec
+            tNow = datetime.fromtimestamp(sec).strftime("%Y-%m-%d_%H:%M:%S")
+            self.stamp = ("%s, %d, " % (tNow, sec)).encode()
+        return self.stamp
+
+    def add(self, absSec, board, line):  # board and line are bytes, line without '\n'
+        p = self.prefix(absSec)
+        n = self.n
+        end = n + len(p) + len(board) + len(line) + 3
+        if end > len(self.buf):     # oversize line: make room first
+            self.flush()
+            n = 0
+            end = len(p) + len(board) + len(line) + 3
+            if end > len(self.buf):
+                self.buf.extend(bytes(end - len(self.buf)))
+                self.mv = memoryview(self.buf)
+        buf = self.buf
+        m = n + len(p)
+        buf[n:m] = p
+        n = m + len(board)
+        buf[m:n] = board
+        buf[n:n+2] = b", "
+        n += 2
+        m = n + len(line)
+        buf[n:m] = line
+        buf[m] = 10                 # '\n'
+        self.n = m + 1
+        self.lines += 1
+        if self.tFirst is None:
+            self.tFirst = self.clock()
+        if self.n >= self.flushBytes:
+            self.flush()
+
+    def timeout(self):  # seconds until the time limit forces a flush (None: nothing waiting)
+        if self.tFirst is None:
+            return None
+        return max(0.0, self.tFirst + self.flushSec - self.clock())
+
+    def poll(self):    # flush if the oldest line has waited long enough
+        if (self.tFirst is not None) and (self.clock() - self.tFirst >= self.flushSec):
+            self.flush()
+
+    def flush(self):
+        if self.n > 0:
+            self.f.write(self.mv[:self.n])
+            self.f.flush()
+            self.flushes += 1
+        self.n = 0
+        self.tFirst = None
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+# ---------------------------------------------
+if __name__ == "__main__":   # benchmark: per-line write (old Host_Log_Pico) vs batchWriter
+  import os
+  import random
+
+  N = 200_000                 # lines for the throughput test
+  line = b"12345,-678,4294967295,0.01222"
+  board = b"ttyACM0"
+
+  def oldWrite(f, absSec, inLine, lCount):   # as Host_Log_Pico.py did it, fRate = 5
+    tNow = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
+    f.write("%s, %d, %s, %s\n" % (tNow,absSec,"ttyACM0",inLine))
+    if (lCount % 5 == 0):
+      f.flush()
+
+  with open(os.devnull, 'w') as f:
+    t0 = time.perf_counter()
+    inLine = line.decode()
+    for i in range(N):
+      oldWrite(f, time.time(), inLine, i+1)
+    tOld = time.perf_counter() - t0
+
+  with open(os.devnull, 'wb') as f:
+    w = batchWriter(f)
+    t0 = time.perf_counter()
+    for i in range(N):
+      w.add(time.time(), board, line)
+    w.flush()
+    tNew = time.perf_counter() - t0
+
+  print("throughput   old: %8.0f lines/s   batched: %8.0f lines/s  (x%.1f)"
+        % (N/tOld, N/tNew, tOld/tNew))
+
+  # flush latency: time from a line arriving until it is on disk, with a
+  # virtual clock and bursty arrivals (mean 20 lines/s, some slow gaps)
+  def p99(x):
+    x = sorted(x)
+    return x[int(0.99*(len(x)-1))]
+
+  random.seed(1)
+  arrivals = []
+  t = 0.0
+  for i in range(20_000):
+    t += random.expovariate(20.0) if random.random() < 0.95 else random.uniform(1, 10)
+    arrivals.append(t)
+
+  latOld = []                 # old: flush every 5th line, whenever that comes
+  waiting = []
+  for i, ta in enumerate(arrivals):
+    waiting.append(ta)
+    if (i+1) % 5 == 0:
+      latOld += [ta - tw for tw in waiting]
+      waiting = []
+
+  class fakeFile:             # records when each flush happened
+    def __init__(self): self.t = 0.0
+    def write(self, b): pass
+    def flush(self): pass
+
+  now = [0.0]
+  w = batchWriter(fakeFile(), flushMs=200, clock=lambda: now[0])
+  latNew = []
+  waiting = []
+  for ta in arrivals:
+    tOut = w.timeout()        # what the selectors loop would do while waiting
+    if (tOut is not None) and (now[0] + tOut <= ta):
+      now[0] += tOut
+      w.poll()
+      latNew += [now[0] - tw for tw in waiting]
+      waiting = []
+    now[0] = ta
+    w.add(ta, board, line)
+    waiting.append(ta)
+  print("p99 flush latency   old: %7.1f ms   batched: %7.1f ms  (flushMs = 200)"
+        % (1000*p99(latOld), 1000*p99(latNew)))
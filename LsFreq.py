@@ -0,0 +1,268 @@
+# Python3 host code: streaming least-squares frequency from edge timestamps
+# fits t = t0 + a + b*k + c*k^2 (k: edge number) from running sums, so the
+# state stays the same size however many timestamps come in; add() takes
+# them one at a time (live serial data), addArray() a whole capture with NumPy.
+# RP2040 floats are single precision, so the fit runs here, not on the Pico.
+
+"""
+Timestamps t are in counts (exact ints, eg. RecipCounter1.py GAPLESS output,
+unwrapped) times 'scale' seconds per count; each one covers 'edges' input
+edges.  The sums are kept for the phase x = t - (reference curve), and the
+reference is moved onto the fit whenever |x| passes xmax, so x stays
+small and sum(x^2) keeps enough digits for the residual RMS.
+
+report() gives
+    f       Hz at the last timestamp (Hz at mid-capture in fMid)
+    drift   Hz/s, from the k^2 term
+    rms     residual RMS of the timestamps about the fit, seconds
+    adev    [(tau, Allan deviation, count)] at octave taus: non-overlapping,
+            from every m-th timestamp, kept with 2 values per tau
+
+    python3 LsFreq.py capture.csv     ('n,msec,count' from RecipCounter1.py)
+    python3 LsFreq.py --test          (synthetic and PIO-simulated timestamps)
+"""
+
+import math
+
+class lsFreq:
+
+    def __init__(self, scale=1.0, edges=1, octaves=16, xmax=1e-4):
+        self.scale = scale         # seconds per timestamp count
+        self.edges = edges         # input edges per timestamp
+        self.xmax = xmax           # seconds of phase before the reference is moved
+        self.n = 0
+        self.t0 = None             # first timestamp (counts) and its edge number
+        self.k0 = 0
+        self.kLast = -1            # edge number of the last timestamp, from k0
+        self.a = 0.0               # reference curve: a + b*k + c*k^2 seconds after t0
+        self.b = None
+        self.c = 0.0
+        self.S = [0.0]*5           # sum of k^j, j = 0..4
+        self.Sx = [0.0]*3          # sum of k^j * x, j = 0..2
+        self.Sxx = 0.0
+        self.taus = [1 << j for j in range(octaves)]   # in timestamps
+        self.hold = [[] for _ in self.taus]            # last two (k, x) at each tau
+        self.av = [0.0]*octaves    # sums of squared second differences
+        self.avN = [0]*octaves
+        self.rebases = 0
+
+    # ----- one timestamp at a time
+    def add(self, t, k=None):
+        if k is None:
+            k = self.k0 + self.kLast + 1
+        if self.t0 is None:
+            self.t0 = t
+            self.k0 = k
+        kk = k - self.k0
+        if self.b is None and kk > 0:
+            self.b = (t - self.t0) * self.scale / kk
+        x = (t - self.t0) * self.scale - self.a - ((self.b or 0.0) + self.c * kk) * kk
+        self._sum(kk, x)
+        if kk != self.kLast + 1:   # missing timestamps: Allan sequences start again
+            self.hold = [[] for _ in self.taus]
+        self.kLast = kk
+        for j, m in enumerate(self.taus):
+            if kk % m == 0:
+                h = self.hold[j]
+                if len(h) == 2:
+                    d = x - 2*h[1][1] + h[0][1] + 2*self.c*m*m   # + the reference's own
+                    self.av[j] += d*d
+                    self.avN[j] += 1
+                    h.pop(0)
+                h.append((kk, x))
+        if abs(x) > self.xmax:
+            self.shift(*self.fit(min(2, self.n - 1)))
+
+    def _sum(self, kk, x):
+        self.n += 1
+        S = self.S
+        p = 1.0
+        for j in range(5):
+            S[j] += p
+            if j < 3:
+                self.Sx[j] += p * x
+            p *= kk
+        self.Sxx += x*x
+
+    def shift(self, da, db, dc=0.0):   # move the reference by da + db*k + dc*k^2; the sums follow exactly
+        S = self.S; Sx = self.Sx
+        self.Sxx += (-2*(da*Sx[0] + db*Sx[1] + dc*Sx[2]) + da*da*S[0] + db*db*S[2] + dc*dc*S[4]
+                     + 2*(da*db*S[1] + da*dc*S[2] + db*dc*S[3]))
+        for j in range(3):
+            Sx[j] -= da*S[j] + db*S[j+1] + dc*S[j+2]
+        self.a += da
+        self.b = (self.b or 0.0) + db
+        self.c += dc
+        for h in self.hold:
+            for i in range(len(h)):
+                k = h[i][0]
+                h[i] = (k, h[i][1] - da - (db + dc*k)*k)
+        self.rebases += 1
+
+    # ----- a whole capture (or a large piece of one), with NumPy
+    def addArray(self, t, k=None, chunk=1 << 16):
+        import numpy as np
+        t = np.asarray(t)
+        if k is None:
+            k = self.k0 + self.kLast + 1 + np.arange(len(t), dtype=np.int64)
+        k = np.asarray(k, dtype=np.int64)
+        if len(t) == 0:
+            return
+        if self.t0 is None:
+            self.add(t[0], int(k[0]))
+            t = t[1:]; k = k[1:]
+        gaps = np.flatnonzero(np.diff(k) != 1) + 1
+        for s, e in zip(np.concatenate(([0], gaps)), np.concatenate((gaps, [len(k)]))):
+            for c in range(s, e, chunk):
+                self._addRun(t[c:min(e, c + chunk)], k[c:min(e, c + chunk)], np)
+
+    def _addRun(self, t, k, np):    # consecutive edge numbers
+        kk = k - self.k0
+        kf = kk.astype(np.float64)
+        tt = (t - self.t0) * self.scale
+        if self.b is None:
+            self.b = tt[0] / kf[0]
+        x = tt - self.a - (self.b + self.c * kf) * kf
+        pw = [np.ones_like(kf)]
+        for j in range(4):
+            pw.append(pw[-1] * kf)
+        S = [float(p.sum()) for p in pw]
+        if np.abs(x).max() > self.xmax:
+            # move the reference onto the fit of the old sums and this piece together,
+            # before sum(x^2) is taken, so it stays small
+            Sx = [float((pw[j] * x).sum()) for j in range(3)]
+            n = self.n + len(x)
+            self.shift(*self.fit(min(2, n - 1), [a + b for a, b in zip(self.S, S)],
+                                 [a + b for a, b in zip(self.Sx, Sx)]))
+            x = tt - self.a - (self.b + self.c * kf) * kf
+        for j in range(5):
+            self.S[j] += S[j]
+            if j < 3:
+                self.Sx[j] += float((pw[j] * x).sum())
+        self.Sxx += float((x * x).sum())
+        self.n += len(x)
+        if kk[0] != self.kLast + 1:
+            self.hold = [[] for _ in self.taus]
+        self.kLast = int(kk[-1])
+        for j, m in enumerate(self.taus):
+            st = int((-kk[0]) % m)
+            xs = x[st::m]
+            if len(xs) == 0:
+                continue
+            h = self.hold[j]
+            seq = np.concatenate(([v for _, v in h], xs))
+            if len(seq) >= 3:
+                d = seq[2:] - 2*seq[1:-1] + seq[:-2] + 2*self.c*m*m
+                self.av[j] += float((d*d).sum())
+                self.avN[j] += len(d)
+            ks = kk[st::m]
+            allK = [q for q, _ in h] + [int(q) for q in ks[-2:]]
+            allX = [v for _, v in h] + [float(v) for v in xs[-2:]]
+            self.hold[j] = list(zip(allK[-2:], allX[-2:]))
+
+    # ----- results
+    def fit(self, order=2, S=None, Sx=None):   # c of x = c0 + c1*k + c2*k^2, by normal equations
+        S = S or self.S
+        Sx = Sx or self.Sx
+        p = order + 1
+        K = float(max(self.kLast, 1))  # solve in u = k/K, so the matrix is well scaled
+        M = [[S[i+j] / K**(i+j) for j in range(p)] + [Sx[i] / K**i] for i in range(p)]
+        for i in range(p):             # Gauss-Jordan, partial pivoting
+            r = max(range(i, p), key=lambda q: abs(M[q][i]))
+            M[i], M[r] = M[r], M[i]
+            if M[i][i] == 0:
+                return [0.0]*p
+            for q in range(p):
+                if q != i:
+                    f = M[q][i] / M[i][i]
+                    for j in range(i, p + 1):
+                        M[q][j] -= f * M[i][j]
+        return [M[i][p] / M[i][i] / K**i for i in range(p)]
+
+    def report(self):
+        if self.n < 4 or self.b is None:
+            return None
+        c = self.fit(2)
+        kEnd = self.kLast
+        q = self.c + c[2]                           # k^2 coefficient of the whole fit
+        per = self.b + c[1] + 2*q*kEnd              # seconds per timestamp, at the end
+        perMid = self.b + c[1] + q*kEnd
+        rss = self.Sxx - sum(c[j] * self.Sx[j] for j in range(3))
+        T = self.b
+        adev = [(m * T, math.sqrt(self.av[j] / (2*self.avN[j])) / (m * T), self.avN[j])
+                for j, m in enumerate(self.taus) if self.avN[j] > 0]
+        return {"n": self.n, "f": self.edges / per, "fMid": self.edges / perMid,
+                "drift": -2 * q * self.edges / per**3,
+                "rms": math.sqrt(max(rss, 0.0) / (self.n - 3)),
+                "adev": adev}
+
+def summary(r):
+    out = ["n %d, f %.9f Hz (mid %.9f), drift %.4g Hz/s, residual rms %.3g s"
+           % (r["n"], r["f"], r["fMid"], r["drift"], r["rms"])]
+    for tau, ad, cnt in r["adev"]:
+        out.append("  tau %10.4g s  adev %.3g  (%d)" % (tau, ad, cnt))
+    return "\n".join(out)
+
+# -----------------------------------------
+if __name__ == "__main__":
+    import sys
+    import time
+    import numpy as np
+    if len(sys.argv) > 1 and sys.argv[1] == "--test":
+        # 1. synthetic: 200 Hz timestamps, quantized to 2 cycles at 250 MHz, 20 ns
+        #    white jitter, frequency drifting by 1e-8 per second
+        F = 250e6; f0 = 200.0; drift = 200.0 * 1e-8; jit = 20e-9; n = 400_000
+        rng = np.random.default_rng(3)
+        k = np.arange(n)
+        tTrue = k / f0 - 0.5 * drift / f0**2 * k**2 / f0   # f(t) = f0 + drift*t, to first order
+        counts = np.round((tTrue + rng.normal(0.0, jit, n)) * F / 2).astype(np.int64) + 12345
+        t0 = time.perf_counter()
+        lb = lsFreq(scale=2 / F); lb.addArray(counts)
+        t1 = time.perf_counter()
+        ls = lsFreq(scale=2 / F)
+        for v in counts.tolist():
+            ls.add(v)
+        t2 = time.perf_counter()
+        rb = lb.report(); rs = ls.report()
+        print("batch:     " + summary(rb).split("\n")[0])
+        print("streaming: " + summary(rs).split("\n")[0])
+        assert abs(rb["f"] - rs["f"]) < 1e-9 * f0 and abs(rb["drift"] - rs["drift"]) < 1e-3 * drift
+        assert abs(rb["rms"] - rs["rms"]) < 1e-3 * rs["rms"]
+        for (ta, a1, n1), (tb, a2, n2) in zip(rb["adev"], rs["adev"]):
+            assert n1 == n2 and abs(a1 - a2) < 1e-4 * a2, (ta, a1, a2)
+        fEnd = f0 + drift * tTrue[-1]
+        print("true f at end %.9f Hz, drift %.4g Hz/s; expected rms %.3g s"
+              % (fEnd, drift, math.sqrt(jit**2 + (2 / F)**2 / 12)))
+        assert abs(rs["f"] - fEnd) < 1e-9 * f0
+        assert abs(rs["drift"] - drift) < 0.02 * drift
+        assert abs(rs["rms"] / math.sqrt(jit**2 + (2 / F)**2 / 12) - 1) < 0.02
+        # white phase noise: adev falls as 1/tau, until the drift (adev = drift/f * tau/sqrt(2)) takes over
+        ad = [(tau, a) for tau, a, c in rs["adev"] if tau < 0.3]
+        slope = math.log(ad[-1][1] / ad[0][1]) / math.log(ad[-1][0] / ad[0][0])
+        print("adev slope %.2f over tau %.3g..%.3g s (white phase noise: -1)" % (slope, ad[0][0], ad[-1][0]))
+        assert -1.15 < slope < -0.85
+        tau, a, c = rs["adev"][-1]
+        aDrift = drift / f0 * tau / math.sqrt(2)
+        print("adev %.3g at tau %.1f s: drift alone gives %.3g" % (a, tau, aDrift))
+        assert abs(a / aDrift - 1) < 0.1
+        print("%d timestamps: add() %.2f s, addArray() %.3f s; %d reference moves"
+              % (n, t2 - t1, t1 - t0, ls.rebases))
+        # 2. RecipCounter1.py's timestamp() program in the PIO simulator
+        import FreqEst
+        ts, tr = FreqEst.simGapless(1234.5, 4.0, 20e-9)
+        lp = lsFreq(); lp.addArray(ts)
+        r = lp.report()
+        print("PIO sim, 1234.5 Hz: " + summary(r).split("\n")[0])
+        assert abs(r["fMid"] - 1234.5) < 1e-6
+    else:
+        import FreqEst
+        for fname in sys.argv[1:]:
+            t, edges = FreqEst.readStamps(fname)
+            ls = lsFreq(edges=edges)
+            ls.addArray(t)
+            r = ls.report() if len(t) else None
+            if r is None:
+                print("== %s: %d timestamps, too few to fit (4 at least)" % (fname, len(t)))
+                continue
+            print("== %s" % fname)
+            print(summary(r))
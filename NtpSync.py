@@ -0,0 +1,274 @@
+# Periodic NTP time for the ESP8266 bridges (ESP8266-Serial2Net.py, ESP8266-Port-Data.py)
+# MicroPython (ESP8266, Pico W); runs under CPython too, with a stand-in NTP server
+# Instead of setting the RTC once at boot and letting it drift with the crystal,
+# the device's ms ticks are kept on UTC by polling the server now and then.
+
+"""
+A sync sends 'samples' queries back to back and keeps the one with the
+least round-trip delay (the least queuing, so the least error).  That
+point (local ms at the midpoint, server time) is kept with the last 'keep'
+of them, and a straight-line fit over those gives the crystal's frequency
+error, in ppm.  The clock runs at that rate between syncs.  The offset
+still left at a sync is slewed out over the next poll interval (at most
+maxSlewPpm) rather than stepped, so stamps never go back; only a jump
+larger than stepMs, or the first sync, steps the clock.  The poll
+interval doubles from minPoll up to maxPoll while the offsets are small,
+and halves when not.
+
+Times are int ms, since the local epoch (2000 on MicroPython, 1970 on
+CPython): no floats for absolute times, the ESP8266's are 32 bits.  A
+sync blocks for a few round trips (or timeoutMs, if the server is away):
+call poll() when the UART is quiet, between packets.
+
+    ntp = ntpSync('192.168.1.212')
+    ntp.sync()               # at boot; then
+    ...
+    t = ntp.time()           # whole seconds, in place of time.time()
+    ntp.poll()               # between packets: syncs when due
+
+    python3 NtpSync.py --sim [HOURS]   (stand-in server on UDP with delay, jitter and loss:
+                                        stamp error over simulated hours, against one sync at boot)
+"""
+
+import socket
+import time
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:          # CPython
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+    def ticks_diff(a, b):
+        return a - b
+
+NTP_DELTA = 3155673600 if time.gmtime(0)[0] == 2000 else 2208988800   # NTP era to the local epoch
+
+class ntpSync:
+
+    def __init__(self, host, port=123, samples=4, keep=8, minPoll=64, maxPoll=1024, okMs=20,
+                 stepMs=1000, maxSlewPpm=500, timeoutMs=1000, ticks=ticks_ms):
+        self.host = host
+        self.port = port
+        self.samples = samples     # queries per sync; the least delayed is kept
+        self.keep = keep           # syncs in the frequency fit
+        self.minPoll = minPoll     # s between syncs
+        self.maxPoll = maxPoll
+        self.okMs = okMs           # offsets below this let the poll interval grow
+        self.stepMs = stepMs       # offsets above this are stepped, not slewed
+        self.maxSlew = maxSlewPpm * 1e-6
+        self.timeoutMs = timeoutMs
+        self.ticks = ticks
+        self.q = bytearray(48)     # the query
+        self.q[0] = 0x1b           # version 3, client
+        self.tLast = ticks()
+        self.L = 0                 # local ms, through ticks rollovers
+        self.pts = []              # [local ms, offset ms, delay ms] of the last syncs
+        self.f = 0.0               # frequency error of the local clock (fit)
+        self.fC = 0.0              # rate the clock runs at now: f plus the slew
+        self.slewEnd = None        # local ms when the slew is done
+        self.LBase = 0             # the clock is cBase at LBase, and runs at 1 + fC
+        self.cBase = int(time.time()) * 1000
+        self.pollSec = minPoll
+        self.next = 0              # local ms of the next sync
+        self.synced = False
+        self.offset = 0            # ms, at the last sync, before it was slewed out
+        self.delay = 0
+        self.syncs = 0
+        self.fails = 0
+        self.steps = 0
+
+    def local(self):   # local ms since start
+        t = self.ticks()
+        self.L += ticks_diff(t, self.tLast)
+        self.tLast = t
+        return self.L
+
+    def _at(self, L):   # the clock at local ms L
+        if self.slewEnd is not None and L >= self.slewEnd:     # slew done: on at the fitted rate
+            e = self.slewEnd - self.LBase
+            self.cBase += e + int(e * self.fC)
+            self.LBase = self.slewEnd
+            self.fC = self.f
+            self.slewEnd = None
+        e = L - self.LBase
+        return self.cBase + e + int(e * self.fC)
+
+    def ms(self):      # UTC ms since the epoch
+        return self._at(self.local())
+
+    def time(self):    # whole seconds, as time.time()
+        return self._at(self.local()) // 1000
+
+    def _query(self, s, addr):   # one round trip: (local ms at its middle, offset ms, delay ms)
+        q = self.q
+        t1 = self.local()
+        struct.pack_into("!I", q, 44, t1 & 0xFFFFFFFF)      # our mark, sent back as 'originate'
+        s.sendto(q, addr)
+        while True:
+            msg = s.recv(48)
+            if len(msg) == 48 and msg[28:32] == q[44:48] and msg[0] & 7 == 4 and msg[1]:
+                break                                        # not a late answer to an earlier one
+        t4 = self.local()
+        a = struct.unpack("!IIII", msg[32:48])
+        T2 = (a[0] - NTP_DELTA) * 1000 + ((a[1] * 1000) >> 32)
+        T3 = (a[2] - NTP_DELTA) * 1000 + ((a[3] * 1000) >> 32)
+        Lm = (t1 + t4) // 2
+        return [Lm, (T2 + T3) // 2 - Lm, (t4 - t1) - (T3 - T2)]
+
+    def sync(self):   # query the server now; True if it answered
+        best = None
+        s = None
+        try:
+            addr = socket.getaddrinfo(self.host, self.port)[0][-1]
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.settimeout(self.timeoutMs / 1000)
+            for i in range(self.samples):
+                r = self._query(s, addr)
+                if best is None or r[2] < best[2]:
+                    best = r
+        except OSError:
+            pass                   # no answer: keep what came before it
+        if s is not None:
+            s.close()
+        if best is None:
+            self.fails += 1
+            self.next = self.local() + self.minPoll * 1000
+            return False
+        self._add(best)
+        return True
+
+    def _add(self, pt):   # a new point: fit the frequency, then step or slew the clock to the fit
+        pts = self.pts
+        pts.append(pt)
+        if len(pts) > self.keep:
+            pts.pop(0)
+        n = len(pts)
+        if n >= 2 and pts[-1][0] - pts[0][0] >= self.minPoll * 1000:
+            x0 = pts[0][0]; y0 = pts[0][1]                    # floats only of small numbers, from here
+            xm = sum(p[0] - x0 for p in pts) / n
+            ym = sum(p[1] - y0 for p in pts) / n
+            sxx = sxy = 0.0
+            for p in pts:
+                x = p[0] - x0 - xm
+                sxx += x * x
+                sxy += x * (p[1] - y0 - ym)
+            self.f = sxy / sxx
+        else:
+            x0 = pt[0]; y0 = pt[1]
+            xm = ym = 0.0
+        L = self.local()
+        fit = L + y0 + int(ym + self.f * (L - x0 - xm))       # UTC now, by the fit
+        now = self._at(L)
+        theta = fit - now
+        self.offset = theta
+        self.delay = pt[2]
+        self.syncs += 1
+        if not self.synced or abs(theta) > self.stepMs:
+            self.cBase = fit; self.fC = self.f; self.slewEnd = None
+            self.steps += 1
+            self.synced = True
+        else:
+            rate = theta / (self.pollSec * 1000)
+            rate = max(-self.maxSlew, min(self.maxSlew, rate))
+            self.cBase = now; self.fC = self.f + rate
+            self.slewEnd = L + int(theta / rate) if rate else None
+        self.LBase = L
+        if abs(theta) < self.okMs and n >= 2:
+            self.pollSec = min(2 * self.pollSec, self.maxPoll)
+        else:
+            self.pollSec = max(self.pollSec // 2, self.minPoll)
+        self.next = L + self.pollSec * 1000
+
+    def poll(self):   # sync if it is time; True if it did and it worked
+        if self.local() >= self.next:     # plain ints: L does not wrap
+            return self.sync()
+        return False
+
+    def report(self):
+        return "# NTP offset %d ms, delay %d ms, drift %+.2f ppm, poll %d s, %d syncs, %d fails, %d steps" % (
+            self.offset, self.delay, self.f * 1e6, self.pollSec, self.syncs, self.fails, self.steps)
+
+# -----------------------------------------
+if __name__ == "__main__":
+    import math
+    import random
+    import sys
+    import threading
+
+    class world:   # true time, s, for the server, the device clock and the run
+        def __init__(self):
+            self.true = 1619445791.0
+
+    class standIn:   # NTP server on UDP: one-way delays of base + exponential(jitter) s, and lost packets
+        def __init__(self, w, base=1e-3, jitter=0.5e-3, loss=0.0, seed=1):
+            self.w = w
+            self.base = base; self.jitter = jitter; self.loss = loss
+            self.rng = random.Random(seed)
+            self.s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.s.bind(("127.0.0.1", 0))
+            self.port = self.s.getsockname()[1]
+            threading.Thread(target=self.serve, daemon=True).start()
+
+        def serve(self):
+            while True:
+                q, addr = self.s.recvfrom(48)
+                rng = self.rng
+                d1 = self.base + rng.expovariate(1 / self.jitter)
+                d2 = self.base + rng.expovariate(1 / self.jitter)
+                if rng.random() < self.loss:
+                    continue
+                T2 = self.w.true + d1                # the device waits in recv() meanwhile
+                T3 = T2 + 30e-6
+                self.w.true = T3 + d2
+                r = bytearray(48)
+                r[0] = 0x1c; r[1] = 1               # version 3, server; stratum 1
+                r[24:32] = q[40:48]                  # originate: the client's transmit
+                for i, T in ((32, T2), (40, T3)):
+                    s = T + NTP_DELTA
+                    struct.pack_into("!II", r, i, int(s), int((s % 1) * (1 << 32)))
+                self.s.sendto(r, addr)
+
+    def crystal(w, ppm=40.0, tempPpm=2.0, tempHours=6.0):   # device ticks_ms: off by ppm, plus a swing
+        t0 = w.true
+        om = 2 * math.pi / (tempHours * 3600)
+        def ticks():
+            s = w.true - t0
+            return int(1000 * (s * (1 + ppm * 1e-6) - tempPpm * 1e-6 / om * (math.cos(om * s) - 1))) + 12345
+        return ticks
+
+    def trial(name, hours, **kw):
+        w = world()
+        srv = standIn(w, **kw)
+        ntp = ntpSync("127.0.0.1", srv.port, timeoutMs=50, ticks=crystal(w))
+        assert ntp.sync()
+        t0 = w.true
+        once = ntp.ms() - ntp.local()                        # one sync at boot, then the crystal
+        err = []; errOnce = []
+        last = 0
+        while w.true - t0 < hours * 3600:
+            w.true += 1.0
+            ntp.poll()
+            if int(w.true - t0) % 10 == 0:
+                m = ntp.ms()
+                assert m >= last                             # never back
+                last = m
+                err.append(m / 1000 - w.true)
+                errOnce.append((ntp.local() + once) / 1000 - w.true)
+        skip = len(err) // 12                                # after the first hour or so
+        e = err[skip:]
+        rms = math.sqrt(sum(x * x for x in e) / len(e))
+        print("%-30s rms %6.1f ms, max %6.1f ms; one sync at boot: %7.0f ms after %g h;  %s"
+              % (name, rms * 1e3, max(abs(x) for x in e) * 1e3, errOnce[-1] * 1e3, hours, ntp.report()[2:]))
+        return rms, max(abs(x) for x in e), ntp
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--sim":
+        hours = float(sys.argv[2]) if len(sys.argv) > 2 else 24.0
+        tm = time.perf_counter()
+        rms, mx, ntp = trial("LAN: 1 ms + 0.5 ms jitter", hours)
+        assert rms < 5e-3 and mx < 10e-3 and ntp.steps == 1
+        rms, mx, ntp = trial("WiFi: 3 ms + 20 ms jitter, 5% lost", hours, base=3e-3, jitter=20e-3, loss=0.05)
+        assert rms < 10e-3 and mx < 30e-3 and ntp.steps == 1
+        print("%.1f s" % (time.perf_counter() - tm))
@@ -0,0 +1,210 @@
+# Decimating CSV output stage for the Pico capture loops
+# MicroPython for Raspberry Pi Pico (RP2040); runs under CPython too
+# Lines are built as ASCII digits in one preallocated bytearray, and go out
+# with a single write per batch instead of a print() per edge.
+
+"""
+Which records become lines is set by the policy:
+    EVERY   every n-th record
+    CHANGE  when |key - key at the last line| > k   (key: encoder position)
+    TIMED   the first record after each 'ms' milliseconds
+Lines wait in the buffer until it is nearly full, or until the oldest has
+waited flushMs; call poll() when the loop is idle so they still go out
+when records stop.  'seen' and 'lines' count records in and lines out.
+
+    st = outStage(EVERY, n=8)
+    ...
+    if ring.avail():
+        ...
+        st.put(dec.pos, dec.pos, sum)     # key, then the values for the line
+    else:
+        st.poll()
+
+    mpremote run OutStage.py | grep '^#'    (edge-rate ceiling, on the Pico)
+    python3 OutStage.py > /dev/null         (the same on the host: '#' lines on stderr)
+"""
+
+import sys
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:          # CPython
+    import time
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+    def ticks_diff(a, b):
+        return a - b
+
+EVERY = 0
+CHANGE = 1
+TIMED = 2
+
+LINEMAX = 64                 # room kept for one more line: up to 4 values
+
+class outStage:
+
+    def __init__(self, policy=EVERY, n=1, k=0, ms=1000, flushMs=200, size=1024, out=None):
+        if out is None:
+            out = getattr(sys.stdout, "buffer", sys.stdout)  # USB serial, raw bytes
+        self.out = out
+        self.policy = policy
+        self.n = n               # EVERY: one line per n records
+        self.k = k               # CHANGE: line when key moves by more than k
+        self.ms = ms             # TIMED: one line per ms milliseconds
+        self.flushMs = flushMs
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.dig = bytearray(12) # digits of one number, in reverse
+        self.used = 0            # bytes waiting in buf
+        self.left = n            # EVERY: records until the next line
+        self.lastKey = None      # CHANGE: key at the last line
+        self.tLine = ticks_ms()  # TIMED: time of the last line
+        self.tFirst = 0          # time the oldest waiting line was added
+        self.seen = 0            # records offered
+        self.lines = 0           # lines put in the buffer
+        self.writes = 0          # writes to out
+
+    def due(self, key):   # does this record make a line, under the policy?
+        p = self.policy
+        if p == EVERY:
+            self.left -= 1
+            if self.left > 0:
+                return False
+            self.left = self.n
+            return True
+        if p == CHANGE:
+            if (self.lastKey is not None) and abs(key - self.lastKey) <= self.k:
+                return False
+            self.lastKey = key
+            return True
+        t = ticks_ms()
+        if ticks_diff(t, self.tLine) < self.ms:
+            return False
+        self.tLine = t
+        return True
+
+    def put(self, key, a, b=None, c=None, d=None):
+        # offer one record; if the policy takes it, add the line "a,b,c,d"
+        self.seen += 1
+        if self.due(key):
+            self.line(a, b, c, d)
+            return True
+        if self.used and ticks_diff(ticks_ms(), self.tFirst) >= self.flushMs:
+            self.flush()
+        return False
+
+    def line(self, a, b=None, c=None, d=None):   # add a line of integers, no policy
+        if self.used == 0:
+            self.tFirst = ticks_ms()
+        self.num(a)
+        for v in (b, c, d):
+            if v is not None:
+                self.buf[self.used] = 44       # ','
+                self.used += 1
+                self.num(v)
+        self.buf[self.used] = 10               # '\n'
+        self.used += 1
+        self.lines += 1
+        if self.used > len(self.buf) - LINEMAX:
+            self.flush()
+
+    def num(self, v):     # ASCII digits of int v, straight into the buffer
+        buf = self.buf
+        i = self.used
+        v = int(v)
+        if v < 0:
+            buf[i] = 45                        # '-'
+            i += 1
+            v = -v
+        dig = self.dig
+        j = 0
+        while True:
+            dig[j] = 48 + v % 10
+            j += 1
+            v //= 10
+            if v == 0:
+                break
+        while j:
+            j -= 1
+            buf[i] = dig[j]
+            i += 1
+        self.used = i
+
+    def text(self, s):    # a header or '#' comment line, sent at once
+        self.flush()
+        self.out.write(s.encode() + b"\n" if isinstance(s, str) else s + b"\n")
+        self.writes += 1
+
+    def poll(self):       # from the idle branch of the loop: send lines that waited flushMs
+        if self.used and ticks_diff(ticks_ms(), self.tFirst) >= self.flushMs:
+            self.flush()
+
+    def flush(self):
+        if self.used:
+            self.out.write(self.mv[:self.used])
+            self.used = 0
+            self.writes += 1
+
+# -----------------------------------------
+if __name__ == "__main__":   # edge-rate ceiling: print() per edge vs. the output stage
+    try:
+        from time import ticks_us
+    except ImportError:
+        import time
+        def ticks_us():
+            return int(time.perf_counter() * 1e6)
+    N = 20000
+
+    def note(s):          # results go where the per-edge lines do not
+        err = getattr(sys, "stderr", None)
+        if err is not None and err is not sys.stdout:
+            err.write(s + "\n")
+        else:
+            print(s)
+
+    def timeIt(emit):   # N records of a quadrature walk, as QuadEnc-Full.py makes them
+        pos = 0
+        t0 = ticks_us()
+        for i in range(N):
+            pos += 1 if (i >> 10) & 1 else -1
+            emit(pos, 20000 + (i & 63))
+        us = ticks_us() - t0
+        return us
+
+    def printEach(pos, sum):
+        print("{0:6d},{1:8d}".format(pos, sum))
+
+    us = timeIt(printEach)
+    note("# print() per edge:          %7.0f edges/s" % (N / us * 1e6))
+    for name, st in (("stage, every edge", outStage(EVERY, n=1)),
+                     ("stage, every 8th", outStage(EVERY, n=8)),
+                     ("stage, |dpos| > 16", outStage(CHANGE, k=16)),
+                     ("stage, every 100 ms", outStage(TIMED, ms=100))):
+        def emit(pos, sum):
+            st.put(pos, pos, sum)
+        us = timeIt(emit)
+        st.flush()
+        note("# %-26s %7.0f edges/s  (%d lines, %d writes)" % (name + ":", N / us * 1e6, st.lines, st.writes))
+
+    # the bytes must be what print() would have sent
+    class sink:
+        def __init__(self):
+            self.data = bytearray()
+        def write(self, b):
+            self.data += b
+    s = sink()
+    st = outStage(EVERY, n=3, size=256, out=s)
+    ref = []
+    for i in range(1000):
+        v = (i * 7919) % 20011 - 10000
+        st.put(v, v, i, -i if i & 1 else None)
+        if i % 3 == 2:
+            ref.append("%d,%d,%d" % (v, i, -i) if i & 1 else "%d,%d" % (v, i))
+    st.flush()
+    assert bytes(s.data) == ("\n".join(ref) + "\n").encode()
+    s = sink()
+    st = outStage(CHANGE, k=2, out=s)
+    for pos in (0, 1, 2, 3, 2, 0, -1, 5, 5):
+        st.put(pos, pos)
+    st.flush()
+    assert bytes(s.data) == b"0\n3\n0\n5\n", bytes(s.data)
+    note("# output matches print() formatting")
@@ -10,9 +10,12 @@ from machine import Pin, mem32
 from rp2 import asm_pio, StateMachine, PIO
 from time import ticks_ms, ticks_us, ticks_diff, sleep, sleep_ms, sleep_us
 import array
+from PicoRing import ringBuf  # circular buffer shared with counter_handler
+from PiDrive import piDrive    # PI loop for the drive pulse length (PendulumSim.py tunes it)
 import math   # for sqrt in standard deviation
 
 MFREQ = 200_000_000  # CPU frequency in Hz (typ. 125 MHz; Overclock to 250 MHz)
+PIODRIVE = True      # drive pulse from a PIO one-shot; False: out1 + sleep_us, which blocks the loop
 VERSION = "Pendulum v2 06-April-2021 J.Beale"
 
 # -----------------------------------------
@@ -61,7 +64,7 @@ def trigger():
     set(pins, 0)     # and return it low
                      # and loop around again
 
-@asm_pio(sideset_init=PIO.OUT_LOW)
+@asm_pio(sideset_init=PIO.OUT_LOW, fifo_join=PIO.JOIN_RX)  # 8-word RX FIFO: room for 3 pairs + 1
 def counter():    
     wait(1, pin, 2)    # initial synchronization with edge flag
     
@@ -84,16 +87,26 @@ def counter():
     irq(noblock, 0x10)   # signal 2 words of data are now ready to read    
     wrap()               # ----- repeat forever
 
-ASIZE = 1023                         # size of circular data buffers (dataT, dataB)
-dataT = array.array("I", [0]*ASIZE)  # store UINT32 timing data
-dataB = array.array("B", [0]*ASIZE)  # store UCHAR bits (Ch.A, Ch.B values)
-dIdx = 0                         # curent index into DATA array
+# one-shot drive pulse: at 1 MHz, a word of N > 0 puts the pin high for N+2 us
+@asm_pio(set_init=PIO.OUT_LOW)
+def pulse():
+    pull()                 # wait for the next pulse length
+    mov(x, osr)
+    jmp(not_x, "done")     # 0: no pulse this swing
+    set(pins, 1)
+    label("on")
+    jmp(x_dec, "on")       # 1 us per count
+    set(pins, 0)
+    label("done")
+
+def drivePulse(sm, us):    # start a pulse of 'us' microseconds; returns at once
+    if us > 2:
+        sm.put(us - 2)
+
+ring = ringBuf(1024)   # circular buffer of (Ch.A,Ch.B bits, UINT32 timing) records
 
 def counter_handler(sm):
-    global dIdx
-    dataB[dIdx] = sm.get() & 0b11    # read chA,chB
-    dataT[dIdx] = sm.get() + 4       # read timer value
-    dIdx = (dIdx + 1) % ASIZE        # increment index in circular buffer
+    ring.drain(sm)   # all waiting (chA,chB levels, timer value + loop overhead) pairs
     
 # --------------------------------------------
 def main():
@@ -102,7 +115,6 @@ def main():
   global posEnc
   global luTable   # encoder output lookup table
   global led1
-  global dIdx      # index into data buffers, updated in interrupt routine
   
   gSize = 20       # group sample size for std.dev calculation
   deltaA = array.array("l", [0]*gSize)  # store INT32 timing deltas
@@ -143,6 +155,9 @@ def main():
   sm4.irq(counter_handler)
 
   sm4.active(1)
+  if PIODRIVE:
+      drv = StateMachine(5, pulse, freq=1_000_000, set_base=out1)  # same PIO block as sm4
+      drv.active(1)
 
   flagWidth = 5.0 * 1E-3   # width of interrupter flag, in meters
   countsPerSec = smf / 2   # count rate is 1/2 of state machine frequency
@@ -154,43 +169,46 @@ def main():
   durStart = 15_000   # initial microseconds duration of drive pulse
   durMax =  250_000    # maximum allowed drive period
   v1Setpoint = 0.025 # target velocity (m/s)
-  intTerm = 0        # integral term correction of drive output
   kp = 4E7           # proportional control constant (was kp,ki: 2E7,5E4)
   ki = 5E4           # integral control constant
+  pi = piDrive(kp, ki, 0.0, v1Setpoint, durStart, durMax)
   
   
   rCount = 0  # total number of reading pairs received
-  i = 0  # starting index into data arrays
   j = 0  # index into deltaA[]
 
   #driveStart()  # get pendulum swinging enough to read position output
 
   while True:                 # get the first 4 readings, both high & low
-      if (dIdx != i):  # any new data in the buffer?
-        if (dataB[i] & 0x01):   # is input A high or low level now?
-            aHigh = dataT[i]
+      if ring.avail():  # any new data in the buffer?
+        bits, tval = ring.get()
+        if (bits & 0x01):   # is input A high or low level now?
+            aHigh = tval
             aLowOld = aLow
         else:
-            aLow = dataT[i]
+            aLow = tval
             aHighOld = aHigh
-        i = (i+1) % ASIZE
         if (aHighOld > 0) and (aLowOld > 0):
             aSumOld = aHigh + aLow
             v1 = flagWidth / (aLow / countsPerSec)  # velocity = distance / time
             v2 = v1
-            vErrorOld = ((v1+v2)/2) - v1Setpoint
+            pi.prime(v1, v2)
             dV1f = 0
             dV2f = 0
             v1Old = v1; v2Old = v2  # remember previous velocity
             break
 
   while True:  # all the action is in the interrupt routine
-      if (dIdx != i):  # any new data in the buffer?
-          if (dataB[i] & 0x01):   # is input A high or low level now?
-              aHigh = dataT[i]
+      if ring.avail():  # any new data in the buffer?
+          bits, tval = ring.get()
+          n = ring.lost()
+          if n:
+              print("# %d edges lost: buffer full" % n)
+          if (bits & 0x01):   # is input A high or low level now?
+              aHigh = tval
           else:
               rCount += 1
-              aLow = dataT[i]
+              aLow = tval
               aSum = aHigh + aLow
               v1 = flagWidth / (aLow / countsPerSec)  # velocity = distance / time
               v2 = flagWidth / (aLowOld / countsPerSec)  # velocity = distance / time
@@ -203,23 +221,17 @@ def main():
                   dV1f = dV1f * (1.0-f) + (f * dV1)  # low-pass filtered version of dV1
                   dV2f = dV2f * (1.0-f) + (f * dV2)  # low-pass filtered version of dV1
                   led1.toggle()
-                  out1.on()
-                  vError = ((v1+v2)/2) - v1Setpoint
-                  dvError = (vError - vErrorOld)*1E3
-                  vErrorOld = vError
-                  intTerm += int(vError * ki)  # integral control
-                  driveDur = durStart - int(vError * kp) - intTerm
-                  if driveDur > durMax:
-                      driveDur = durMax
-                  
-                  if driveDur < 0:
-                      driveDur = 0
-                  sleep_us(driveDur) # @ v1=.0234, 25:+8u, 0:-20u (per cycle)
-                                     # @ v1=.0284, 20:-4u, 0:-22u
-                  out1.off()
+                  driveDur = pi.update(v1, v2)  # @ v1=.0234, 25:+8u, 0:-20u (per cycle)
+                                                # @ v1=.0284, 20:-4u, 0:-22u
+                  if PIODRIVE:
+                      drivePulse(drv, driveDur) # the loop carries on while the coil is on
+                  else:
+                      out1.on()
+                      sleep_us(driveDur)        # blocks: edges wait in the ring meanwhile
+                      out1.off()
                   print("%d," % msNow,end="")
                   print("{0:8d},{1:5d},{2:9.6f},{3:9.6f},{4:d},{5:5.3f},{6:d}"
-                          .format(aSum,aDiff+cOffset,v1,v2,intTerm,dvError,driveDur),end="")
+                          .format(aSum,aDiff+cOffset,v1,v2,pi.intTerm,pi.dvError,driveDur),end="")
                   deltaA[j] = aDiff       # store in array for stdev calc
                   v1Old = v1; v2Old = v2  # remember previous velocity
                   #j += 1
@@ -233,7 +245,6 @@ def main():
               aHighOld = aHigh
               aLowOld = aLow
               aSumOld = aSum
-          i = (i+1) % ASIZE
 
 # ---------------
 main()
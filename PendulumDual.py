@@ -12,6 +12,7 @@ from machine import Pin, mem32
 from rp2 import asm_pio, StateMachine, PIO
 from time import ticks_ms, ticks_us, ticks_diff, sleep, sleep_ms, sleep_us, localtime, time
 import array
+from PicoRing import ringBuf  # circular buffer shared with counter_handler
 import math   # for sqrt in standard deviation
 
 MFREQ = 200_000_000  # CPU frequency in Hz (typ. 125 MHz; Overclock to 250 MHz)
@@ -64,7 +65,7 @@ def trigger():
     set(pins, 0)     # and return it low
                      # and loop around again
 
-@asm_pio(sideset_init=PIO.OUT_LOW)
+@asm_pio(sideset_init=PIO.OUT_LOW, fifo_join=PIO.JOIN_RX)  # 8-word RX FIFO: room for 3 pairs + 1
 def counter():    
     wait(1, pin, 2)    # initial synchronization with edge flag
     
@@ -87,19 +88,13 @@ def counter():
     irq(noblock, 0x10)   # signal 2 words of data are now ready to read    
     wrap()               # ----- repeat forever
 
-ASIZE = 1023                         # size of circular data buffers (dataT, dataB)
-dataT = array.array("I", [0]*ASIZE)  # store UINT32 timing data
-dataB = array.array("B", [0]*ASIZE)  # store UCHAR bits (Ch.A, Ch.B values)
-dIdx = 0                         # curent index into DATA array
+ring = ringBuf(1024)   # circular buffer of (Ch.A,Ch.B bits, UINT32 timing) records
 bufT = array.array("I", [0]*4)      # last 4 values of timer data
 bufC = array.array("I", [0]*4)      # count of last four sets (full-swing groups)
 
 
 def counter_handler(sm):
-    global dIdx
-    dataB[dIdx] = sm.get() & 0b11    # read chA,chB
-    dataT[dIdx] = sm.get() + 4       # read timer value
-    dIdx = (dIdx + 1) % ASIZE        # increment index in circular buffer
+    ring.drain(sm)   # all waiting (chA,chB levels, timer value + loop overhead) pairs
     
 # --------------------------------------------
 def main():
@@ -108,7 +103,6 @@ def main():
   global posEnc
   global luTable   # encoder output lookup table
   global led1
-  global dIdx      # index into data buffers, updated in interrupt routine
   
   gSize = 20       # group sample size for std.dev calculation
   deltaA = array.array("f", [0]*gSize)  # store float time ratios
@@ -173,7 +167,6 @@ def main():
   f = 0.1            # low-pass filter constant
   
   rCount = 0  # total number of reading pairs received
-  i = 0  # starting index into data arrays
   j = 0  # index into deltaA[]
   k = 0  # index into bufC[]
   aSum = 0  # how many counts in a full swing
@@ -183,16 +176,16 @@ def main():
   # driveStart()  # get pendulum swinging enough to read position output
 
   while True:                 # get the first 4 readings, both high & low
-      if (dIdx != i):  # any new data in the buffer?
-        flag = ~(dataB[i]) & 0x03 # in binary: 10 @ left, 01 @ right
+      if ring.avail():  # any new data in the buffer?
+        bits, tval = ring.get()
+        flag = ~bits & 0x03 # in binary: 10 @ left, 01 @ right
         # print("{0:02b}".format(flag),end=", ")
-        if (dataB[i] & 0x01):   # is input A high or low level now?
-            aHigh = dataT[i]
+        if (bits & 0x01):   # is input A high or low level now?
+            aHigh = tval
             aLowOld = aLow
         else:
-            aLow = dataT[i]
+            aLow = tval
             aHighOld = aHigh
-        i = (i+1) % ASIZE
         if (aHighOld > 0) and (aLowOld > 0):
             aSumOld = aHigh + aLow
             v1 = flagWidth / (aLow / countsPerSec)  # velocity = distance / time
@@ -206,10 +199,13 @@ def main():
 
   eCount = 0 # event counter
   while True:  # all the action is in the interrupt routine
-      if (dIdx != i):  # any new data in the buffer?
-          flag = ~(dataB[i]) & 0x03 # in binary: 10 @ left, 01 @ right
+      if ring.avail():  # any new data in the buffer?
+          bits, tval = ring.get()
+          n = ring.lost()
+          if n:
+              print("# %d edges lost: buffer full" % n)
+          flag = ~bits & 0x03 # in binary: 10 @ left, 01 @ right
           #print("{0:02b}".format(flag),end=", ")
-          tval = dataT[i]
           aSum += tval
           bufT[eCount%4] = tval
           eCount += 1
@@ -246,11 +242,11 @@ def main():
             aSum = 0
             eCount = 0
           """
-          if (dataB[i] & 0x01):   # is input A high or low level now?
-              aHigh = dataT[i]
+          if (bits & 0x01):   # is input A high or low level now?
+              aHigh = tval
           else:
               rCount += 1
-              aLow = dataT[i]
+              aLow = tval
               aSum = aHigh + aLow
               v1 = flagWidth / (aLow / countsPerSec)  # velocity = distance / time
               v2 = flagWidth / (aLowOld / countsPerSec)  # velocity = distance / time
@@ -300,7 +296,6 @@ def main():
               aLowOld = aLow
               aSumOld = aSum
           """
-          i = (i+1) % ASIZE
 
 # ---------------
 main()
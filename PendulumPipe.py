@@ -0,0 +1,307 @@
+# Python3 host code: streaming analysis of the pendulum loggers' output
+# reads PendulumDual.py or Pendulum6.py lines as they come (or from a log),
+# one full swing per line, and keeps running period, amplitude, Q and the
+# drive/period correlation over the last 'window' swings, O(1) per line
+
+# PendulumDual.py   msec,t00,t10,t20,t11,diff,sum     (7 columns)
+#    t00..t11 are the 4 edge intervals of one swing, sum = period, in counts;
+#    t00, t20: time beyond each sensor, so with sensors at +/- xSensor,
+#    amplitude A = xSensor / cos(pi * t / T); without xSensor it is in units of xSensor.
+#    'diff' (filtered t10 - t11: crossing time asymmetry) stands in for the drive phase
+# Pendulum6.py      ms,aSum,aDiff,v1,v2,intTerm,dvError,driveDur   (8 columns)
+#    aSum is a half swing in counts, v1 v2 the flag speeds (m/s) at the bottom,
+#    so A = v * T / (2 pi) meters at the flag; driveDur (us) is the drive
+# Lines from Host_Log_Pico.py ('date, epoch, board, <line>', or 'date, epoch, <line>'
+# from before the board column) are taken as well.
+
+# Q from the amplitude decay: A(n) = A0 * exp(-pi * n / Q) over n swings, so
+# Q = -pi / (slope of ln A per swing); a driven pendulum at steady state shows inf.
+
+# python3 PendulumPipe.py pLog.csv          (a log file; '-' reads stdin as it arrives)
+# python3 PendulumPipe.py --bench           (a synthetic week-long log: speed and checks)
+
+import math
+import sys
+import time
+
+COUNTRATE = 100e6      # PIO counts/sec: 200 MHz, 2 cycles per count
+DUAL = 7               # formats, by column count
+SINGLE = 8
+
+# ---------------------------------------------
+class rollStat:   # mean and standard deviation of the last n values, O(1) per value
+
+    def __init__(self, n):
+        self.n = n
+        self.v = [0.0] * n
+        self.i = 0             # next slot
+        self.cnt = 0
+        self.ref = None        # sums are of v - ref, so a 1 s period keeps its ns digits
+        self.s = 0.0
+        self.s2 = 0.0
+
+    def add(self, v):
+        if self.ref is None:
+            self.ref = v
+        old = self.v[self.i] - self.ref
+        self.v[self.i] = v
+        self.i += 1
+        if self.cnt < self.n:
+            self.cnt += 1
+            old = 0.0
+        if self.i == self.n:   # once per window: new ref, exact sums, no rounding build-up
+            self.i = 0
+            self.ref = sum(self.v) / self.n
+            self.s = sum(a - self.ref for a in self.v)
+            self.s2 = sum((a - self.ref) ** 2 for a in self.v)
+        else:
+            d = v - self.ref
+            self.s += d - old
+            self.s2 += d * d - old * old
+
+    def mean(self):
+        return self.ref + self.s / self.cnt if self.cnt else math.nan
+
+    def std(self):
+        if self.cnt < 2:
+            return math.nan
+        m = self.s / self.cnt
+        return math.sqrt(max(self.s2 / self.cnt - m * m, 0.0) * self.cnt / (self.cnt - 1))
+
+class rollLine:   # least-squares line and correlation of y on x over the last n points, O(1)
+
+    def __init__(self, n):
+        self.n = n
+        self.x = [0.0] * n
+        self.y = [0.0] * n
+        self.i = 0
+        self.cnt = 0
+        self.rx = self.ry = None   # sums are of x - rx and y - ry, as in rollStat
+        self.sx = self.sy = self.sxx = self.sxy = self.syy = 0.0
+
+    def add(self, x, y):
+        if self.rx is None:
+            self.rx = x; self.ry = y
+        i = self.i
+        ox = self.x[i] - self.rx; oy = self.y[i] - self.ry
+        self.x[i] = x; self.y[i] = y
+        self.i = i + 1
+        if self.cnt < self.n:
+            self.cnt += 1
+            ox = oy = 0.0
+        if self.i == self.n:
+            self.i = 0
+            self._resum()
+        else:
+            x -= self.rx; y -= self.ry
+            self.sx += x - ox; self.sy += y - oy
+            self.sxx += x * x - ox * ox
+            self.sxy += x * y - ox * oy
+            self.syy += y * y - oy * oy
+
+    def _resum(self):          # new refs and exact sums, once per window
+        self.rx = sum(self.x) / self.n; self.ry = sum(self.y) / self.n
+        X = [a - self.rx for a in self.x]; Y = [b - self.ry for b in self.y]
+        self.sx = sum(X); self.sy = sum(Y)
+        self.sxx = sum(a * a for a in X)
+        self.sxy = sum(a * b for a, b in zip(X, Y))
+        self.syy = sum(b * b for b in Y)
+
+    def _var(self):
+        c = self.cnt
+        vx = self.sxx - self.sx * self.sx / c
+        vy = self.syy - self.sy * self.sy / c
+        cxy = self.sxy - self.sx * self.sy / c
+        return vx, vy, cxy
+
+    def slope(self):
+        if self.cnt < 3:
+            return math.nan
+        vx, vy, cxy = self._var()
+        return cxy / vx if vx > 0 else math.nan
+
+    def corr(self):
+        if self.cnt < 3:
+            return math.nan
+        vx, vy, cxy = self._var()
+        return cxy / math.sqrt(vx * vy) if vx > 0 and vy > 0 else math.nan
+
+# ---------------------------------------------
+class penPipe:
+
+    def __init__(self, window=64, countRate=COUNTRATE, xSensor=None):
+        self.countRate = countRate
+        self.xSensor = xSensor     # PendulumDual: sensor offset from center, m (None: A in units of it)
+        self.fmt = None            # DUAL or SINGLE, from the header; else by column count
+        self.per = rollStat(window)
+        self.amp = rollStat(window)
+        self.decay = rollLine(window)  # ln A against swing number
+        self.drive = rollLine(window)  # period against drive
+        self.rows = 0
+        self.bad = 0               # lines that did not parse
+        self.last = None           # (swing, T, A, drive) of the last line
+
+    def feed(self, line):   # one line (bytes or str); returns True when it was a data line
+        if isinstance(line, bytes):
+            line = line.decode("ascii", "replace")
+        f = line.split(",")
+        if len(f) > 3 and "_" in f[0] and ":" in f[0]:   # Host_Log_Pico.py prefix
+            b = f[2].strip()
+            f = f[2:] if b[:1] == "#" or b.lstrip("-").isdigit() else f[3:]   # older logs: no board column
+        if not f or f[0].lstrip()[:1] in ("#", ""):
+            return False
+        if not f[0].strip().lstrip("-").isdigit():        # header line: names the format
+            h = ",".join(f)
+            if "t00" in h:
+                self.fmt = DUAL
+            elif len(f) == SINGLE:
+                self.fmt = SINGLE
+            return False
+        try:
+            if len(f) == DUAL and self.fmt != SINGLE:
+                self.dual(f)
+            elif len(f) == SINGLE:
+                self.single(f)
+            else:
+                self.bad += 1
+                return False
+        except ValueError:
+            self.bad += 1
+            return False
+        return True
+
+    def dual(self, f):
+        t00 = int(f[1]); t20 = int(f[3]); diff = float(f[5]); s = int(f[6])
+        if s <= 0:
+            raise ValueError("empty swing")
+        T = s / self.countRate
+        c = math.cos(math.pi * (t00 + t20) / (2.0 * s))   # mean time beyond a sensor, as phase
+        A = (self.xSensor or 1.0) / c if c > 0 else math.nan
+        self.add(T, A, diff)
+
+    def single(self, f):
+        T = 2 * int(f[1]) / self.countRate
+        v = (float(f[3]) + float(f[4])) / 2
+        self.add(T, v * T / (2 * math.pi), float(f[7]))
+
+    def add(self, T, A, d):
+        n = self.rows
+        self.rows = n + 1
+        self.per.add(T)
+        if A == A and A > 0:
+            self.amp.add(A)
+            self.decay.add(n, math.log(A))
+        self.drive.add(d, T)
+        self.last = (n, T, A, d)
+
+    def q(self):
+        s = self.decay.slope()
+        if s != s:
+            return math.nan
+        return -math.pi / s if s < 0 else math.inf
+
+    def summary(self):   # swings, mean period, period std, mean amplitude, Q, drive/period correlation
+        return (self.rows, self.per.mean(), self.per.std(), self.amp.mean(), self.q(), self.drive.corr())
+
+def lines(src):   # lines of a file or stdin, as they arrive
+    if src == "-":
+        inp = sys.stdin.buffer
+        while True:
+            ln = inp.readline()
+            if not ln:
+                return
+            yield ln
+    else:
+        with open(src, "rb") as f:
+            for ln in f:
+                yield ln
+
+def run(src, every=1, window=64, xSensor=None, out=sys.stdout):
+    p = penPipe(window, xSensor=xSensor)
+    out.write("swings,period,periodStd,amplitude,Q,driveCorr\n")
+    live = src == "-"
+    for ln in lines(src):
+        if p.feed(ln) and p.rows % every == 0:
+            out.write("%d,%.7f,%.3g,%.6g,%.4g,%.3f\n" % p.summary())
+            if live:
+                out.flush()
+    return p
+
+# ---------------------------------------------
+def synthDual(fname, swings, Q=6000.0, T=1.0138, xs=0.02, A0=0.05, rng=None):
+    # a free-decaying swing with the period slightly amplitude-dependent, as PendulumDual.py logs it
+    import random
+    rng = rng or random.Random(1)
+    cr = COUNTRATE
+    with open(fname, "w") as f:
+        f.write("msec,t00,t10,t20,t11,diff,sum\n# synthetic\n")
+        A = A0; ms = 0
+        for n in range(swings):
+            Tn = T * (1 + (A / 1.0) ** 2 / 16)      # circular-error period growth
+            tb = Tn / math.pi * math.acos(xs / A)   # time beyond a sensor
+            tc = Tn / 2 - tb                        # crossing between the sensors
+            t = [round((tb + rng.gauss(0, 1e-6)) * cr), round((tc + rng.gauss(0, 1e-6)) * cr),
+                 round((tb + rng.gauss(0, 1e-6)) * cr), round((tc + rng.gauss(0, 1e-6)) * cr)]
+            f.write("%d,%d,%d,%d,%d, %d, %d\n" % (ms, t[0], t[1], t[2], t[3], t[1] - t[3], sum(t)))
+            ms += round(Tn * 1000)
+            A *= math.exp(-math.pi / Q)
+            if A < xs * 1.05:
+                A = A0                             # restarted by hand
+
+def synthSingle(fname, swings, rng=None):
+    # Pendulum6.py lines where the period follows the drive duration
+    import random
+    rng = rng or random.Random(2)
+    with open(fname, "w") as f:
+        f.write("ms, T, dT, v1, v2, v1f, v2f, drive\n")
+        for n in range(swings):
+            dur = 15000 + rng.gauss(0, 500)
+            half = 0.5069 + 2e-10 * dur + rng.gauss(0, 1e-7)
+            v = 0.025 + rng.gauss(0, 1e-5)
+            f.write("%d,%8d,%5d,%9.6f,%9.6f,%d,%5.3f,%d\n"
+                    % (n * 1014, round(half * COUNTRATE), 0, v, v, 0, 0.0, round(dur)))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        import os
+        import tempfile
+        week = 7 * 86400 // 1                            # one line per ~1 s swing
+        d = tempfile.mkdtemp()
+        fd = os.path.join(d, "dual.csv")
+        synthDual(fd, week, Q=6000.0)
+        sz = os.path.getsize(fd)
+        t0 = time.perf_counter()
+        p = run(fd, every=week, window=256, xSensor=0.02, out=open(os.devnull, "w"))
+        dt = time.perf_counter() - t0
+        print("week-long PendulumDual log: %d lines, %.1f MB in %.1f s (%.0f lines/s)"
+              % (p.rows, sz / 1e6, dt, p.rows / dt))
+        # Q and amplitude, from a short decaying run
+        synthDual(fd, 2000, Q=6000.0, xs=0.01)
+        p = run(fd, every=1000000, window=256, xSensor=0.01, out=open(os.devnull, "w"))
+        rows, T, sT, A, Q, c = p.summary()
+        Aexp = 0.05 * math.exp(-math.pi * (p.rows - 128.5) / 6000)   # mid-window
+        print("Q %.0f (6000), amplitude %.5f m (%.5f), period %.6f s" % (Q, A, Aexp, T))
+        assert abs(Q / 6000 - 1) < 0.05 and abs(A / Aexp - 1) < 1e-3
+        fs = os.path.join(d, "p6.csv")
+        synthSingle(fs, 5000)
+        p = run(fs, every=1000000, window=1024, out=open(os.devnull, "w"))
+        rows, T, sT, A, Q, c = p.summary()
+        cExp = (4e-10 * 500) / math.sqrt((4e-10 * 500) ** 2 + (2e-7) ** 2)
+        print("Pendulum6: drive/period correlation %.3f (%.3f), amplitude %.5f m" % (c, cExp, A))
+        assert abs(c - cExp) < 0.05
+        # the same lines through Host_Log_Pico.py, with and without the board column
+        synthDual(fd, 2000, Q=6000.0, xs=0.01)
+        want = run(fd, every=1000000, window=256, xSensor=0.01, out=open(os.devnull, "w")).summary()
+        for board in ("ttyACM0, ", ""):
+            with open(fd) as f, open(fs, "w") as g:
+                for ln in f:
+                    g.write("2021-04-26_14:03:11, 1619445791, %s%s" % (board, ln))
+            p = run(fs, every=1000000, window=256, xSensor=0.01, out=open(os.devnull, "w"))
+            assert p.summary() == want and p.bad == 0, (board, p.summary(), want)
+        print("Host_Log_Pico.py lines, with and without the board column: the same")
+        os.remove(fd); os.remove(fs); os.rmdir(d)
+    else:
+        xs = float(sys.argv[2]) if len(sys.argv) > 2 else None
+        p = run(sys.argv[1] if len(sys.argv) > 1 else "-", xSensor=xs)
+        if p.bad:
+            print("# %d lines not understood" % p.bad)
@@ -0,0 +1,191 @@
+# Python3 host code: damped-pendulum model for tuning Pendulum6.py's drive loop
+# the flag crosses one beam (GP16) twice a swing; the edge intervals go through
+# the same foreground logic as Pendulum6.py and the same piDrive controller
+# (PiDrive.py), and the drive pulse pushes the bob for driveDur microseconds
+
+# Between events (edges, drive on/off) the motion is a damped oscillator
+# under a constant push, solved in closed form, so edge times are exact to
+# a nanosecond and an hour of swings takes a few seconds.  Drive timing:
+#   pio    PIODRIVE = True: PIO one-shot, width exact to 1 us, loop never waits
+#   sleep  out1 + sleep_us(): width overruns by whatever interrupts the wait,
+#          and the loop is blocked for the whole pulse
+# Start latency, sleep overrun and per-swing disturbance are assumptions (see
+# the simPend() arguments), not measured on the board.
+
+# python3 PendulumSim.py            (both drive modes, default gains; PIO one-shot check)
+# python3 PendulumSim.py --tune     (kp, ki grid: settling and steady-state error)
+
+import math
+import random
+import sys
+from PiDrive import piDrive
+
+COUNTRATE = 100e6        # PIO counts/sec: 200 MHz, 2 cycles per count
+FLAG = 5.0e-3            # flag width, m (Pendulum6.py flagWidth)
+
+# ---------------------------------------------
+class pendulum:   # displacement x (m) of the flag from the beam, damped, with a push 'a' (m/s^2)
+
+    def __init__(self, period=1.0138, Q=2000.0, x=0.0, v=0.03):
+        self.w = 2 * math.pi / period
+        self.g = self.w / (2 * Q)                      # amplitude decay rate, 1/s
+        self.wd = math.sqrt(self.w ** 2 - self.g ** 2)
+        self.x = x; self.v = v; self.t = 0.0
+        self.a = 0.0
+
+    def at(self, dt):   # (x, v) after dt more seconds, push unchanged
+        xe = self.a / self.w ** 2
+        y0 = self.x - xe; v0 = self.v
+        e = math.exp(-self.g * dt)
+        c = math.cos(self.wd * dt); s = math.sin(self.wd * dt)
+        return (xe + e * (y0 * c + (v0 + self.g * y0) / self.wd * s),
+                e * (v0 * c - (self.w ** 2 * y0 + self.g * v0) / self.wd * s))
+
+    def advance(self, dt):
+        self.x, self.v = self.at(dt)
+        self.t += dt
+
+    def nextEdge(self, tEnd, half=FLAG / 2, step=2e-3):
+        # time of the next beam edge (|x| crossing half) before tEnd, or None; state moves to it
+        inside = abs(self.x) < half
+        while self.t < tEnd:
+            dt = min(step, tEnd - self.t)
+            x, v = self.at(dt)
+            if (abs(x) < half) != inside:
+                lo, hi = 0.0, dt
+                for _ in range(50):                    # bisect to well under a ns
+                    mid = (lo + hi) / 2
+                    if (abs(self.at(mid)[0]) < half) != inside:
+                        hi = mid
+                    else:
+                        lo = mid
+                self.advance(hi)
+                return self.t
+            self.advance(dt)
+        return None
+
+# ---------------------------------------------
+def simPend(swings=600, mode="pio", kp=4E7, ki=5E4, kd=0.0, setpoint=0.025, Q=2000.0,
+            accel=3.4e-3, latency=20e-6, latJit=10e-6, overrun=30e-6, kick=2e-6, seed=1):
+    # latency + U(0, latJit): edge to drive start (IRQ, ring, loop pass)
+    # overrun: sleep mode only, mean of the exponential extra pulse width
+    # kick: random velocity disturbance per swing, m/s rms
+    rng = random.Random(seed)
+    p = pendulum(Q=Q, x=-0.004, v=0.0)
+    pi = piDrive(kp, ki, kd, setpoint)
+    res = {"v": [], "dur": [], "period": [], "startJit": [], "widthErr": [], "blocked": 0.0}
+    tPrev = None
+    aHigh = aLow = aLowOld = aSumOld = 0
+    rCount = 0
+    primed = False
+    driveOn = driveOff = None
+    tEnd = swings * 1.0138
+    while p.t < tEnd:
+        tNext = min(t for t in (driveOn, driveOff, tEnd) if t is not None)
+        te = p.nextEdge(tNext)
+        if te is None:                     # reached a drive change, or the end
+            if driveOn is not None and p.t >= driveOn:
+                p.a = accel if p.v >= 0 else -accel   # push along the motion
+                driveOn = None
+            elif driveOff is not None and p.t >= driveOff:
+                p.a = 0.0
+                driveOff = None
+            continue
+        inside = abs(p.x) < FLAG / 2       # state after the edge
+        if tPrev is None:
+            tPrev = te
+            continue
+        tval = int(round((te - tPrev) * COUNTRATE))
+        tPrev = te
+        if inside:                         # the interval that ended was 'clear': input high
+            aHigh = tval
+            continue
+        rCount += 1                        # a transit ended: input was low for tval
+        aLow = tval
+        aSum = aHigh + aLow
+        if not primed:
+            if aLowOld:
+                pi.prime(FLAG / (aLow / COUNTRATE), FLAG / (aLowOld / COUNTRATE))
+                primed = True
+            aLowOld = aLow; aSumOld = aSum
+            continue
+        v1 = FLAG / (aLow / COUNTRATE)
+        v2 = FLAG / (aLowOld / COUNTRATE)
+        if rCount % 2 == 0:
+            dur = pi.update(v1, v2)
+            lat = latency + rng.uniform(0.0, latJit)
+            width = dur * 1e-6
+            if mode == "sleep" and dur:
+                width += rng.expovariate(1.0 / overrun)
+                res["blocked"] += width
+            if dur:
+                driveOn = te + lat
+                driveOff = driveOn + width
+            p.v += rng.gauss(0.0, kick)    # air, floor: once a swing
+            res["v"].append((v1 + v2) / 2)
+            res["dur"].append(dur)
+            res["period"].append((aSum + aSumOld) / COUNTRATE)
+            res["startJit"].append(lat)
+            res["widthErr"].append(width - dur * 1e-6)
+        aLowOld = aLow
+        aSumOld = aSum
+    return res
+
+def stats(r, setpoint=0.025):   # settling swing, and steady state over the second half
+    v = r["v"]
+    n = len(v)
+    settle = next((i for i in range(n) if all(abs(u / setpoint - 1) < 0.01 for u in v[i:])), None)
+    h = n // 2
+    def rms(a, m=None):
+        a = a[h:]
+        m = sum(a) / len(a) if m is None else m
+        return math.sqrt(sum((x - m) ** 2 for x in a) / len(a))
+    return {"swings": n, "settle": settle,
+            "vErr": rms(v, setpoint), "vMean": sum(v[h:]) / (n - h),
+            "dur": sum(r["dur"][h:]) / (n - h),
+            "periodJit": rms(r["period"]), "startJit": rms(r["startJit"]),
+            "widthJit": rms(r["widthErr"]), "blocked": r["blocked"] / n}
+
+def show(name, s):
+    print("%-6s settled at swing %s, v %.6f m/s (rms err %.2g), drive %.0f us; "
+          "period jitter %.0f ns, start jitter %.1f us, width jitter %.1f us, loop blocked %.1f ms/swing"
+          % (name, s["settle"], s["vMean"], s["vErr"], s["dur"], s["periodJit"] * 1e9,
+             s["startJit"] * 1e6, s["widthJit"] * 1e6, s["blocked"] * 1e3))
+
+def checkPulse():   # Pendulum6.py's pulse() program in the PIO simulator: width for a few lengths
+    import PioSim
+    progs = PioSim.loadPio("Pendulum6.py")
+    sim = PioSim.sim
+    sim.reset(200_000_000)
+    sm = PioSim.StateMachine(5, progs["pulse"], freq=1_000_000, set_base=PioSim.Pin(2))
+    sm.active(1)
+    for us in (3, 700, 15000, 250000):
+        sm.put(us - 2)                     # as drivePulse() does
+        t0 = t1 = None
+        tEnd = sim.seconds() + us * 1e-6 + 1e-3
+        while sim.seconds() < tEnd:
+            sim.run(1e-6)
+            high = (sim.pins >> 2) & 1
+            if high and t0 is None:
+                t0 = sim.seconds()
+            elif not high and t0 is not None and t1 is None:
+                t1 = sim.seconds()
+        assert t0 is not None and t1 is not None and abs((t1 - t0) * 1e6 - us) < 0.01, (us, t0, t1)
+    print("pulse(): widths 3, 700, 15000, 250000 us exact in the PIO simulator")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--tune":
+        print("    kp       ki   settle   rms vErr    drive us  period jitter ns")
+        for kp in (1E7, 2E7, 4E7, 8E7):
+            for ki in (0.0, 2.5E4, 5E4, 1E5):
+                s = stats(simPend(600, "pio", kp, ki))
+                print("%6.0e %8.2g %8s %10.2g %11.0f %16.0f"
+                      % (kp, ki, s["settle"], s["vErr"], s["dur"], s["periodJit"] * 1e9))
+    else:
+        sp = stats(simPend(600, "pio"))
+        ss = stats(simPend(600, "sleep"))
+        show("pio", sp)
+        show("sleep", ss)
+        assert sp["settle"] is not None and sp["settle"] < 300 and sp["blocked"] == 0.0
+        assert sp["widthJit"] < ss["widthJit"]
+        checkPulse()
@@ -0,0 +1,51 @@
+# Drive-pulse controller for the pendulum: the PI loop from Pendulum6.py
+# MicroPython for Raspberry Pi Pico (RP2040); runs under CPython too, so
+# PendulumSim.py tunes the very code that runs on the board
+
+"""
+Once per swing, from the two flag speeds v1, v2 (m/s), update() returns
+the drive-coil pulse length in microseconds:
+    vError   = (v1 + v2)/2 - setpoint
+    intTerm += int(vError * ki)
+    driveDur = durStart - int(vError * kp) - intTerm - int(dvError * kd)
+clipped to 0..durMax.  dvError is the change in vError since the last
+swing, in mm/s; kd = 0 (the default) is Pendulum6.py's PI loop exactly.
+
+    pi = piDrive(kp=4E7, ki=5E4)
+    pi.prime(v1, v2)             # first readings, before the loop
+    ...
+    dur = pi.update(v1, v2)
+    drivePulse(sm, dur)          # Pendulum6.py: PIO one-shot, does not block
+"""
+
+class piDrive:
+
+    def __init__(self, kp=4E7, ki=5E4, kd=0.0, setpoint=0.025, durStart=15_000, durMax=250_000):
+        self.kp = kp               # us per m/s of velocity error
+        self.ki = ki               # us per m/s, added up each swing
+        self.kd = kd               # us per mm/s of change in error
+        self.setpoint = setpoint   # target flag velocity, m/s
+        self.durStart = durStart   # us of drive with no error
+        self.durMax = durMax
+        self.intTerm = 0
+        self.vError = 0.0
+        self.dvError = 0.0
+        self.dur = durStart
+
+    def prime(self, v1, v2):   # error from the first readings, so dvError starts at 0
+        self.vError = (v1 + v2) / 2 - self.setpoint
+
+    def update(self, v1, v2):
+        vError = (v1 + v2) / 2 - self.setpoint
+        self.dvError = (vError - self.vError) * 1E3
+        self.vError = vError
+        self.intTerm += int(vError * self.ki)        # integral control
+        d = self.durStart - int(vError * self.kp) - self.intTerm
+        if self.kd:
+            d -= int(self.dvError * self.kd)
+        if d > self.durMax:
+            d = self.durMax
+        if d < 0:
+            d = 0
+        self.dur = d
+        return d
@@ -0,0 +1,179 @@
+# Python3 host code to keep track of Pico boards as they come and go
+# tested only from Raspberry Pi 4 host
+
+# picoWatcher calls back when a Pico serial port (VID 0x2e8a, PID 0x0005)
+# appears or disappears, and when a board shows up in bootloader mode
+# (PID 0x0003, the RPI-RP2 drive).  It wakes up on udev events if pyudev
+# is installed, else on inotify events for /dev, else it polls.
+# Its fileno() can go in a selectors loop next to the serial ports.
+
+# ---------------------------------------------
+import os
+import time
+import serial.tools.list_ports
+
+try:
+    import pyudev       # optional: 'sudo apt install python3-pyudev'
+except ImportError:
+    pyudev = None
+
+VID      = 0x2e8a  # Vendor Id: Raspberry Pi Pico device
+BootID   = 0x0003  # Pico bootloader mode
+PythonID = 0x0005  # Pico in MicroPython Serial Device mode
+
+USB_SYSFS = "/sys/bus/usb/devices"
+
+# ---------------------------------------------
+def findPicos():   # return port names of all connected Pico serial devices
+  picoDev = []
+  for port in serial.tools.list_ports.comports():
+    if (port.vid == VID) and (port.pid == PythonID): # Pico Serial
+        picoDev.append(port.name)
+  return picoDev
+
+def findBoot():    # return USB bus paths (eg. '1-1.3') of Picos in bootloader mode
+  boot = []
+  if os.path.isdir(USB_SYSFS):
+    for d in os.listdir(USB_SYSFS):
+      try:
+        with open(os.path.join(USB_SYSFS, d, "idVendor")) as f:
+          vid = int(f.read(), 16)
+        with open(os.path.join(USB_SYSFS, d, "idProduct")) as f:
+          pid = int(f.read(), 16)
+      except (OSError, ValueError):
+        continue        # interfaces and hubs without IDs, or device just left
+      if (vid == VID) and (pid == BootID):
+        boot.append(d)
+  else:                 # no sysfs (not Linux): ask PyUSB instead
+    try:
+      import usb.core
+    except ImportError:
+      return boot
+    for dev in usb.core.find(idVendor=VID, idProduct=BootID, find_all=1):
+      boot.append("%d-%d" % (dev.bus, dev.address))
+  return boot
+
+# ---------------------------------------------
+IN_ATTRIB = 0x004       # inotify event bits, from <sys/inotify.h>
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+
+def inotifyDev(dirs=None):  # inotify fd watching /dev and /dev/bus/usb/* (or dirs), or None
+  try:
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    fd = libc.inotify_init1(os.O_NONBLOCK)
+  except (OSError, AttributeError):
+    return None
+  if fd < 0:
+    return None
+  if dirs is None:
+    dirs = ["/dev"]
+    if os.path.isdir("/dev/bus/usb"):
+      dirs.append("/dev/bus/usb")
+      dirs += [os.path.join("/dev/bus/usb", b) for b in os.listdir("/dev/bus/usb")]
+  for d in dirs:   # IN_ATTRIB: udev fixes node permissions just after IN_CREATE
+    libc.inotify_add_watch(fd, d.encode(), IN_ATTRIB | IN_CREATE | IN_DELETE)
+  return fd
+
+class picoWatcher:  # call back on Pico arrivals and departures
+
+    def __init__(self, onAdd=None, onRemove=None, onBoot=None, poll=1.0, retry=0.02,
+                 find=findPicos, watchDirs=None, events=True):
+        self.onAdd = onAdd        # onAdd(name) -> True if it opened the port
+        self.onRemove = onRemove  # onRemove(name)
+        self.onBoot = onBoot      # onBoot(busPath, present)
+        self.poll = poll          # seconds between scans if there are no events
+        self.retry = retry        # seconds before retrying a port that would not open
+        self.find = find          # port names now present (a stand-in /dev, for testing)
+        self.ports = set()        # serial port names now attached
+        self.boot = set()         # bootloader-mode USB paths now present
+        self.pending = False      # a new port failed to open, try again soon
+        self.monitor = None
+        self.fd = None
+        if not events:            # polling only
+            pass
+        elif (pyudev is not None) and (watchDirs is None):
+            self.monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            self.monitor.filter_by('tty')
+            self.monitor.filter_by('usb')
+            self.monitor.start()
+            self.fd = self.monitor.fileno()
+        else:
+            self.fd = inotifyDev(watchDirs)
+
+    def fileno(self):  # fd that becomes readable on hotplug events (None if polling)
+        return self.fd
+
+    def timeout(self):  # longest time a select() may wait before calling check()
+        if self.pending:
+            return self.retry
+        if self.fd is None:
+            return self.poll
+        return None
+
+    def drain(self):   # discard queued events; check() rescans everything anyway
+        if self.monitor is not None:
+            while self.monitor.poll(timeout=0) is not None:
+                pass
+        elif self.fd is not None:
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def forget(self, name):  # a reader lost this port; report it again when it returns
+        self.ports.discard(name)
+
+    def check(self):   # rescan, and call back for anything that changed
+        self.drain()
+        now = set(self.find())
+        for name in sorted(self.ports - now):
+            self.ports.discard(name)
+            if self.onRemove is not None:
+                self.onRemove(name)
+        self.pending = False
+        for name in sorted(now - self.ports):
+            if (self.onAdd is None) or self.onAdd(name):
+                self.ports.add(name)
+            else:
+                self.pending = True   # device node not ready yet (permissions)
+        boot = set(findBoot())
+        if self.onBoot is not None:
+            for b in sorted(boot - self.boot):
+                self.onBoot(b, True)
+            for b in sorted(self.boot - boot):
+                self.onBoot(b, False)
+        self.boot = boot
+
+    def wait(self, timeout=None):  # block until something might have changed, then check()
+        t = self.timeout()
+        if (timeout is not None) and ((t is None) or (timeout < t)):
+            t = timeout
+        if self.fd is not None:
+            import select
+            select.select([self.fd], [], [], t)
+        else:
+            time.sleep(t)
+        self.check()
+
+    def close(self):
+        if (self.monitor is None) and (self.fd is not None):
+            os.close(self.fd)
+        self.fd = None
+
+# ---------------------------------------------
+if __name__ == "__main__":   # print hotplug events as they happen
+  def add(name):
+    print("%.3f  Pico serial device: %s" % (time.time(), name))
+    return True
+  def remove(name):
+    print("%.3f  Pico removed: %s" % (time.time(), name))
+  def boot(path, present):
+    print("%.3f  Pico bootloader %s: %s" % (time.time(), "found" if present else "gone", path))
+
+  w = picoWatcher(add, remove, boot)
+  w.check()
+  while True:
+    w.wait()
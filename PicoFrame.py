@@ -0,0 +1,268 @@
+# Compact binary records from Pico to host, in place of CSV text
+# frameWriter runs on the Pico (MicroPython) and on the host (CPython),
+# frameReader decodes the byte stream on the host.
+
+"""
+Frame layout, all fields little-endian:
+
+   offset  size
+     0      2    sync word 0xA5 0x5A
+     2      2    sequence number (uint16, wraps)
+     4      1    record type (REC_*)
+     5      1    n = payload length in 32-bit words (0..255)
+     6     4*n   payload, uint32 words
+   6+4*n    4    CRC-32 of bytes 2 .. 6+4*n  (same as binascii.crc32)
+
+A REC_EDGE frame carries (bits, ticks) pairs from the counter() PIO program,
+up to 127 pairs per frame: 10 bytes of framing, 8 bytes per edge.
+REC_TEXT carries a header or comment line, zero-padded to whole words.
+"""
+
+try:
+    import ustruct as struct
+except:
+    import struct
+try:
+    from binascii import crc32
+except ImportError:          # MicroPython built without crc32
+    crc32 = None
+
+SYNC = b"\xa5\x5a"
+HDR = 6                      # sync + seq + type + n
+CRCLEN = 4
+
+REC_EDGE = 1                 # pairs of (pin bits, tick count)
+REC_TEXT = 2                 # ASCII line, zero padded
+REC_WORDS = 3                # any other uint32 values
+
+# -----------------------------------------
+_crcTable = None
+
+def crc32sw(data, crc=0):    # CRC-32 (IEEE 802.3), for when binascii has none
+    global _crcTable
+    if _crcTable is None:
+        _crcTable = []
+        for i in range(256):
+            c = i
+            for _ in range(8):
+                c = (c >> 1) ^ 0xEDB88320 if (c & 1) else (c >> 1)
+            _crcTable.append(c)
+    t = _crcTable
+    crc = crc ^ 0xFFFFFFFF
+    for b in data:
+        crc = t[(crc ^ b) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+if crc32 is None:
+    crc32 = crc32sw
+
+def encode(seq, rtype, words):   # reference encoder: return one frame as bytes
+    n = len(words)
+    body = struct.pack("<HBB%dI" % n, seq & 0xFFFF, rtype, n, *words)
+    return SYNC + body + struct.pack("<I", crc32(body) & 0xFFFFFFFF)
+
+# -----------------------------------------
+class frameWriter:  # collect words into a preallocated frame, send when full
+
+    def __init__(self, out=None, maxWords=254, rtype=REC_EDGE):
+        if out is None:
+            import sys
+            out = getattr(sys.stdout, "buffer", sys.stdout)  # USB serial, raw bytes
+        self.out = out
+        self.maxWords = maxWords
+        self.rtype = rtype
+        self.buf = bytearray(HDR + 4*maxWords + CRCLEN)
+        self.mv = memoryview(self.buf)
+        self.buf[0:2] = SYNC
+        self.seq = 0
+        self.n = 0               # words in the frame being filled
+
+    def put(self, w):            # add one word
+        struct.pack_into("<I", self.buf, HDR + 4*self.n, w & 0xFFFFFFFF)
+        self.n += 1
+        if self.n >= self.maxWords:
+            self.send()
+
+    def put2(self, a, b):        # add a pair, never split across frames
+        if self.n + 2 > self.maxWords:
+            self.send()
+        struct.pack_into("<II", self.buf, HDR + 4*self.n, a & 0xFFFFFFFF, b & 0xFFFFFFFF)
+        self.n += 2
+        if self.n >= self.maxWords:
+            self.send()
+
+    def send(self):              # send the frame, if there is anything in it
+        if self.n == 0:
+            return
+        self.frame(self.rtype, self.n)
+        self.n = 0
+
+    def frame(self, rtype, n):   # finish header + CRC on the n words in buf, and write
+        end = HDR + 4*n
+        struct.pack_into("<HBB", self.buf, 2, self.seq, rtype, n)
+        struct.pack_into("<I", self.buf, end, crc32(self.mv[2:end]) & 0xFFFFFFFF)
+        self.out.write(self.mv[:end + CRCLEN])
+        self.seq = (self.seq + 1) & 0xFFFF
+
+    def text(self, s):           # send a text line (eg. CSV header) as its own frame
+        self.send()
+        b = s.encode() if isinstance(s, str) else s
+        n = (len(b) + 3) // 4
+        if n > self.maxWords:
+            n = self.maxWords
+            b = b[:4*n]
+        self.buf[HDR:HDR + 4*n] = bytes(4*n)
+        self.buf[HDR:HDR + len(b)] = b
+        self.frame(REC_TEXT, n)
+
+# -----------------------------------------
+class frameReader:  # split a byte stream into checked frames (host side)
+
+    def __init__(self):
+        self.tail = b""          # unparsed bytes from the last feed()
+        self.seq = None          # last good sequence number
+        self.frames = 0          # good frames
+        self.crcErrors = 0       # frames with bad CRC
+        self.skipped = 0         # bytes thrown away while looking for sync
+        self.lost = 0            # frames missing, from sequence gaps
+
+    def feed(self, data):
+        # yield (seq, rtype, payload) for each complete frame; payload is a
+        # memoryview into the input, only valid until the next feed()
+        if self.tail:
+            buf = self.tail + bytes(data)
+        else:
+            buf = data
+        mv = memoryview(buf)
+        n = len(buf)
+        i = 0
+        while True:
+            j = buf.find(SYNC, i)
+            if j < 0:            # keep a last byte that might be half a sync word
+                k = n - 1 if (n > i) and (buf[n-1] == SYNC[0]) else n
+                self.skipped += k - i
+                i = k
+                break
+            self.skipped += j - i
+            i = j
+            if n - j < HDR:
+                break
+            seq, rtype, nw = struct.unpack_from("<HBB", buf, j + 2)
+            end = j + HDR + 4*nw
+            if end + CRCLEN > n:
+                break            # rest of this frame not here yet
+            crc, = struct.unpack_from("<I", buf, end)
+            if crc32(mv[j+2:end]) & 0xFFFFFFFF != crc:
+                self.crcErrors += 1
+                self.skipped += 1
+                i = j + 1        # false sync or damaged frame: look again
+                continue
+            if self.seq is not None:
+                self.lost += (seq - self.seq - 1) & 0xFFFF
+            self.seq = seq
+            self.frames += 1
+            i = end + CRCLEN
+            yield seq, rtype, mv[j+HDR:end]
+        self.tail = bytes(mv[i:])
+
+def pairs(payload):     # (bits, ticks) tuples from a REC_EDGE payload, no copying
+    return struct.iter_unpack("<II", payload)
+
+def words(payload):
+    return struct.iter_unpack("<I", payload)
+
+def text(payload):
+    return bytes(payload).rstrip(b"\0").decode("utf-8", "replace")
+
+# -----------------------------------------
+selfTest = False     # round-trip and fuzz check of encode/frameWriter/frameReader
+
+def runSelfTest(nFrames=20000, seed=1):
+    import io
+    import random
+    random.seed(seed)
+    sent = []
+    out = io.BytesIO()
+    fw = frameWriter(out, maxWords=16)
+    for i in range(nFrames):
+        if random.random() < 0.05:
+            s = "# line %d %s" % (i, "x" * random.randrange(40))
+            fw.text(s)
+            sent.append((REC_TEXT, s))
+        else:
+            w = [random.getrandbits(32) for _ in range(2*random.randrange(1, 9))]
+            for k in range(0, len(w), 2):
+                fw.put2(w[k], w[k+1])
+            fw.send()
+            sent.append((REC_EDGE, tuple(w)))
+    stream = out.getvalue()
+    ref = io.BytesIO()              # frameWriter agrees with the reference encoder
+    fw = frameWriter(ref, maxWords=8)
+    for w in range(11):
+        fw.put(w * 0x01010101)
+    fw.send()
+    assert ref.getvalue() == encode(0, REC_EDGE, [w * 0x01010101 for w in range(8)]) + \
+                             encode(1, REC_EDGE, [w * 0x01010101 for w in range(8, 11)])
+    assert crc32sw(stream) == crc32(stream) & 0xFFFFFFFF
+
+    def decodeAll(chunks):
+        rd = frameReader()
+        got = []
+        for c in chunks:
+            for seq, rtype, p in rd.feed(c):
+                if rtype == REC_TEXT:
+                    got.append((rtype, text(p)))
+                else:
+                    got.append((rtype, tuple(w for (w,) in words(p))))
+        return rd, got
+
+    # round trip, fed in random-sized pieces
+    chunks = []
+    i = 0
+    while i < len(stream):
+        k = random.randrange(1, 300)
+        chunks.append(stream[i:i+k])
+        i += k
+    rd, got = decodeAll(chunks)
+    assert got == sent, "round trip mismatch"
+    assert rd.crcErrors == 0 and rd.lost == 0 and rd.skipped == 0
+
+    # fuzz: flip, drop and insert bytes; every frame that comes out must be one that went in
+    bad = bytearray(stream)
+    for _ in range(len(bad) // 500):
+        k = random.randrange(len(bad))
+        r = random.random()
+        if r < 0.4:
+            bad[k] ^= 1 << random.randrange(8)
+        elif r < 0.7:
+            del bad[k]
+        else:
+            bad[k:k] = bytes([random.getrandbits(8) for _ in range(random.randrange(1, 20))])
+    rd, got2 = decodeAll([bytes(bad[i:i+4096]) for i in range(0, len(bad), 4096)])
+    sentSet = set(sent)
+    assert all(g in sentSet for g in got2), "fuzz: corrupt frame accepted"
+    print("PicoFrame self test OK: %d frames, %d bytes; fuzz kept %d frames, %d CRC errors, %d lost"
+          % (len(sent), len(stream), len(got2), rd.crcErrors, rd.lost))
+
+# -----------------------------------------
+if __name__ == "__main__":  # decode a binary capture file to CSV on stdout
+    import sys
+    if selfTest or (len(sys.argv) > 1 and sys.argv[1] == "--test"):
+        runSelfTest()
+        sys.exit()
+    rd = frameReader()
+    with open(sys.argv[1], "rb") as f:
+        while True:
+            data = f.read(1 << 16)
+            if not data:
+                break
+            for seq, rtype, p in rd.feed(data):
+                if rtype == REC_EDGE:
+                    for bits, ticks in pairs(p):
+                        print("%d,%d" % (bits, ticks))
+                elif rtype == REC_TEXT:
+                    print(text(p))
+                else:
+                    print(",".join("%d" % w for (w,) in words(p)))
+    print("# %d frames, %d CRC errors, %d lost, %d bytes skipped"
+          % (rd.frames, rd.crcErrors, rd.lost, rd.skipped), file=sys.stderr)
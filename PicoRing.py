@@ -0,0 +1,260 @@
+# Single-producer, single-consumer ring buffer for PIO edge records
+# counter_handler() puts (bits, ticks) from the IRQ, main() takes them out.
+# Runs under MicroPython (in the IRQ handler: no allocation, no locks)
+# and under CPython for testing.
+
+"""
+The producer only writes 'head', the consumer only writes 'tail', and each
+side writes its data before moving its own index, so no lock is needed.
+Indices count modulo 2*size (not size), so a full buffer can be told from
+an empty one, and they stay small ints: no heap use in the IRQ handler.
+
+The counter() programs raise irq(noblock, 0x10) after each pair, but if
+another edge comes before the handler has run, the two IRQs become one.
+Reading one pair per IRQ then leaves pairs behind in the FIFO, until it
+fills and push() stalls the timer.  drain() takes every complete pair
+that is waiting, and counts IRQs and pairs so the ratio can be checked.
+The bits word is in_(pins, 2), never more than 3, so a larger first
+word means the pairs are out of step: it is dropped and counted in
+'resyncs'.
+
+When the buffer is full, the newest record is dropped and counted in
+'overruns'.  Unread data is never overwritten, so whatever the main loop
+reads is still in order, and the count says how many edges are missing.
+
+    ring = ringBuf(1024)
+    def counter_handler(sm):
+        ring.drain(sm)        # every complete (bits, ticks) pair in the FIFO
+    ...
+    while True:
+        if ring.avail():
+            bits, ticks = ring.get()
+"""
+
+import array
+
+class ringBuf:
+
+    def __init__(self, size=1024):   # size is rounded up to a power of 2
+        n = 1
+        while n < size:
+            n <<= 1
+        self.size = n
+        self.mask = n - 1             # array index = counter & mask
+        self.wrap = 2*n - 1           # counters run modulo 2*size
+        self.dataT = array.array("I", [0]*n)  # UINT32 timing data
+        self.dataB = array.array("B", [0]*n)  # UCHAR bits (Ch.A, Ch.B values)
+        self.mvT = memoryview(self.dataT)
+        self.mvB = memoryview(self.dataB)
+        self.head = 0                 # next record to write (producer only)
+        self.tail = 0                 # next record to read (consumer only)
+        self.overruns = 0             # records dropped because the buffer was full
+        self.hiwater = 0              # most records ever waiting at once
+        self.reported = 0             # overruns already returned by lost()
+        self.irqs = 0                 # drain() calls
+        self.pairs = 0                # (bits, ticks) pairs taken by drain()
+        self.resyncs = 0              # stray words dropped to get back in step
+
+    # ----- producer side (IRQ handler)
+    def put(self, b, t):   # add one record; False if it was dropped
+        h = self.head
+        n = (h - self.tail) & self.wrap
+        if n >= self.size:
+            self.overruns += 1
+            return False
+        k = h & self.mask
+        self.dataB[k] = b
+        self.dataT[k] = t
+        self.head = (h + 1) & self.wrap   # publish only after the data is in
+        if n >= self.hiwater:
+            self.hiwater = n + 1
+        return True
+
+    def drain(self, sm, tAdd=4):
+        # IRQ handler body: move all complete pairs from the RX FIFO of sm
+        # into the ring.  tAdd: counts for the PIO loop overhead.
+        self.irqs += 1
+        while sm.rx_fifo() >= 2:
+            b = sm.get()
+            if b > 3:                 # a ticks word, not bits: skip it
+                self.resyncs += 1
+                continue
+            self.put(b, sm.get() + tAdd)
+            self.pairs += 1
+
+    # ----- consumer side (main loop)
+    def avail(self):   # records waiting
+        return (self.head - self.tail) & self.wrap
+
+    def get(self):     # oldest record as (bits, ticks), or None if empty
+        t = self.tail
+        if t == self.head:
+            return None
+        k = t & self.mask
+        r = (self.dataB[k], self.dataT[k])
+        self.tail = (t + 1) & self.wrap
+        return r
+
+    def read_into(self, mvT, mvB=None):
+        # copy up to len(mvT) of the oldest records into mvT (and bits into
+        # mvB); return how many.  At most two slice copies, no per-record loop.
+        n = (self.head - self.tail) & self.wrap
+        if n > len(mvT):
+            n = len(mvT)
+        if n == 0:
+            return 0
+        if not isinstance(mvT, memoryview):
+            mvT = memoryview(mvT)
+        if (mvB is not None) and not isinstance(mvB, memoryview):
+            mvB = memoryview(mvB)
+        k = self.tail & self.mask
+        a = self.size - k             # records before the end of the arrays
+        if a > n:
+            a = n
+        mvT[0:a] = self.mvT[k:k+a]
+        if mvB is not None:
+            mvB[0:a] = self.mvB[k:k+a]
+        if n > a:                     # wrapped around: the rest is at the start
+            mvT[a:n] = self.mvT[0:n-a]
+            if mvB is not None:
+                mvB[a:n] = self.mvB[0:n-a]
+        self.tail = (self.tail + n) & self.wrap
+        return n
+
+    def lost(self):    # overruns since the last call, for a '#' note in the output
+        n = self.overruns - self.reported
+        self.reported += n
+        return n
+
+    def irqStats(self):   # '#' note: IRQs, pairs per IRQ, resyncs
+        return "# %d IRQs, %d pairs (%.2f per IRQ), %d resyncs" % (
+            self.irqs, self.pairs, self.pairs / max(self.irqs, 1), self.resyncs)
+
+# -----------------------------------------
+if __name__ == "__main__":   # CPython test: simulated producers against the ring
+    import threading
+    import time
+
+    # 1. a producer thread putting sequence numbers as fast as it can, and a
+    #    consumer that sometimes stalls; everything read must be in order,
+    #    and read + dropped must add up to everything written
+    ring = ringBuf(1000)
+    assert ring.size == 1024
+    N = 300_000
+    done = [False]
+
+    def producer():
+        for s in range(N):
+            ring.put(s & 0xFF, s)
+            if s % 1000 == 0:
+                time.sleep(0.0002)    # edges come in bursts
+        done[0] = True
+
+    got = []
+    buf = array.array("I", [0]*100)
+    bits = array.array("B", [0]*100)
+    th = threading.Thread(target=producer)
+    th.start()
+    k = 0
+    while not (done[0] and ring.avail() == 0):
+        k += 1
+        if k % 7 == 0:
+            n = ring.read_into(buf, bits)
+            for j in range(n):
+                assert bits[j] == buf[j] & 0xFF
+            got += buf[:n]
+        else:
+            r = ring.get()
+            if r is not None:
+                assert r[0] == r[1] & 0xFF
+                got.append(r[1])
+        if k % 5000 == 0:
+            time.sleep(0.002)         # main loop busy elsewhere: buffer fills
+    th.join()
+    assert all(got[j] < got[j+1] for j in range(len(got) - 1)), "out of order"
+    assert len(got) + ring.overruns == N, "records unaccounted for"
+    print("thread test: %d written, %d read, %d overruns, high water %d/%d"
+          % (N, len(got), ring.overruns, ring.hiwater, ring.size))
+
+    # 2. counter() from QuadEnc-Full.py in the PIO simulator, with a burst
+    #    of fast edges while the main loop only reads every 10 ms
+    import PioSim
+    progs = PioSim.loadPio("QuadEnc-Full.py")
+    sim = PioSim.sim
+    MFREQ = 200_000_000
+    sim.reset(MFREQ)
+    steps = [(0.001 + j * 20e-6, 1) for j in range(4000)]   # 50k edges/s burst
+    a, b = PioSim.quadrature(steps)
+    sim.drive(14, a)
+    sim.drive(15, b)
+    ring = ringBuf(256)
+
+    def counter_handler(sm):
+        ring.drain(sm)
+
+    sm2 = PioSim.StateMachine(2, progs["trigger"], freq=MFREQ, in_base=14, set_base=16)
+    sm2.active(1)
+    sm3 = PioSim.StateMachine(3, progs["trigger"], freq=MFREQ, in_base=15, set_base=16)
+    sm3.active(1)
+    sm4 = PioSim.StateMachine(4, progs["counter"], freq=MFREQ, in_base=14, jmp_pin=16, sideset_base=22)
+    sm4.irq(counter_handler)
+    sm4.active(1)
+    read = 0
+    for _ in range(20):
+        sim.run(0.010)
+        while ring.avail():
+            bits, ticks = ring.get()
+            assert abs(ticks - 2000) <= 1 or read == 0   # 20 us at 100 MHz count rate
+            read += 1
+    print("PIO test: %d edges, %d read, %d lost (%d reported), high water %d/%d"
+          % (len(steps), read, ring.overruns, ring.lost(), ring.hiwater, ring.size))
+    assert read + ring.overruns == len(steps) - 1   # counter() skips the first edge
+
+    # 3. bursts faster than the IRQ latency, so IRQs coalesce: one pair per
+    #    IRQ against drain(), then a stray word pushed into the FIFO
+    def burstRun(handler, stray=False):
+        sim.reset(MFREQ)
+        sim.irqLatency = sim.cycles(15e-6)        # slower than the edges
+        steps = []
+        for j in range(10):                       # 10 bursts of 100 edges, 10 us apart
+            steps += [(0.001 + j * 0.002 + k * 10e-6, 1) for k in range(100)]
+        a, b = PioSim.quadrature(steps)
+        sim.drive(14, a)
+        sim.drive(15, b)
+        sm2 = PioSim.StateMachine(2, progs["trigger"], freq=MFREQ, in_base=14, set_base=16)
+        sm2.active(1)
+        sm3 = PioSim.StateMachine(3, progs["trigger"], freq=MFREQ, in_base=15, set_base=16)
+        sm3.active(1)
+        sm4 = PioSim.StateMachine(4, progs["counter"], freq=MFREQ, in_base=14, jmp_pin=16, sideset_base=22)
+        sm4.irq(handler)
+        sm4.active(1)
+        sim.run(0.0053)
+        if stray:
+            sm4.rx.insert(0, 1000)                # half of a pair, as after a restart
+        sim.run(0.020)
+        got = []
+        while ring.avail():
+            got.append(ring.get())
+        good = sum(1 for g in got if abs(g[1] - 1000) <= 1)  # 10 us at 100 MHz
+        return len(steps), got, good
+
+    def onePair(sm):   # the old handler
+        ring.irqs += 1
+        ring.put(sm.get() & 0b11, sm.get() + 4)
+        ring.pairs += 1
+
+    for name, handler, stray in (("one pair/IRQ", onePair, False),
+                                 ("drain()", counter_handler, False),
+                                 ("drain()+stray", counter_handler, True)):
+        ring = ringBuf(4096)
+        n, got, good = burstRun(handler, stray)
+        print("burst test, %-14s %4d edges, %4d read, %4d at 10 us  %s"
+              % (name + ":", n, len(got), good, ring.irqStats()[2:]))
+        if handler is counter_handler:
+            assert len(got) == n - 1                # every edge, none stalled
+            assert good == n - 10                   # all but the first of each burst
+            assert ring.pairs > ring.irqs           # IRQs were amortized
+            assert ring.resyncs == (1 if stray else 0)
+            assert all(g[0] <= 3 for g in got)
+        else:
+            assert good < n - 10                    # FIFO filled, push() stalled the timer
@@ -1,26 +1,116 @@
 # Python3 code to find and read data from Pi Pico board to Linux host
 # 13-March-2021 J.Beale
+# keeps reading across board resets: waits for it to re-enumerate
 
+# python3 PicoToLinux.py            (print what the first Pico sends)
+# python3 PicoToLinux.py --test     (a pty 'board' in a stand-in /dev, reset over and over:
+#                                    time to reattach, and no file descriptors left behind)
+
+import os
 import serial
-import serial.tools.list_ports 
+from PicoDevices import picoWatcher  # tells us when the board comes and goes
+
+def readPico(w, devDir="/dev/", show=print, until=None):
+  # show() each line from the first Pico the watcher knows of, and from it
+  # again after every reset; runs until until() is true (or forever)
+  while (until is None) or not until():
+    if len(w.ports) == 0:
+      w.wait(0.1)
+      continue
+    devPico = sorted(w.ports)[0]
+    show("Found Pico connected at %s" % devPico)
+    try:
+      with serial.Serial(port=devDir + devPico) as ser:   # closed on the way out, whatever happens
+        while (until is None) or not until():
+          show(ser.readline().rstrip().decode('utf-8', 'replace'))
+    except (OSError, serial.SerialException):  # board reset or unplugged
+      show("Lost Pico at %s" % devPico)
+      w.forget(devPico)
+      w.check()
+
+if __name__ == "__main__":
+  import sys
+  if len(sys.argv) > 1 and sys.argv[1] == "--test":
+    import pty
+    import shutil
+    import tempfile
+    import threading
+    import time
+    import tty
+
+    def test(events, resets=10):
+      d = tempfile.mkdtemp() + "/"
+      node = d + "ttyACM0"
+      find = lambda: [n for n in os.listdir(d) if n.startswith("ttyACM")]
+      w = picoWatcher(poll=0.01, find=find, watchDirs=[d], events=events)
+      got = []                         # (time, line) as readPico shows them
+      stop = threading.Event()
+      board = {}
+
+      def plug():                      # the board enumerates: a new pty, its slave linked in as ttyACM0
+        m, s = pty.openpty()
+        tty.setraw(s)
+        os.symlink(os.ttyname(s), node)
+        board.update(m=m, s=s, t=time.monotonic())
+
+      def unplug():                    # reset: the tty goes away, reads on it fail
+        os.remove(node)
+        os.close(board["m"])
+        os.close(board["s"])
 
-devPico = ""  # haven't found one yet
+      def send():                      # the Pico: a numbered line every ms, while it is plugged in
+        k = 0
+        while not stop.is_set():
+          try:
+            os.write(board["m"], b"%d\r\n" % k)
+          except OSError:
+            pass                       # mid-reset
+          k += 1
+          time.sleep(0.001)
 
-for port in serial.tools.list_ports.comports():
-    if (port.vid == 11914) and (port.pid == 5): # IDs for Pico board
-        devPico = port.name
+      plug()
+      w.check()
+      fds = None
+      reader = threading.Thread(target=readPico, args=(w, d, lambda s: got.append((time.monotonic(), s)), stop.is_set))
+      reader.start()
+      sender = threading.Thread(target=send)
+      sender.start()
+      lag = []
+      for i in range(resets):
+        time.sleep(0.1)
+        if i == 1:
+          fds = len(os.listdir("/proc/self/fd"))   # after the first reattach: all opened once
+        n = len(got)
+        unplug()
+        plug()
+        t = board["t"]
+        while not [g for g in got[n:] if g[1].isdigit() and g[0] > t] and time.monotonic() - t < 5:
+          time.sleep(0.0005)
+        lag.append(min([g[0] for g in got[n:] if g[1].isdigit() and g[0] > t] or [t + 5]) - t)
+      fdsEnd = len(os.listdir("/proc/self/fd"))
+      kind = "inotify events:" if w.fileno() is not None else "polling (10 ms):"
+      stop.set()
+      unplug()                         # wakes the reader out of readline()
+      reader.join(); sender.join()
+      w.close()
+      shutil.rmtree(d)
+      lost = sum(1 for g in got if g[1].startswith("Lost Pico"))   # the resets, and the last unplug
+      print("%-18s %d resets, %d seen: reattached and reading in %.1f ms median, %.1f ms at most; "
+            "open fds %d -> %d" % (kind, resets, lost, 1e3 * sorted(lag)[len(lag) // 2], 1e3 * max(lag), fds, fdsEnd))
+      assert lost >= resets and max(lag) < 1.0
+      assert fdsEnd <= fds                       # each reset's port was closed
+      return lag
 
-if devPico != "":
-    print("Found Pico connected at %s" % devPico)
-else:
-    print("No Pico board found.")
-    exit()
-        
-ser = serial.Serial(port='/dev/'+devPico)
+    lag = test(True)
+    assert sorted(lag)[len(lag) // 2] < 0.05      # within milliseconds
+    test(False)
+  else:
+    w = picoWatcher()
+    w.check()
+    if len(w.ports) == 0:
+      print("No Pico board found, waiting for one.")
+    readPico(w)
 
-while True:
-  print(ser.readline().rstrip().decode('utf-8'))
-  
 # Example Output:
 #
 # Found Pico connected at ttyACM1
@@ -0,0 +1,1279 @@
+# CPython simulator for RP2040 PIO state machines
+# lets the @asm_pio programs in these scripts run on the host, unchanged,
+# driven by pin waveforms, so the PIO timing code can be checked off-device
+
+"""
+Stand-in for the MicroPython 'rp2' module (asm_pio, StateMachine, PIO),
+plus just enough of 'machine' (Pin, mem32, freq) for the PIO setup code.
+
+Programs are assembled to real 16-bit PIO instructions, following the
+encoding of MicroPython's rp2.py, so quirks like mov(x, 10) in
+QuadHoru1.py (10 is really invert(y)) behave as they do on the chip.
+
+Modelled: X, Y, ISR, OSR and shift counters, RX/TX FIFOs (4 deep, or 8 when
+joined, via fifo_join or a mem32 write to SHIFTCTRL as in QuadHoru1.py),
+autopush/autopull, set/out/side-set pins, delays, wrap, jmp pin, wait
+gpio/pin/irq, irq set/wait/clear (with rel), exec() of an instruction or
+string, the 2-cycle input synchronizer (PIO reads pin levels from 2 clocks
+back), and Python irq handlers with a set latency.  Not modelled:
+fractional clock dividers, mov status config, side-set enable bit, and
+PIO(n).irq() (block-level handlers; it raises NotImplementedError: use
+StateMachine.irq(), as all the scripts here do).
+
+Time is counted in system clock cycles.  Nothing is done for cycles where
+no state can change: a stalled wait costs nothing, and a counting loop like
+   label("counter_start")
+   jmp(pin, "output")
+   jmp(x_dec, "counter_start")
+is run one iteration, then skipped ahead to the next pin change.  Hours of
+pendulum or encoder signal at 200 MHz take seconds to replay (~4e9 cycles
+per second of host time), but only because of the skipping.
+
+With sim.skipLoops = False every instruction is executed, with the same
+results, at ~1.3e6 cycles per second (the QuadEnc-Full counter loop, about
+7e5 instructions/s): an SM running alone is stepped without going back
+through the event loop, and instructions are decoded once.  That is ~1.5 us
+of CPython per instruction, and the floor for this design; a program that
+really is busy every cycle (no loop to skip) runs at that rate, so a second
+of it at 200 MHz takes minutes.
+
+    import PioSim
+    progs = PioSim.loadPio("PendulumDual.py")      # the @asm_pio functions in it
+    sim = PioSim.sim
+    sim.reset(200_000_000)
+    sim.drive(16, PioSim.square(1.0, t0=0.1))       # 1 Hz signal on GP16
+    sm = PioSim.StateMachine(2, progs["trigger"], freq=200_000_000, ...)
+    sm.active(1)
+    sim.run(10.0)                                   # simulate 10 seconds
+
+    python3 PioSim.py [SECONDS]    (self-test: QuadEnc-Full, QuadHoru1, RecipCounter1 and
+                                    PIO-interval-timer programs on known inputs)
+"""
+
+import ast
+import heapq
+import os
+import types
+
+MASK = 0xFFFFFFFF
+INF = float("inf")
+
+# -----------------------------------------
+class PIO:    # constants, as rp2.PIO
+    IN_LOW = 0
+    IN_HIGH = 1
+    OUT_LOW = 2
+    OUT_HIGH = 3
+    SHIFT_LEFT = 0
+    SHIFT_RIGHT = 1
+    JOIN_NONE = 0
+    JOIN_TX = 1
+    JOIN_RX = 2
+    IRQ_SM0 = 0x100
+    IRQ_SM1 = 0x200
+    IRQ_SM2 = 0x400
+    IRQ_SM3 = 0x800
+
+    def __init__(self, n):
+        self.n = n
+
+    def irq(self, handler=None, trigger=0xF00, hard=False):
+        raise NotImplementedError("use StateMachine.irq() in the simulator")
+
+# -----------------------------------------
+# assembler, after MicroPython's rp2.py
+
+_pio_funcs = {
+    "gpio": 0, "pins": 0, "x": 1, "y": 2, "null": 3, "pindirs": 4, "pc": 5,
+    "status": 5, "isr": 6, "osr": 7, "exec": 8,
+    "invert": lambda x: x | 0x08, "reverse": lambda x: x | 0x10,
+    "not_x": 1, "x_dec": 2, "not_y": 3, "y_dec": 4, "x_not_y": 5, "pin": 6,
+    "not_osre": 7,
+    "noblock": 0x01, "block": 0x21, "iffull": 0x40, "ifempty": 0x40,
+    "clear": 0x40, "rel": lambda x: x | 0x10,
+}
+
+class PIOASMError(Exception):
+    pass
+
+class _emit:
+
+    def __init__(self, out_init=None, set_init=None, sideset_init=None, side_pindir=False,
+                 in_shiftdir=0, out_shiftdir=0, autopush=False, autopull=False,
+                 push_thresh=32, pull_thresh=32, fifo_join=0):
+        self.labels = {}
+        self.outInit = self._pins(out_init)
+        self.setInit = self._pins(set_init)
+        self.sidesetInit = self._pins(sideset_init)
+        self.sidesetCount = len(self.sidesetInit)   # bits of the delay field, with opt bit
+        self.sidesetOpt = False
+        self.delayMax = 31
+        self.inShiftdir = in_shiftdir
+        self.outShiftdir = out_shiftdir
+        self.autopush = autopush
+        self.autopull = autopull
+        self.pushThresh = push_thresh
+        self.pullThresh = pull_thresh
+        self.fifoJoin = fifo_join
+
+    @staticmethod
+    def _pins(init):
+        if init is None:
+            return ()
+        if isinstance(init, int):
+            return (init,)
+        return tuple(init)
+
+    def start_pass(self, pass_):
+        if pass_ == 1 and self.sidesetInit:
+            # as rp2.py: side-set is optional (SIDE_EN) unless every instruction has .side()
+            self.sidesetCount = len(self.sidesetInit)
+            self.sidesetOpt = self.numSideset != len(self.prog)
+            if self.sidesetOpt:
+                self.sidesetCount += 1
+            self.delayMax = 31 >> self.sidesetCount
+        self.pass_ = pass_
+        self.numSideset = 0
+        self.prog = []
+        self.wrapTarget = 0
+        self.wrapAt = None
+
+    def __getitem__(self, key):
+        return self.delay(key)
+
+    def delay(self, delay):
+        if self.pass_ > 0 and delay > self.delayMax:
+            raise PIOASMError("delay too large")
+        self.prog[-1] |= delay << 8
+        return self
+
+    def side(self, value):
+        self.numSideset += 1
+        if self.pass_ > 0:
+            if self.sidesetCount == 0:
+                raise PIOASMError("no sideset")
+            if self.sidesetOpt:
+                self.prog[-1] |= 0x1000
+            self.prog[-1] |= value << (13 - self.sidesetCount)
+        return self
+
+    def wrap_target(self):
+        self.wrapTarget = len(self.prog)
+
+    def wrap(self):
+        self.wrapAt = len(self.prog) - 1
+
+    def label(self, label):
+        if self.pass_ == 0:
+            if label in self.labels:
+                raise PIOASMError("duplicate label {}".format(label))
+            self.labels[label] = len(self.prog)
+
+    def word(self, instr, label=None):
+        if label is not None:
+            if self.pass_ == 1:
+                if label not in self.labels:
+                    raise PIOASMError("unknown label {}".format(label))
+                instr |= self.labels[label]
+        self.prog.append(instr)
+        return self
+
+    def nop(self):
+        return self.word(0xA042)
+
+    def jmp(self, cond, label=None):
+        if label is None:
+            label = cond
+            cond = 0
+        return self.word(0x0000 | cond << 5, label)
+
+    def wait(self, polarity, src, index):
+        if src == 6:
+            src = 1       # "pin"
+        elif src != 0:
+            src = 2       # "irq"
+        return self.word(0x2000 | polarity << 7 | src << 5 | index)
+
+    def in_(self, src, data):
+        if not 0 < data <= 32:
+            raise PIOASMError("invalid bit count {}".format(data))
+        return self.word(0x4000 | src << 5 | data & 0x1F)
+
+    def out(self, dest, data):
+        if dest == 8:
+            dest = 7      # exec
+        if not 0 < data <= 32:
+            raise PIOASMError("invalid bit count {}".format(data))
+        return self.word(0x6000 | dest << 5 | data & 0x1F)
+
+    def push(self, value=0, value2=0):
+        value |= value2
+        if not value & 1:
+            value |= 0x20  # blocking by default
+        return self.word(0x8000 | (value & 0x60))
+
+    def pull(self, value=0, value2=0):
+        value |= value2
+        if not value & 1:
+            value |= 0x20
+        return self.word(0x8080 | (value & 0x60))
+
+    def mov(self, dest, src):
+        if dest == 8:
+            dest = 4      # exec
+        return self.word(0xA000 | dest << 5 | src)
+
+    def irq(self, mod, index=None):
+        if index is None:
+            index = mod
+            mod = 0       # no modifiers
+        return self.word(0xC000 | (mod & 0x60) | index)
+
+    def set(self, dest, data):
+        return self.word(0xE000 | dest << 5 | data)
+
+    def namespace(self):
+        gl = dict(_pio_funcs)
+        for name in ("wrap_target", "wrap", "label", "word", "nop", "jmp", "wait",
+                     "in_", "out", "push", "pull", "mov", "irq", "set"):
+            gl[name] = getattr(self, name)
+        return gl
+
+class pioProgram:   # what asm_pio returns: assembled words plus config
+
+    def __init__(self, name, emit):
+        self.name = name
+        self.words = list(emit.prog)
+        self.labels = dict(emit.labels)
+        self.wrapTarget = emit.wrapTarget
+        self.wrap = emit.wrapAt if emit.wrapAt is not None else len(self.words) - 1
+        self.sidesetCount = emit.sidesetCount
+        self.sidesetOpt = emit.sidesetOpt
+        self.sidesetInit = emit.sidesetInit
+        self.setInit = emit.setInit
+        self.outInit = emit.outInit
+        self.inShiftdir = emit.inShiftdir
+        self.outShiftdir = emit.outShiftdir
+        self.autopush = emit.autopush
+        self.autopull = emit.autopull
+        self.pushThresh = emit.pushThresh
+        self.pullThresh = emit.pullThresh
+        self.fifoJoin = emit.fifoJoin
+
+    def __len__(self):
+        return len(self.words)
+
+def asm_pio(**kw):
+    emit = _emit(**kw)
+
+    def dec(f):
+        gl = emit.namespace()
+        code = types.FunctionType(f.__code__, gl)
+        emit.start_pass(0)
+        code()
+        emit.start_pass(1)
+        code()
+        return pioProgram(f.__name__, emit)
+
+    return dec
+
+def asm_pio_encode(instr, sideset_count=0, sideset_opt=False):  # one instruction from a string
+    emit = _emit()
+    emit.sidesetCount = sideset_count + bool(sideset_opt)
+    emit.sidesetOpt = bool(sideset_opt)
+    emit.delayMax = 31 >> emit.sidesetCount
+    emit.start_pass(1)
+    eval(instr, emit.namespace())
+    if len(emit.prog) != 1:
+        raise PIOASMError("expected exactly one instruction")
+    return emit.prog[0]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def loadPio(fname):
+    # return {name: program} for the @asm_pio functions in a device script,
+    # without running the rest of it (which needs the real hardware);
+    # a relative name is looked for next to this file first, so the self-tests run from anywhere
+    path = os.path.join(HERE, fname)
+    if os.path.exists(path):
+        fname = path
+    with open(fname) as f:
+        tree = ast.parse(f.read(), fname)
+    keep = []
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef):
+            for d in node.decorator_list:
+                fn = d.func if isinstance(d, ast.Call) else d
+                name = fn.attr if isinstance(fn, ast.Attribute) else getattr(fn, "id", "")
+                if name == "asm_pio":
+                    keep.append(node)
+                    break
+    mod = ast.Module(body=keep, type_ignores=[])
+    ns = {"asm_pio": asm_pio, "PIO": PIO, "rp2": types.SimpleNamespace(asm_pio=asm_pio, PIO=PIO)}
+    exec(compile(mod, fname, "exec"), ns)
+    return {node.name: ns[node.name] for node in keep}
+
+# -----------------------------------------
+# pin waveforms: iterables of (time in seconds, level)
+
+def square(freq, duty=0.5, t0=0.0, n=None, level0=1):  # square wave, first edge to level0 at t0
+    period = 1.0 / freq
+    k = 0
+    while (n is None) or (k < n):
+        t = t0 + k * period
+        yield (t, level0)
+        yield (t + duty * period, 1 - level0)
+        k += 1
+
+def intervals(durations, t0=0.0, level0=1):   # edges separated by the given durations
+    t = t0
+    level = level0
+    yield (t, level)
+    for d in durations:
+        t += d
+        level = 1 - level
+        yield (t, level)
+
+GRAY = (0b00, 0b10, 0b11, 0b01)  # (B,A) for position & 3; +1 per step by QuadDecode.LU
+
+def quadrature(steps, pos0=0):
+    # steps: iterable of (time, +1/-1); returns (edgesA, edgesB) lists for
+    # an encoder with A on bit 0 and B on bit 1 of in_(pins, 2)
+    a = []
+    b = []
+    pos = pos0
+    for t, d in steps:
+        old = GRAY[pos & 3]
+        pos += d
+        new = GRAY[pos & 3]
+        ch = old ^ new
+        if ch & 1:
+            a.append((t, new & 1))
+        if ch & 2:
+            b.append((t, (new >> 1) & 1))
+    return a, b
+
+# -----------------------------------------
+class Pin:    # minimal machine.Pin: an input driven by the simulator, or a CPU output
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        if pull == Pin.PULL_UP and not (sim.ext >> id) & 1 and id not in sim.driven:
+            sim.setExt(id, 1)
+        if value is not None:
+            sim.setExt(id, value)
+
+    def value(self, v=None):
+        if v is None:
+            sim.sync()
+            return (sim.pins >> self.id) & 1
+        sim.setExt(self.id, v)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def toggle(self):
+        self.value(1 - self.value())
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+def pinNum(p):
+    if p is None:
+        return None
+    return p if isinstance(p, int) else p.id
+
+# -----------------------------------------
+class pioWorld:   # all pins, state machines and waveforms, and simulated time
+
+    def __init__(self, freq=125_000_000):
+        self.reset(freq)
+
+    def reset(self, freq=None):
+        if freq is not None:
+            self.freq = int(freq)          # system clock, Hz
+        self.t = 0                         # now, in system clock cycles
+        self.ext = 0                       # levels applied from outside (waveforms, CPU)
+        self.latch = 0                     # PIO output levels
+        self.oe = 0                        # pins the PIO drives
+        self.pins = 0                      # what every pin reads now
+        self.pinVer = 0                    # bumped on every pin change
+        self.inputSync = 2                 # cycles before PIO sees a pin change
+        self.hist = [(-1, 0)]              # recent (cycle, pins) changes, for the synchronizer
+        self.irqFlags = [0, 0]             # 8 IRQ flags for each PIO block
+        self.sms = []                      # active StateMachine objects
+        self.waves = []                    # heap of (cycle, seq, pin, level, iterator)
+        self.waveSeq = 0
+        self.driven = set()                # pins with a waveform attached
+        self.handlerDue = []               # (cycle, sm) Python irq handlers waiting to run
+        self.inHandler = False
+        self.irqLatency = 0                # cycles from PIO irq to Python handler
+        self.skipLoops = True              # False: execute every instruction (slow, for checking)
+        self.steps = 0                     # instructions really executed
+        self.wakes = 0                     # bumped when another SM or a handler may have to run
+
+    # ----- time conversion
+    def cycles(self, seconds):
+        return int(round(seconds * self.freq))
+
+    def seconds(self, cycles=None):
+        return (self.t if cycles is None else cycles) / self.freq
+
+    def ticks_us(self):
+        return int(self.t * 1_000_000 // self.freq)
+
+    # ----- pins
+    def _update(self):
+        pins = (self.latch & self.oe) | (self.ext & ~self.oe)
+        if pins != self.pins:
+            self._beforePinChange()
+            self.pins = pins
+            self.pinVer += 1
+            h = self.hist
+            h.append((self.t, pins))
+            if len(h) > 16:
+                del h[:8]
+            self._wake(1)
+
+    def pinsSeen(self, t):   # pin levels as the PIO sees them at cycle t
+        t -= self.inputSync
+        h = self.hist
+        if h[-1][0] <= t:
+            return h[-1][1]
+        for tc, p in reversed(h):
+            if tc <= t:
+                return p
+        return h[0][1]
+
+    def setExt(self, pin, level):
+        self.sync()
+        if level:
+            self.ext |= 1 << pin
+        else:
+            self.ext &= ~(1 << pin)
+        self._update()
+
+    def drive(self, pin, edges):   # attach a waveform, iterable of (seconds, level)
+        pin = pinNum(pin)
+        it = iter(edges)
+        self.driven.add(pin)
+        self._nextWave(pin, it)
+
+    def _nextWave(self, pin, it):
+        for ts, level in it:
+            tc = self.cycles(ts)
+            if tc < self.t:
+                tc = self.t
+            self.waveSeq += 1
+            heapq.heappush(self.waves, (tc, self.waveSeq, pin, level, it))
+            return
+
+    def writePins(self, mask, values, oeMask=0, oeValues=0):  # PIO output write
+        latch = (self.latch & ~mask) | (values & mask)
+        oe = (self.oe & ~oeMask) | (oeValues & oeMask)
+        if latch != self.latch or oe != self.oe:
+            self.latch = latch
+            self.oe = oe
+            self._update()
+            return True
+        return False
+
+    # ----- irq flags
+    def setIrq(self, block, idx, value):
+        f = self.irqFlags[block]
+        nf = (f | (1 << idx)) if value else (f & ~(1 << idx))
+        if nf == f:
+            return
+        self.irqFlags[block] = nf
+        self._wake(2)
+        if value and idx < 4:           # flags 0-3 can interrupt the CPU
+            sm = self._smById(block * 4 + idx)
+            if (sm is not None) and (sm.handler is not None):
+                self.handlerDue.append((self.t + self.irqLatency, sm))
+                self.wakes += 1
+
+    def _smById(self, id):
+        for sm in self.sms:
+            if sm.id == id:
+                return sm
+        return None
+
+    # ----- scheduling
+    def _wake(self, reason):   # a pin (1), irq flag (2) or fifo (4) changed: retry stalled SMs
+        self.wakes += 1
+        for sm in self.sms:
+            if sm.blocked & reason:
+                sm.blocked = 0
+                sm.nextT = sm.align(self.t + (self.inputSync if reason == 1 else 0))
+
+    def _beforePinChange(self):  # counting loops must see the old pin levels up to now
+        for sm in self.sms:
+            if sm.loop is not None:
+                sm.leaveLoop(self.t)
+
+    def sync(self):   # bring SMs that are skipping a loop up to the present
+        for sm in self.sms:
+            if sm.loop is not None:
+                sm.leaveLoop(self.t)
+
+    def runUntil(self, tEnd, cond=None):
+        # simulate up to cycle tEnd, or until cond() is true (checked between events)
+        sms = self.sms
+        waves = self.waves
+        while True:
+            if (cond is not None) and cond():
+                return True
+            tn = INF
+            for sm in sms:
+                if sm.nextT < tn:
+                    tn = sm.nextT
+                if (sm.loop is not None) and (sm.loop[6] < tn):
+                    tn = sm.loop[6]
+            if waves and waves[0][0] < tn:
+                tn = waves[0][0]
+            if self.handlerDue and not self.inHandler:
+                th = min(h[0] for h in self.handlerDue)
+                if th < tn:
+                    tn = th
+            if tn > tEnd:
+                self.t = tEnd if tEnd != INF else self.t
+                return False
+            self.t = tn
+            if waves and waves[0][0] == tn:             # input edges first
+                while waves and waves[0][0] == tn:
+                    _, _, pin, level, it = heapq.heappop(waves)
+                    if level:
+                        self.ext |= 1 << pin
+                    else:
+                        self.ext &= ~(1 << pin)
+                    self._nextWave(pin, it)
+                self._update()
+            if self.handlerDue and not self.inHandler:  # then Python irq handlers
+                due = [h for h in self.handlerDue if h[0] <= tn]
+                if due:
+                    self.handlerDue = [h for h in self.handlerDue if h[0] > tn]
+                    for _, sm in due:
+                        self._callHandler(sm)
+                    continue
+            for sm in sms:                              # then state machines, in id order
+                if (sm.loop is not None) and (sm.loop[6] <= tn):
+                    sm.leaveLoop(tn)
+                while sm.nextT <= tn:
+                    sm.step()
+            if cond is None and not self.handlerDue:   # one SM running, the rest stalled: no
+                run = None                              # need to go round for each of its steps
+                for sm in sms:
+                    if sm.nextT != INF or sm.loop is not None:
+                        if run is not None:
+                            run = None
+                            break
+                        run = sm
+                if run is not None and run.loop is None:
+                    lim = waves[0][0] if waves else INF
+                    if tEnd < lim:
+                        lim = tEnd + 1
+                    w = self.wakes
+                    while run.nextT < lim and self.wakes == w:
+                        self.t = run.nextT
+                        run.step()
+
+    def _callHandler(self, sm):
+        blk = sm.id // 4
+        idx = sm.id % 4
+        if not (self.irqFlags[blk] >> idx) & 1:
+            return                       # already cleared
+        self.sync()
+        self.setIrq(blk, idx, 0)         # as MicroPython does before the Python handler
+        self.inHandler = True
+        try:
+            sm.handler(sm)
+        finally:
+            self.inHandler = False
+
+    def run(self, seconds):       # simulate for this many more seconds
+        self.runUntil(self.t + self.cycles(seconds))
+        self.sync()
+
+    def runFor(self, cycles):
+        self.runUntil(self.t + cycles)
+        self.sync()
+
+sim = pioWorld()
+
+def freq(f=None):      # machine.freq()
+    if f is None:
+        return sim.freq
+    sim.freq = int(f)
+
+# -----------------------------------------
+class _mem32:   # machine.mem32, for the PIO CTRL, FDEBUG and SHIFTCTRL registers only
+    PIO_BASE = (0x50200000, 0x50300000)
+
+    def _reg(self, addr):
+        base = addr & ~0x3FFF
+        if base not in self.PIO_BASE:
+            raise ValueError("mem32: address 0x%08x not simulated" % addr)
+        return self.PIO_BASE.index(base), addr & 0xFFF, (addr >> 12) & 3
+
+    def __getitem__(self, addr):
+        blk, off, _ = self._reg(addr)
+        return self._read(blk, off)
+
+    def _read(self, blk, off):
+        if off == 0x000:
+            v = 0
+            for sm in sim.sms:
+                if sm.id // 4 == blk and sm.enabled:
+                    v |= 1 << (sm.id % 4)
+            return v
+        if off == 0x008:                 # FDEBUG: only RXSTALL (bits 0..3)
+            v = 0
+            for sm in sim.sms:
+                if sm.id // 4 == blk and sm.rxStall:
+                    v |= 1 << (sm.id % 4)
+            return v
+        sm = self._shiftSm(blk, off)
+        return sm.shiftctrl()
+
+    def _shiftSm(self, blk, off):
+        k = (off - 0x0D0) // 0x18
+        if (off - 0x0D0) % 0x18 or not 0 <= k < 4:
+            raise ValueError("mem32: PIO register 0x%03x not simulated" % off)
+        sm = sim._smById(blk * 4 + k)
+        if sm is None:
+            raise ValueError("mem32: state machine %d not set up" % (blk * 4 + k))
+        return sm
+
+    def __setitem__(self, addr, value):
+        blk, off, alias = self._reg(addr)
+        if off == 0x008:                 # FDEBUG bits are write-1-to-clear
+            for sm in sim.sms:
+                if sm.id // 4 == blk and (value >> (sm.id % 4)) & 1:
+                    sm.rxStall = False
+            return
+        old = self._read(blk, off)
+        value &= MASK
+        if alias == 1:
+            value ^= old     # +0x1000: atomic XOR
+        elif alias == 2:
+            value |= old     # +0x2000: atomic set
+        elif alias == 3:
+            value = old & ~value  # +0x3000: atomic clear
+        if off == 0x000:
+            for k in range(4):
+                sm = sim._smById(blk * 4 + k)
+                if sm is not None:
+                    sm.active((value >> k) & 1)
+        else:
+            self._shiftSm(blk, off).setShiftctrl(value)
+
+mem32 = _mem32()
+
+# -----------------------------------------
+class StateMachine:
+
+    def __init__(self, id, prog=None, freq=-1, **kw):
+        self.id = id
+        self.handler = None
+        self.rxDreq = None            # rxDreq(sm): a DMA channel reading the RX FIFO
+        self.enabled = False
+        self.loop = None
+        self.nextT = INF
+        self.blocked = 0
+        old = sim._smById(id)
+        if old is not None:
+            sim.sms.remove(old)
+        sim.sms.append(self)
+        sim.sms.sort(key=lambda s: s.id)
+        if prog is not None:
+            self.init(prog, freq, **kw)
+
+    def init(self, prog, freq=-1, in_base=None, out_base=None, set_base=None, jmp_pin=None,
+             sideset_base=None, in_shiftdir=None, out_shiftdir=None, push_thresh=None,
+             pull_thresh=None):
+        self.prog = prog
+        self.words = list(prog.words)
+        self.div = 1 if freq is None or freq <= 0 else max(1, int(round(sim.freq / freq)))
+        self.inBase = pinNum(in_base) or 0
+        self.outBase = pinNum(out_base) or 0
+        self.setBase = pinNum(set_base) or 0
+        self.jmpPin = pinNum(jmp_pin) or 0
+        self.sideBase = pinNum(sideset_base) or 0
+        self.sideCount = prog.sidesetCount     # delay/side-set field bits used by side-set
+        self.sideOpt = prog.sidesetOpt
+        self.sidePins = len(prog.sidesetInit)
+        self.setCount = max(1, len(prog.setInit)) if prog.setInit else 5
+        self.outCount = len(prog.outInit) if prog.outInit else 32
+        self.inShiftdir = prog.inShiftdir if in_shiftdir is None else in_shiftdir
+        self.outShiftdir = prog.outShiftdir if out_shiftdir is None else out_shiftdir
+        self.pushThresh = prog.pushThresh if push_thresh is None else push_thresh
+        self.pullThresh = prog.pullThresh if pull_thresh is None else pull_thresh
+        self.autopush = prog.autopush
+        self.autopull = prog.autopull
+        self.wrapTarget = prog.wrapTarget
+        self.wrap = prog.wrap
+        self.joinRx = prog.fifoJoin == PIO.JOIN_RX
+        self.joinTx = prog.fifoJoin == PIO.JOIN_TX
+        self.decoded = {}
+        self.code = [self.decode(w) for w in self.words]   # decoded once, by pc
+        self.restart()
+        for base, init in ((self.setBase, prog.setInit), (self.sideBase, prog.sidesetInit),
+                           (self.outBase, prog.outInit)):
+            for k, v in enumerate(init):   # OUT_LOW/OUT_HIGH: drive pin; IN_*: leave as input
+                p = (base + k) & 31
+                if v in (PIO.OUT_LOW, PIO.OUT_HIGH):
+                    sim.writePins(1 << p, (v == PIO.OUT_HIGH) << p, 1 << p, 1 << p)
+
+    def restart(self):
+        self.leaveLoop(sim.t)
+        self.pc = 0
+        self.x = 0
+        self.y = 0
+        self.isr = 0
+        self.isrCount = 0
+        self.osr = 0
+        self.osrCount = 32            # OSR starts empty
+        self.rx = []
+        self.tx = []
+        self.execPending = None
+        self.irqWaiting = False       # irq(block, n) has set its flag, waiting for the clear
+        self.effects = 0              # count of instructions with outside effects
+        self.mark = None
+        self.loop = None
+        self.blocked = 0
+        self.rxDropped = 0            # nonblocking pushes lost to a full RX FIFO
+        self.rxStall = False          # FDEBUG RXSTALL: full RX FIFO at a push; cleared via mem32
+        self.nextT = sim.t if self.enabled else INF
+
+    def align(self, t):   # first cycle >= t on this SM's clock
+        r = t % self.div
+        return t if r == 0 else t + self.div - r
+
+    def active(self, value=None):
+        if value is None:
+            return self.enabled
+        sim.sync()
+        value = bool(value)
+        if value and not self.enabled:
+            self.enabled = True
+            self.nextT = self.align(sim.t)
+            self.blocked = 0
+        elif not value and self.enabled:
+            self.leaveLoop(sim.t)
+            self.enabled = False
+            self.nextT = INF
+            self.blocked = 0
+
+    def irq(self, handler=None, trigger=0, hard=False):
+        self.handler = handler
+
+    def put(self, value, shift=0):
+        vals = value if isinstance(value, (list, tuple)) else [value]
+        cap = 8 if self.joinTx else 4
+        for v in vals:
+            if len(self.tx) >= cap:   # MicroPython blocks until the SM pulls
+                sim.runUntil(INF, lambda: len(self.tx) < cap)
+                if len(self.tx) >= cap:
+                    raise RuntimeError("put(): TX FIFO full and nothing will pull it")
+            self.tx.append((v << shift) & MASK)
+            sim._wake(4)
+
+    def get(self, buf=None, shift=0):
+        if not self.rx:             # MicroPython blocks until the SM pushes
+            sim.runUntil(INF, lambda: len(self.rx) > 0)
+            if not self.rx:
+                raise RuntimeError("get(): RX FIFO empty and nothing will push")
+        v = self.rx.pop(0)
+        sim._wake(4)
+        return v >> shift
+
+    def rx_fifo(self):
+        return len(self.rx)
+
+    def tx_fifo(self):
+        return len(self.tx)
+
+    def exec(self, instr):
+        sim.sync()
+        if isinstance(instr, str):
+            instr = asm_pio_encode(instr, self.sidePins, self.sideOpt)
+        saved = self.nextT
+        self.execPending = instr
+        self.nextT = sim.t
+        self.step()
+        if not self.enabled:         # a stalled instruction stays latched until active(1)
+            self.nextT = INF
+            self.blocked = 0
+        elif not self.blocked:
+            self.nextT = max(saved, self.nextT)
+
+    def shiftctrl(self):
+        return (self.joinRx << 31) | (self.joinTx << 30) | ((self.pullThresh & 31) << 25) | \
+               ((self.pushThresh & 31) << 20) | (self.outShiftdir << 19) | \
+               (self.inShiftdir << 18) | (self.autopull << 17) | (self.autopush << 16)
+
+    def setShiftctrl(self, v):
+        jr = bool((v >> 31) & 1)
+        jt = bool((v >> 30) & 1)
+        if (jr, jt) != (self.joinRx, self.joinTx):
+            self.rx = []              # changing the join flushes both FIFOs
+            self.tx = []
+        self.joinRx, self.joinTx = jr, jt
+        self.pullThresh = ((v >> 25) & 31) or 32
+        self.pushThresh = ((v >> 20) & 31) or 32
+        self.outShiftdir = (v >> 19) & 1
+        self.inShiftdir = (v >> 18) & 1
+        self.autopull = bool((v >> 17) & 1)
+        self.autopush = bool((v >> 16) & 1)
+
+    # ----- loop skipping
+    def leaveLoop(self, t):   # stop skipping: set state to the last whole iteration, catch up to t
+        lp = self.loop
+        if lp is None:
+            return
+        pc, t0, x0, y0, dx, dy, tMax, period = lp
+        self.loop = None
+        self.mark = None
+        tl = min(t, tMax)
+        k = (tl - t0) // period
+        self.pc = pc
+        self.x = (x0 + k * dx) & MASK
+        self.y = (y0 + k * dy) & MASK
+        self.nextT = t0 + k * period
+        while self.nextT < t:          # partial iteration: still pure, uses old pins
+            self.step()
+
+    def _checkLoop(self, fromPc):
+        # called after a backward jump; two passes with nothing but jumps and
+        # x/y decrements in between make a loop that can be skipped
+        m = self.mark
+        if (m is not None) and m[0] == fromPc and m[1] == self.effects and m[2] == sim.pinVer \
+                and m[3] == self.pc and m[4] >= sim.hist[-1][0] + sim.inputSync:
+            dx = ((self.x - m[5]) + 0x80000000 & MASK) - 0x80000000
+            dy = ((self.y - m[6]) + 0x80000000 & MASK) - 0x80000000
+            period = self.nextT - m[4]
+            if sim.skipLoops and -8 <= dx <= 0 and -8 <= dy <= 0 and period > 0:
+                kMax = INF
+                if dx:
+                    kMax = (self.x - (1 - dx)) // (-dx)
+                if dy:
+                    kMax = min(kMax, (self.y - (1 - dy)) // (-dy))
+                if kMax >= 2:
+                    tMax = self.nextT + kMax * period if kMax != INF else INF
+                    self.loop = (self.pc, self.nextT, self.x, self.y, dx, dy, tMax, period)
+                    self.nextT = INF
+                    return
+        self.mark = (fromPc, self.effects, sim.pinVer, self.pc, self.nextT, self.x, self.y)
+
+    # ----- execution
+    def decode(self, w):
+        d = self.decoded.get(w)
+        if d is None:
+            op = w >> 13
+            n = self.sideCount
+            ds = (w >> 8) & 0x1F
+            delay = ds & ((1 << (5 - n)) - 1)
+            side = ds >> (5 - n) if n else None
+            if self.sideOpt:
+                side = side & ((1 << (n - 1)) - 1) if side >> (n - 1) else None
+            d = (op, (w >> 5) & 7, w & 0x1F, delay, side, w)
+            self.decoded[w] = d
+        return d
+
+    def readPins(self, base, n, now):
+        p = sim.pinsSeen(now)
+        v = ((p >> base) | (p << (32 - base))) & MASK if base else p
+        return v & ((1 << n) - 1) if n < 32 else v
+
+    def step(self):
+        # execute one instruction (or one stalled cycle) at self.nextT
+        sim.steps += 1
+        now = self.nextT
+        if self.execPending is not None:
+            w = self.execPending
+            self.execPending = None
+            fromExec = True
+            op, a, b, delay, side, _ = self.decode(w)
+        else:
+            op, a, b, delay, side, w = self.code[self.pc]
+            fromExec = False
+        if side is not None:
+            m = (1 << self.sidePins) - 1
+            if sim.writePins(((m << self.sideBase) | (m >> (32 - self.sideBase))) & MASK,
+                             ((side << self.sideBase) | (side >> (32 - self.sideBase))) & MASK):
+                self.effects += 1
+        pc = self.pc
+        nextPc = pc + 1 if pc != self.wrap else self.wrapTarget
+        jumped = False
+
+        if op == 0:                      # JMP
+            cond = a
+            if cond == 0:
+                take = True
+            elif cond == 1:
+                take = self.x == 0
+            elif cond == 2:
+                take = self.x != 0
+                self.x = (self.x - 1) & MASK
+            elif cond == 3:
+                take = self.y == 0
+            elif cond == 4:
+                take = self.y != 0
+                self.y = (self.y - 1) & MASK
+            elif cond == 5:
+                take = self.x != self.y
+                self.effects += 1        # no loop skipping across x != y
+            elif cond == 6:
+                take = (sim.pinsSeen(now) >> self.jmpPin) & 1 == 1
+            else:
+                take = self.osrCount < self.pullThresh
+            if take:
+                nextPc = b
+                jumped = True
+
+        elif op == 1:                    # WAIT
+            pol = a >> 2
+            src = a & 3
+            if src == 0:
+                ok = ((sim.pinsSeen(now) >> b) & 1) == pol
+                reason = 1
+            elif src == 1:
+                ok = ((sim.pinsSeen(now) >> ((self.inBase + b) & 31)) & 1) == pol
+                reason = 1
+            else:
+                blk, idx = self.irqIndex(b)
+                ok = ((sim.irqFlags[blk] >> idx) & 1) == pol
+                reason = 2
+                if ok and pol:
+                    sim.setIrq(blk, idx, 0)
+                    self.effects += 1
+            if not ok:
+                return self.stall(w, reason, fromExec)
+
+        elif op == 2:                    # IN
+            n = b or 32
+            if self.autopush and self.isrCount >= self.pushThresh:
+                if not self.doPush(True):
+                    return self.stall(w, 4, fromExec)
+            if a == 0:
+                v = self.readPins(self.inBase, n, now)
+            elif a == 1:
+                v = self.x
+            elif a == 2:
+                v = self.y
+            elif a == 6:
+                v = self.isr
+            elif a == 7:
+                v = self.osr
+            else:
+                v = 0
+            v &= (1 << n) - 1 if n < 32 else MASK
+            if self.inShiftdir == PIO.SHIFT_LEFT:
+                self.isr = ((self.isr << n) | v) & MASK if n < 32 else v
+            else:
+                self.isr = ((self.isr >> n) | (v << (32 - n))) & MASK if n < 32 else v
+            self.isrCount = min(32, self.isrCount + n)
+            self.effects += 1
+            if self.autopush and self.isrCount >= self.pushThresh:
+                self.doPush(False)
+
+        elif op == 3:                    # OUT
+            n = b or 32
+            if self.autopull and self.osrCount >= self.pullThresh:
+                if not self.tx:
+                    return self.stall(w, 4, fromExec)
+                self.osr = self.tx.pop(0)
+                self.osrCount = 0
+                sim._wake(4)
+            if self.outShiftdir == PIO.SHIFT_LEFT:
+                v = self.osr >> (32 - n) if n < 32 else self.osr
+                self.osr = (self.osr << n) & MASK if n < 32 else 0
+            else:
+                v = self.osr & ((1 << n) - 1) if n < 32 else self.osr
+                self.osr = self.osr >> n if n < 32 else 0
+            self.osrCount = min(32, self.osrCount + n)
+            self.effects += 1
+            if a == 0:
+                self.outPins(self.outBase, min(n, self.outCount), v, False)
+            elif a == 1:
+                self.x = v
+            elif a == 2:
+                self.y = v
+            elif a == 4:
+                self.outPins(self.outBase, min(n, self.outCount), v, True)
+            elif a == 5:
+                nextPc = v & 0x1F
+                jumped = True
+            elif a == 6:
+                self.isr = v
+                self.isrCount = n
+            elif a == 7:
+                self.execPending = v
+
+        elif op == 4:                    # PUSH / PULL
+            ifx = (a >> 1) & 1
+            blk = a & 1
+            if not (a >> 2):             # PUSH
+                if ifx and self.isrCount < self.pushThresh:
+                    pass
+                elif not self.doPush(blk):
+                    return self.stall(w, 4, fromExec)
+            else:                        # PULL
+                if ifx and self.osrCount < self.pullThresh:
+                    pass
+                elif self.tx:
+                    self.osr = self.tx.pop(0)
+                    self.osrCount = 0
+                    sim._wake(4)
+                elif blk:
+                    return self.stall(w, 4, fromExec)
+                else:
+                    self.osr = self.x    # nonblocking pull from empty FIFO copies X
+                    self.osrCount = 0
+            self.effects += 1
+
+        elif op == 5:                    # MOV
+            src = b & 7
+            mop = (b >> 3) & 3
+            if src == 0:
+                v = self.readPins(self.inBase, 32, now)
+            elif src == 1:
+                v = self.x
+            elif src == 2:
+                v = self.y
+            elif src == 5:
+                v = 0                    # STATUS, with default config (TX level < 0)
+            elif src == 6:
+                v = self.isr
+            elif src == 7:
+                v = self.osr
+            else:
+                v = 0
+            if mop == 1:
+                v = ~v & MASK
+            elif mop == 2:
+                v = int("{:032b}".format(v)[::-1], 2)
+            if a == 2 and src == 2 and mop == 0:
+                pass                     # nop
+            else:
+                self.effects += 1
+                if a == 0:
+                    self.outPins(self.outBase, self.outCount, v, False)
+                elif a == 1:
+                    self.x = v
+                elif a == 2:
+                    self.y = v
+                elif a == 4:
+                    self.execPending = v
+                elif a == 5:
+                    nextPc = v & 0x1F
+                    jumped = True
+                elif a == 6:
+                    self.isr = v
+                    self.isrCount = 0
+                elif a == 7:
+                    self.osr = v
+                    self.osrCount = 0
+
+        elif op == 6:                    # IRQ
+            blk, idx = self.irqIndex(b)
+            self.effects += 1
+            if a & 2:                    # clear
+                sim.setIrq(blk, idx, 0)
+            elif a & 1:                  # set and wait for it to be cleared
+                if not self.irqWaiting:
+                    sim.setIrq(blk, idx, 1)
+                    self.irqWaiting = True
+                if (sim.irqFlags[blk] >> idx) & 1:
+                    return self.stall(w, 2, fromExec)
+                self.irqWaiting = False
+            else:
+                sim.setIrq(blk, idx, 1)
+
+        else:                            # SET
+            self.effects += 1
+            if a == 0:
+                self.outPins(self.setBase, self.setCount, b, False)
+            elif a == 1:
+                self.x = b
+            elif a == 2:
+                self.y = b
+            elif a == 4:
+                self.outPins(self.setBase, self.setCount, b, True)
+
+        if fromExec and not jumped:
+            nextPc = pc                  # exec'd instruction doesn't advance the PC
+        self.pc = nextPc
+        self.nextT = now + self.div * (1 + delay)
+        if not sim.skipLoops:
+            return
+        if jumped and nextPc <= pc and not fromExec:
+            self._checkLoop(pc)
+        elif (not jumped) and pc == self.wrap and not fromExec and self.wrapTarget <= pc:
+            self._checkLoop(pc)
+
+    def stall(self, w, reason, fromExec):
+        if fromExec or self.execPending is not None:
+            self.execPending = w         # stalled exec'd instruction stays latched
+        self.blocked = reason
+        self.nextT = INF
+        self.mark = None
+
+    def irqIndex(self, b):
+        idx = b & 7
+        if b & 0x10:                     # rel: add SM number to low 2 bits
+            idx = (idx & 4) | ((idx + self.id) & 3)
+        return self.id // 4, idx
+
+    def doPush(self, blk):
+        cap = 8 if self.joinRx else 4
+        if len(self.rx) >= cap:
+            self.rxStall = True       # set by a stalled push too, as on the chip
+            if blk:
+                return False
+            self.rxDropped += 1
+        else:
+            self.rx.append(self.isr)
+            if self.rxDreq is not None:
+                self.rxDreq(self)
+        self.isr = 0
+        self.isrCount = 0
+        return True
+
+    def outPins(self, base, n, v, dirs):
+        m = (1 << n) - 1 if n < 32 else MASK
+        mask = ((m << base) | (m >> (32 - base))) & MASK if base else m
+        val = (((v & m) << base) | ((v & m) >> (32 - base))) & MASK if base else v & m
+        if dirs:
+            sim.writePins(0, 0, mask, val)
+        else:
+            sim.writePins(mask, val)
+
+# -----------------------------------------
+if __name__ == "__main__":   # the repo's PIO programs, replayed with known inputs
+    import sys
+    import time
+    from QuadDecode import quadDecoder
+    MFREQ = 200_000_000
+
+    def encoder(seconds, rate=500.0):   # steps back and forth, 2000 at a time
+        steps = []
+        t = 0.001
+        k = 0
+        while t < seconds:
+            steps.append((t, 1 if (k // 2000) % 2 == 0 else -1))
+            t += 1.0 / rate
+            k += 1
+        a, b = quadrature(steps)
+        sim.drive(14, a)
+        sim.drive(15, b)
+        return steps
+
+    def quadEnc(seconds, skip=True, rate=500.0):   # QuadEnc-Full.py: trigger x2, counter, an IRQ per edge
+        progs = loadPio("QuadEnc-Full.py")
+        sim.reset(MFREQ)
+        sim.skipLoops = skip
+        steps = encoder(seconds, rate)
+        chA, chB, chFlag = Pin(14), Pin(15), Pin(16)
+        got = []
+
+        def counter_handler(sm):   # as in QuadEnc-Full.py, but keeping everything
+            got.append((sm.get() & 0b11, sm.get() + 4))
+
+        sm2 = StateMachine(2, progs["trigger"], freq=MFREQ, in_base=chA, set_base=chFlag)
+        sm2.active(1)
+        sm3 = StateMachine(3, progs["trigger"], freq=MFREQ, in_base=chB, set_base=chFlag)
+        sm3.active(1)
+        sm4 = StateMachine(4, progs["counter"], freq=MFREQ, in_base=chA, jmp_pin=chFlag, sideset_base=Pin(22))
+        sm4.irq(counter_handler)
+        sm4.active(1)
+        t0 = time.time()
+        sim.run(seconds)
+        dt = time.time() - t0
+        sim.skipLoops = True
+        return got, steps, dt
+
+    def quadHoru(seconds):   # QuadHoru1.py: RX FIFOs joined by a mem32 write, 4 edges per handler call
+        progs = loadPio("QuadHoru1.py")
+        sim.reset(MFREQ)
+        sim.irqLatency = sim.cycles(20e-6)
+        steps = encoder(seconds, rate=20000.0)
+        chA, chB, chFlag = Pin(14), Pin(15), Pin(16)
+        dec = quadDecoder()
+        sums = []
+
+        def counter_handler(sm):   # as in QuadHoru1.py, without the print
+            tickSum = 0
+            for i in range(4):
+                dec.step(sm.get())
+                tickSum += sm.get()
+            sums.append(tickSum)
+
+        sm2 = StateMachine(2, progs["trigger"], freq=MFREQ, in_base=chA, set_base=chFlag)
+        sm2.active(1)
+        sm3 = StateMachine(3, progs["trigger"], freq=MFREQ, in_base=chB, set_base=chFlag)
+        sm3.active(1)
+        sm4 = StateMachine(4, progs["counter"], freq=MFREQ, in_base=chA, jmp_pin=chFlag, sideset_base=Pin(22))
+        sm4.irq(counter_handler)
+        mem32[0x50300000 | 0x0d0 + 0x1000] = 1 << 31
+        sm4.active(1)
+        sim.run(seconds)
+        return dec.pos, sum(d for _, d in steps), sums, sm4
+
+    def intervalTimer(delay):   # PIO-interval-timer.py: counts from a rise on GP16 to a rise on GP17
+        progs = loadPio("PIO-interval-timer.py")
+        sim.reset(125_000_000)
+        sim.drive(16, [(0.0, 0), (0.001, 1)])
+        sim.drive(17, [(0.0, 0), (0.001 + delay, 1)])
+        sm = StateMachine(0)
+        sm.init(progs["PULSE_LOW_DELTA"], freq=125_000_000, in_base=Pin(16), jmp_pin=Pin(17))
+        sm.active(1)
+        return 0xffffffff - sm.get()
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 60.0
+    # QuadEnc-Full.py: every edge, the right position and interval
+    got, steps, dt = quadEnc(seconds)
+    dec = quadDecoder()
+    for bits, ticks in got:
+        dec.step(bits)
+    mean = sum(tk for _, tk in got[1:]) / max(1, len(got) - 1)
+    print("QuadEnc-Full: %d edges, final position %d (expected %d), mean %.1f counts/edge (expected %.1f)"
+          % (len(got), dec.pos, sum(d for _, d in steps), mean, MFREQ / 2 / 500.0))
+    assert len(got) == len(steps) - 1                # the first edge only starts the count (wait(1, pin, 2))
+    assert abs(dec.pos - sum(d for _, d in steps)) <= 1
+    assert abs(mean - MFREQ / 2 / 500.0) < 1
+    print("  %.3g PIO cycles in %.2f s = %.3g cycles/s with loop skipping, %d instructions executed"
+          % (sim.t, dt, sim.t / dt, sim.steps))
+    # the same without skipping: every instruction executed, the same records
+    got2, steps2, dt2 = quadEnc(0.01, skip=False, rate=20000.0)
+    got1, steps1, dt1 = quadEnc(0.01, rate=20000.0)
+    assert got1 == got2
+    print("  without skipping: %.3g cycles/s (0.01 s of signal, the same %d records)"
+          % (sim.cycles(0.01) / dt2, len(got2)))
+    # QuadHoru1.py: the SHIFTCTRL write joins the FIFOs.  Its mov(y, 3) loads 'null' (3),
+    # so y = 0: the SM raises its IRQ after every edge, and the handler's 8 get()s wait for the next three
+    pos, want, sums, sm = quadHoru(0.5)
+    med = sorted(sums)[len(sums) // 2]
+    print("QuadHoru1 (FIFOs joined): position %d (expected %d), %d IRQs, %d counts per 4 edges "
+          "(%d, less ~5 a pass for the loop outside the count)" % (pos, want, len(sums), med, 4 * MFREQ // 2 // 20000))
+    assert pos == want and abs(med - (4 * MFREQ // 2 // 20000 - 20)) <= 4
+    assert sm.joinRx and mem32[0x50300000 | 0x0d0] >> 31 == 1
+    # RecipCounter1.py: gate / clock_count / pulse_count, IRQ per gate
+    import FreqEst
+    f, cover = FreqEst.simGated(1234.5, 2.0, 0.0)
+    print("RecipCounter1 gated: %d gates, %.4f Hz for a 1234.5 Hz input (%.1f ppm)"
+          % (len(f), f.mean(), (f.mean() / 1234.5 - 1) * 1e6))
+    assert abs(f.mean() / 1234.5 - 1) < 1e-5
+    # PIO-interval-timer.py: 2 cycles per count at 125 MHz
+    n = intervalTimer(0.5e-3)
+    print("PIO-interval-timer: %d counts for 0.5 ms (expected 31250)" % n)
+    assert n == 31250
@@ -0,0 +1,154 @@
+# Quadrature encoder decoding: (A,B) pin levels in, position out
+# quadDecoder.step(): one edge at a time, MicroPython on the Pico
+# quadDecoder.run(): NumPy arrays of (A,B) samples, CPython on the host
+# J.Beale's 16-entry lookup table, as used in QuadEnc-Full.py, QuadHoru1.py, ...
+
+"""
+bits = (B << 1) | A, as read by in_(pins, 2) with in_base = Ch.A
+The 4-bit state is (B,A old, B,A new); LU[state] is the position change.
+When A and B have both changed, an edge was missed and the direction is
+unknown, so the position is not changed and it is counted in 'illegal'.
+Neither changed (a glitch, or a repeated reading) is counted in 'same'.
+
+    dec = quadDecoder()
+    def counter_handler(sm):
+        dec.step(sm.get())          # dec.pos, dec.dir, dec.illegal
+
+    python3 QuadDecode.py           (equivalence test and speed of both paths)
+"""
+
+# quadrature encoder pin-state lookup, 4 bit index of last & current value of A,B inputs
+#    0  1  2  3  4  5  6  7  8  9  10  11  12  13  14  15
+LU = (0,-1,+1, 0,+1, 0, 0,-1,-1, 0, 0,  +1,  0, +1, -1,  0)
+
+class quadDecoder:
+
+    def __init__(self, bits=0):  # bits: A,B levels before the first edge
+        self.state = bits & 0b11
+        self.pos = 0
+        self.dir = 0              # direction of the last move, +1/-1 (0: none yet)
+        self.edges = 0
+        self.illegal = 0
+        self.same = 0
+        self.reversals = 0
+
+    def step(self, bits):   # one new (A,B) reading; returns the position change
+        s = ((self.state & 0b11) << 2) | (bits & 0b11)
+        self.state = s
+        self.edges += 1
+        inc = LU[s]
+        if inc:
+            self.pos += inc
+            if inc != self.dir:
+                if self.dir:
+                    self.reversals += 1
+                self.dir = inc
+        elif (s ^ (s >> 2)) & 0b11 == 0b11:
+            self.illegal += 1
+        else:
+            self.same += 1
+        return inc
+
+    def run(self, bits):
+        # host: decode a whole array of (A,B) readings in one go, carrying
+        # the state on to the next call.  Returns the position change at each
+        # reading, like step(); positions are pos0 + np.cumsum(inc).
+        import numpy as np
+        bits = np.asarray(bits, dtype=np.uint8) & 0b11
+        n = len(bits)
+        if n == 0:
+            return np.zeros(0, dtype=np.int8)
+        last = np.empty(n, dtype=np.uint8)        # reading before each one
+        last[0] = self.state & 0b11
+        last[1:] = bits[:-1]
+        s = last << 2                             # 4-bit states: (last << 2) | new
+        s |= bits
+        inc = LUnp.take(s, mode="clip")           # the one table gather (s < 16: no checks)
+        moved = np.count_nonzero(inc)
+        last ^= bits                              # 0b11: both pins changed
+        illegal = n - np.count_nonzero(last - 0b11)
+        self.illegal += illegal
+        self.same += n - moved - illegal
+        self.edges += n
+        self.state = int(bits[-1])
+        self.pos += int(np.add.reduce(inc, dtype=np.int64))
+        if moved:                                 # direction reversals, across calls too
+            mv = inc[inc != 0]
+            self.reversals += int(np.count_nonzero(mv[1:] != mv[:-1]))
+            if self.dir and mv[0] != self.dir:
+                self.reversals += 1
+            self.dir = int(mv[-1])
+        return inc
+
+    def report(self):
+        return "pos %d, dir %+d, edges %d, illegal %d, no change %d, reversals %d" % (
+            self.pos, self.dir, self.edges, self.illegal, self.same, self.reversals)
+
+def positions(a, b, dec=None):   # host: A and B level arrays -> position after each reading
+    import numpy as np
+    if dec is None:
+        dec = quadDecoder()
+    bits = (np.asarray(a, dtype=np.uint8) & 1) | ((np.asarray(b, dtype=np.uint8) & 1) << 1)
+    p0 = dec.pos
+    return p0 + np.cumsum(dec.run(bits), dtype=np.int64)
+
+try:                              # the table for run(), where NumPy is available
+    import numpy as _np
+    LUnp = _np.array(LU, dtype=_np.int8)
+except ImportError:
+    LUnp = None
+
+# -----------------------------------------
+if __name__ == "__main__":   # scalar and NumPy paths must agree; time both
+    import time
+    import numpy as np
+    GRAY = (0b00, 0b10, 0b11, 0b01)   # (B,A) for position & 3, +1 per step by LU
+
+    def walk(n, seed):   # encoder readings: back and forth, with some missed and repeated edges
+        rng = np.random.default_rng(seed)
+        step = np.where(np.sin(np.arange(n) * 3e-4) >= 0, 1, -1)
+        r = rng.random(n)
+        step[r < 0.002] *= 2          # a missed edge: both pins change
+        step[r > 0.998] = 0           # a glitch: same reading again
+        p = np.cumsum(step)
+        return np.array(GRAY, dtype=np.uint8)[p & 3]
+
+    n = 41360                         # as many edges as QuadEncData-Mar26.csv
+    for seed in range(5):
+        bits = walk(n, seed)
+        d1 = quadDecoder()
+        p1 = [0]*n
+        for k in range(n):
+            d1.step(int(bits[k]))
+            p1[k] = d1.pos
+        d2 = quadDecoder()
+        half = n // 3                 # two calls, to check the state carried between them
+        p2 = np.cumsum(np.concatenate((d2.run(bits[:half]), d2.run(bits[half:]))))
+        assert list(p2) == p1, "positions differ"
+        assert d1.report() == d2.report(), (d1.report(), d2.report())
+    print("scalar and NumPy paths agree: %s" % d1.report())
+
+    a = bits & 1; b = bits >> 1
+    assert list(positions(a, b)) == p1
+
+    def best(f, reps):
+        t = []
+        for _ in range(reps):
+            t0 = time.perf_counter()
+            f()
+            t.append(time.perf_counter() - t0)
+        return min(t)
+
+    def scalar():
+        d = quadDecoder()
+        st = d.step
+        for v in bits.tolist():
+            st(v)
+
+    ts = best(scalar, 5)
+    tn = best(lambda: quadDecoder().run(bits), 50)
+    print("%d edges: scalar %.2f ms, NumPy %.3f ms, %.0fx faster" % (n, ts*1e3, tn*1e3, ts/tn))
+    big = walk(10_000_000, 9)
+    tb = best(lambda: quadDecoder().run(big), 3)
+    print("%d edges: NumPy %.3f s (%.0f M edges/s)" % (len(big), tb, len(big) / tb / 1e6))
+    assert ts / tn >= 50, "NumPy path should be at least 50x faster"
@@ -21,9 +21,19 @@ from machine import Pin, mem32
 from rp2 import asm_pio, StateMachine, PIO
 from time import ticks_ms, ticks_us, ticks_diff, sleep, sleep_ms
 import array
+from PicoRing import ringBuf  # circular buffer shared with counter_handler
+from QuadDecode import quadDecoder  # (A,B) levels -> encoder position
+from VelEst import velEst    # running-sum velocity over the last few edges
+from OutStage import outStage, EVERY, CHANGE, TIMED  # batched, decimated CSV lines
 
 MFREQ = 200_000_000  # CPU frequency in Hz (typ. 125 MHz; Overclock to 250 MHz)
 VERSION = "Quadrature Readout v0.21 28-March-2021 J.Beale"
+binOut = False       # True: send raw (bits,ticks) edges as binary frames (PicoFrame.py)
+useDMA = False       # True: DMA moves FIFO data to RAM, no IRQ per edge (DmaCapture.py)
+VELWIN = 0           # 4, 16 or 64: print pos,vel,acc every VELDEC edges; 0: pos,ticks per edge
+VELDEC = 16          # edges per velocity output line
+OUTPOL = EVERY       # pos,ticks lines: EVERY OUTN-th edge, on CHANGE of pos > OUTK, or TIMED each OUTMS
+OUTN, OUTK, OUTMS = 1, 4, 100
 
 # -----------------------------------------
 def vBlink(p,t,n):      # blink LED on pin p, duration t milliseconds, repeat n times
@@ -46,7 +56,7 @@ def trigger():
     set(pins, 0)     # and return it low
                      # and loop around again
 
-@asm_pio(sideset_init=PIO.OUT_LOW)
+@asm_pio(sideset_init=PIO.OUT_LOW, fifo_join=PIO.JOIN_RX)  # 8-word RX FIFO: room for 3 pairs + 1
 def counter():    
     wait(1, pin, 2)    # initial synchronization with edge flag
     
@@ -69,25 +79,15 @@ def counter():
     irq(noblock, 0x10)   # signal 2 words of data are now ready to read    
     wrap()               # ----- repeat forever
 
-ASIZE = 1023                        # size of circular data buffers (dataT, dataB)
-dataT = array.array("I", [0]*ASIZE)  # store UINT32 timing data
-dataB = array.array("B", [0]*ASIZE)  # store UCHAR bits (Ch.A, Ch.B values)
-dIdx = 0                         # curent index into DATA array
+ring = ringBuf(1024)   # circular buffer of (Ch.A,Ch.B bits, UINT32 timing) records (IRQ mode)
 
 def counter_handler(sm):
-    global dIdx
-    dataB[dIdx] = sm.get() & 0b11    # read chA,chB
-    dataT[dIdx] = sm.get() + 4       # read timer value
-    dIdx = (dIdx + 1) % ASIZE           # increment index in circular buffer
+    ring.drain(sm)   # all waiting (chA,chB levels, timer value + loop overhead) pairs
     
 # --------------------------------------------
 def main():
   global start
-  global stateEnc
-  global posEnc
-  global luTable   # encoder output lookup table
   global led1
-  global dIdx      # index into data buffers, updated in interrupt routine
 
   machine.freq(MFREQ)
   led1 = Pin(25, Pin.OUT)
@@ -98,12 +98,20 @@ def main():
   vBlink(led1,200,4)
   sleep_ms(4000)  # delay allows starting recording program
     
-  print("pos,ticks")       # CSV header line
-  print("# %s" % VERSION)
+  if binOut:
+    from PicoFrame import frameWriter
+    fw = frameWriter()     # decode on host with 'python3 PicoFrame.py capture.bin'
+    fw.text("bits,ticks")
+    fw.text("# %s" % VERSION)
+  elif VELWIN:
+    print("pos,vel,acc")     # CSV header: edges, edges/s, edges/s^2
+    print("# %s  window %d edges" % (VERSION, VELWIN))
+  else:
+    st = outStage(OUTPOL, n=OUTN, k=OUTK, ms=OUTMS)
+    st.text("pos,ticks")     # CSV header line
+    st.text("# %s" % VERSION)
     
-  posEnc= 0
-  stateEnc = 0  # 4-bit encoder state (P2old,P1old,P2new,P1new)
-  luTable = [0,-1,+1, 0,+1, 0, 0,-1,-1, 0, 0,  +1,  0, +1, -1,  0]  # for both pins P1,P2
+  dec = quadDecoder()  # encoder position from chA,chB levels at each edge
   start = ticks_us()
 
   chA = Pin(14,Pin.IN,Pin.PULL_UP)  # encoder A input signal
@@ -117,21 +125,56 @@ def main():
   sm3.active(1)
                    # count time between edges on both Ch.A and Ch.B
   sm4 = StateMachine(4, counter, freq=smf, in_base=chA, jmp_pin = chFlag, sideset_base=Pin(22))
-  sm4.irq(counter_handler)
+  if useDMA:
+    from DmaCapture import dmaCapture
+    cap = dmaCapture(4, words=8192)  # sm4 = PIO1 SM0; 4096 words (2048 edges) per half
+    dLost = 0
+  else:
+    sm4.irq(counter_handler)
 
   sm4.active(1)
 
-  i = 0  # starting index into data arrays
-  while True:  # all the action is in the interrupt routine
-      if (dIdx != i):  # any new data in the buffer?
-          stateEnc = ((stateEnc & 0b11)<<2) | (dataB[i] & 0b11)  # calc. state from chA,chB 
-          posEnc += luTable[stateEnc]         # increment current encoder position based on state
-          sum = 2                         # 2 extra counts per 4 readings
-          for j in range(4):     # find sum over most recent 4 time readings
-              pi = (i-j) % ASIZE
-              sum += dataT[pi]
-          print("{0:6d},{1:8d}".format(posEnc,sum))
-          i = (i+1) % ASIZE
-          led1.toggle()           
+  ve = velEst(VELWIN or 4, VELDEC, MFREQ/2)  # window 4, every edge: the 4-reading sum
+
+  def edge(bits, tval, n):   # one record: chA,chB levels and timer value; n edges lost before it
+      if binOut:
+          fw.put2(bits, tval)  # frame goes out when full...
+          if n:
+              fw.text("# %d edges lost: buffer full" % n)
+          return
+      r = ve.add(dec.step(bits), tval)  # update encoder position from chA,chB
+      if VELWIN:
+          if n:
+              print("# %d edges lost: buffer full" % n)
+          if r:
+              print("%d,%.2f,%.1f" % r)
+              led1.toggle()
+          return
+      if n:
+          st.text("# %d edges lost: buffer full" % n)
+      sum = 2 + ve.sumT          # 2 extra counts per 4 readings
+      if st.put(dec.pos, dec.pos, sum):
+          led1.toggle()
+
+  lost = 0
+  while True:  # all the action is in the interrupt routine (or the DMA)
+      if useDMA:       # a block at a time, straight from the DMA buffer: no ring
+          blk = cap.read()
+          if cap.lost != dLost:  # main loop fell a half buffer behind
+              lost += (cap.lost - dLost) // 2
+              dLost = cap.lost
+          if len(blk):
+              for j in range(0, len(blk), 2):
+                  edge(blk[j] & 0b11, blk[j+1] + 4, lost)
+                  lost = 0
+              continue
+      elif ring.avail():  # any new data in the buffer?
+          bits, tval = ring.get()
+          edge(bits, tval, ring.lost())
+          continue
+      if binOut:
+          fw.send()                    # ...or as soon as we have caught up
+      elif not VELWIN:
+          st.poll()                  # send waiting lines once we have caught up
 # ---------------
 main()
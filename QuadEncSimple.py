@@ -20,6 +20,8 @@ https://datasheets.raspberrypi.org/pico/pico-datasheet.pdf
 import rp2                 # rp2.PIO, rp2.asm_pio
 import machine as m        # m.freq, m.Pin
 import utime               # utime.sleep, utime.ticks
+from QuadDecode import quadDecoder  # quadrature state & position from P2,P1 levels
+from OutStage import outStage, EVERY  # batched, decimated CSV lines
 
 #MFREQ = 250000000  # CPU frequency in Hz (typ. 125 MHz; Overclock to 250 MHz)
 MFREQ = 125000000  # CPU frequency in Hz (typ. 125 MHz; Overclock to 250 MHz)
@@ -66,22 +68,18 @@ def vBlink(p,t,n):      # blink LED on pin p, duration t milliseconds, repeat n
         utime.sleep_ms(t)
 # -----------------------------------------
 
+dec = quadDecoder()            # encoder position, updated by irq_handle
+
 def irq_handle(sm):            # handle interrupt
-      global stateEnc, uFlag      
-      global luTable, countEnc
+      global uFlag
 
       sm.get()                 # this value reserved for future use
-      ps = sm.get()            # pin state P2,P1
-      stateEnc = ((stateEnc&0b11)<<2) | ps
-      countEnc += luTable[stateEnc]  # count up or down      
+      dec.step(sm.get())       # pin state P2,P1: count up or down
       uFlag = 1   # add bit pattern to flag
     
 # ----------------------------------------- 
 def main():
-    global stateEnc  # 4-bit pin state variable (p2old,p1old,p2new,p1new)
     global uFlag     # data update flag
-    global luTable   # encoder output lookup table
-    global countEnc  # current encoder position
 
     m.freq(MFREQ)      # set CPU frequency; not necessarily the default 125 MHz       
     uFlag = False    # haven't got any new data yet
@@ -93,13 +91,6 @@ def main():
     vBlink(led1,200,4)
     utime.sleep_ms(4000)  # delay allows starting recording program
     
-    # quadrature encoder pin-state lookup, 4 bit index of last & current value of A,B inputs
-    #          0  1  2  3  4  5  6  7  8  9  10  11  12  13  14  15    
-    luTable = [0,-1,+1, 0,+1, 0, 0,-1,-1, 0, 0,  +1,  0, +1, -1,  0]  # for both pins P1,P2
-
-    stateEnc = 0  # initial encoder state
-    countEnc = 0  # intiial encoder position
-
     p1 = m.Pin(16,m.Pin.IN, m.Pin.PULL_UP)   # Channel A / Pin1 input
     p2 = m.Pin(17,m.Pin.IN, m.Pin.PULL_UP)   # Channel B / Pin2 input
   
@@ -113,17 +104,20 @@ def main():
     sm0.active(1)  # start the state machines running
     sm1.active(1)
 
-    print("n,msec,pos")  # CSV header line
-    print("# %s" % VERSION)
+    st = outStage(EVERY, n=1)  # n=4: one line per 4 updates
+    st.text("n,msec,pos")  # CSV header line
+    st.text("# %s" % VERSION)
     pCnt = 0
     dRatio = 1
     while True:
         if uFlag:          # update flag true when new data available
           uFlag = 0        # reset the flag that interrupt handler set
           ms = utime.ticks_ms()  # current time in milliseconds
-          print("%d,%d,%d" % (pCnt,ms,countEnc))
-          pCnt += 1           # count how many updates we've printed
-          led1.toggle()       # LED on every other reading to show activity
+          if st.put(dec.pos, pCnt, ms, dec.pos):
+              led1.toggle()   # LED on every other line to show activity
+          pCnt += 1           # count how many updates we've had
+        else:
+          st.poll()
 
 # ---------  End Main Loop  -----------------------------------------    
 
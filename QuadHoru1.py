@@ -6,6 +6,7 @@ from machine import Pin, mem32
 from rp2 import asm_pio, StateMachine, PIO
 from time import ticks_ms, ticks_us, ticks_diff, sleep
 import array
+from QuadDecode import quadDecoder  # (A,B) levels -> encoder position
 
 # Simulation SM
 @asm_pio(set_init=PIO.OUT_LOW)
@@ -56,39 +57,31 @@ def counter():
     mov(y, 3) .side(0)
     wrap()               # ----- outer run-forever loop
 
+dec = quadDecoder()   # encoder position, updated in counter_handler
+
 def counter_handler(sm):
     global start
-    global stateEnc
-    global posEnc
-    global luTable   # encoder output lookup table
     global led1
     data = array.array("I", [0]*8)
     tickSum = 0
     for i in range(4):
-        stateEnc = ((stateEnc&0b11)<<2) | (sm.get() & 0b11)  # read chA,chB & calc. state
-        posEnc += luTable[stateEnc]         # increment current encoder position based on state
+        dec.step(sm.get())   # read chA,chB & update encoder position
         tickSum += sm.get()  # add up total elapsed time        
     tNow = ticks_us()
     tDelta = ticks_diff(tNow, start) # input signal period, milliseconds
-    print("%d,%d,%d" % (tDelta,posEnc,tickSum))
+    print("%d,%d,%d" % (tDelta,dec.pos,tickSum))
     start = tNow
     led1.toggle()
     
 # --------------------------------------------
 def main():
   global start
-  global stateEnc
-  global posEnc
-  global luTable   # encoder output lookup table
   global led1
 
   machine.freq(200000000)
   led1 = Pin(25, Pin.OUT)
   led1.off()
 
-  posEnc=0
-  stateEnc=0
-  luTable = [0,-1,+1, 0,+1, 0, 0,-1,-1, 0, 0,  +1,  0, +1, -1,  0]  # for both pins P1,P2
   start = ticks_us()
 
   chA = Pin(14,Pin.IN,Pin.PULL_UP)  # encoder A input signal
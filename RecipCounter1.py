@@ -18,8 +18,11 @@ fcal = 1
 MFREQ = 250000000  
 MCAL  = int(MFREQ * fcal)       # calibrated value for this board at given CPU freq
 
-global gateVal
 gateVal = int(MFREQ/10000)
+max_count = const((1 << 32) - 1)
+
+GAPLESS = False    # True: timestamp every EDGES-th rising edge, no gate (FreqEst.py on the host)
+EDGES = 1          # input edges per timestamp; keep the timestamp rate below ~10 kHz
 
 
 @asm_pio(sideset_init=PIO.OUT_HIGH)
@@ -66,14 +69,42 @@ def pulse_count():
     push()                                                 # send data to FIFO
     irq(block, 5)                                          # set irq and wait for gate PIO to acknowledge
 
+@asm_pio(fifo_join=PIO.JOIN_RX)
+def timestamp():
+    """PIO for gapless timestamps: x counts down every 2 cycles, on every path,
+    and is pushed at every (y+1)th rising edge of the jmp pin."""
+    pull()                                                 # edges per timestamp - 1
+    mov(y, osr)
+    jmp("hi")
+    label("rise")                                          # rising edge seen
+    jmp(x_dec, "r2")
+    label("r2")
+    jmp(y_dec, "hi")                                       # not the Nth edge: wait for low
+    jmp(x_dec, "p1")
+    label("p1")
+    mov(isr, x)                                            # timestamp
+    jmp(x_dec, "p2")
+    label("p2")
+    push(noblock)                                          # never stall the count; FDEBUG shows a full FIFO
+    jmp(x_dec, "p3")
+    label("p3")
+    mov(y, osr)                                            # reload edge count
+    label("hi")                                            # input high: wait for it to go low
+    jmp(x_dec, "hi2")
+    label("hi2")
+    jmp(pin, "hi")
+    jmp(x_dec, "lo")
+    wrap_target()
+    label("lo")                                            # input low: wait for the rising edge
+    jmp(pin, "rise")
+    jmp(x_dec, "lo")                                       # at x == 0 it falls through to wrap: same 2 cycles
+    wrap()
+
 
 def init_sm(freq, input_pin, gate_pin, pulse_fin_pin):
     """Starts state machines."""
-    global gateVal
-
     gate_pin.value(1)
     pulse_fin_pin.value(1)
-    max_count = const((1 << 32) - 1)
     
     sm0 = rp2.StateMachine(0, gate, freq=freq, in_base=input_pin, sideset_base=gate_pin)    
     sm0.put(gateVal)
@@ -95,13 +126,40 @@ def init_sm(freq, input_pin, gate_pin, pulse_fin_pin):
     
     return sm0, sm1, sm2
 
+def init_timestamp(freq, input_pin, edges=EDGES, smId=3):
+    """Starts the gapless timestamp state machine."""
+    sm = rp2.StateMachine(smId, timestamp, freq=freq, jmp_pin=input_pin)
+    sm.put(edges - 1)
+    sm.active(1)
+    return sm
+
+def run_gapless(input_pin):
+    """Print the count at every EDGES-th rising edge; FreqEst.py turns them into frequency."""
+    from machine import mem32
+    FDEBUG = 0x50200000 + 0x008                            # PIO0 FDEBUG: RXSTALL bits 0..3
+    sm = init_timestamp(MFREQ, input_pin)
+    print("n,msec,count")                                  # count: units of 2 * Tcpu, wraps at 2^32
+    print("# gapless EDGES=%d MCAL=%d" % (EDGES, MCAL))
+    stall = 1 << 3
+    mem32[FDEBUG] = stall                                  # write 1 to clear
+    i = 0
+    while True:
+        if sm.rx_fifo():
+            c = (-sm.get()) & max_count
+            if mem32[FDEBUG] & stall:                      # a timestamp was dropped before this one
+                mem32[FDEBUG] = stall
+                print("# timestamps lost: FIFO full")
+            print("%d,%d,%d" % (i, utime.ticks_ms(), c))
+            i += 1
+
 if __name__ == "__main__":
     from machine import Pin, freq
     import uarray as array
-    global gateVal
 
     
     freq(MFREQ)      # set CPU frequency; not necessarily the default 125 MHz      
+    if GAPLESS:
+        run_gapless(Pin(15, Pin.IN, Pin.PULL_UP))
     update_flag = False
     data = array.array("I", [0, 0])
     def counter_handler(sm):
@@ -0,0 +1,429 @@
+# Store-and-forward packet queue for the ESP8266 serial-to-network bridge
+# ESP8266-Serial2Net.py puts each UART packet in the spool, and the forwarder
+# sends it over one long-lived TCP connection until the receiver acknowledges it.
+# MicroPython (ESP8266, Pico W); runs under CPython too, with a stand-in server.
+
+"""
+Each packet gets the next sequence number and ends with '# END_PACKET n'.
+The spool holds packets in RAM, or with 'path' as one file each on flash,
+so they outlast a reset (numbering goes on, under the same <boot>, see
+below); once it holds maxBytes the oldest is dropped and
+counted in 'dropped'.
+
+The forwarder keeps one connection open.  On connecting it sends
+    # HELLO <device> <boot> <version>
+then each packet (from flash, 512 bytes at a time), up to 'window' of them before an
+acknowledgement.  The receiver answers '# ACK n' when packet n (and all
+before it) is safely stored, and only then is it removed from the spool.
+If the connection fails, or no ACK comes within ackMs, it is closed and
+opened again later (backoff doubling up to backoffMaxMs), and sending
+resumes from the oldest packet not acknowledged.  So a packet may arrive
+twice, never not at all: the receiver drops numbers it already has for
+that device and boot.  <boot> changes when the sequence starts again.
+A receiver that never answers (plain 'nc -l') needs acks=False: a packet
+is then done once sendall() returns.
+
+    sp = spool(path="spool", maxBytes=65536)
+    fwd = forwarder(sp, server, port, "esp1")
+    ...
+    sp.put(b"# START ...\\n" + lines)    # when a packet is complete (or an iterable of pieces)
+    fwd.pump(2000)                      # send what is waiting, for up to 2 s
+
+    python3 Spool.py --test       (stand-in server with induced disconnects:
+                                   packets/s and loss, against one connection per packet)
+"""
+
+import errno
+import os
+import socket
+try:
+    from time import ticks_ms, ticks_diff, ticks_add
+except ImportError:          # CPython
+    import time
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+    def ticks_diff(a, b):
+        return a - b
+    def ticks_add(a, b):
+        return a + b
+
+def again(e):   # OSError from a timeout or 'would block', not a broken connection
+    a = e.args[0] if e.args else None
+    return a in (errno.EAGAIN, errno.ETIMEDOUT) or isinstance(a, str)
+
+class spool:
+
+    def __init__(self, path=None, maxBytes=8192, boot=None):
+        self.path = path           # directory on flash, or None: RAM only
+        self.maxBytes = maxBytes
+        self.pkts = []             # [seq, size, data or None (on flash)], oldest first
+        self.used = 0              # bytes held
+        self.dropped = 0           # packets dropped because the spool was full
+        self.seq = 0               # number of the last packet put
+        self.buf = bytearray(512)  # flash files go out through this
+        self.mvBuf = memoryview(self.buf)
+        if path is not None:
+            try:
+                os.mkdir(path)
+            except OSError:
+                pass               # already there
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".pkt"):
+                    n = int(name[:-4])
+                    size = os.stat(self._name(n))[6]
+                    self.pkts.append([n, size, None])
+                    self.used += size
+                    self.seq = n
+        if path is not None and self.pkts and boot is None:
+            with open(path + "/boot") as f:        # numbers go on from before the reset
+                boot = int(f.read())
+        if boot is None:           # new numbers from 1: the receiver must know
+            r = os.urandom(4)      # not ticks: those are much the same at every power-up
+            boot = ((r[0] << 24) | (r[1] << 16) | (r[2] << 8) | r[3]) & 0x3FFFFFFF
+        if path is not None:
+            with open(path + "/boot", "w") as f:
+                f.write("%d" % boot)
+        self.boot = boot
+
+    def _name(self, n):
+        return "%s/%08d.pkt" % (self.path, n)
+
+    def put(self, data):
+        # add one packet (lines ending in '\n'): bytes, or an iterable of bytes/memoryview
+        # pieces, which are written as they come (LineArena.chunks()); returns its number
+        self.seq += 1
+        end = ("# END_PACKET %d\n" % self.seq).encode()
+        if isinstance(data, (bytes, bytearray)):
+            data = (data,)
+        size = len(end)
+        if self.path is not None:
+            tmp = self.path + "/new.tmp"
+            with open(tmp, "wb") as f:
+                for c in data:
+                    f.write(c)
+                    size += len(c)
+                f.write(end)
+            self._room(size)
+            os.rename(tmp, self._name(self.seq))
+            self.pkts.append([self.seq, size, None])
+        else:
+            b = bytearray()
+            for c in data:
+                b.extend(c)
+            b.extend(end)
+            size = len(b)
+            self._room(size)
+            self.pkts.append([self.seq, size, b])
+        self.used += size
+        return self.seq
+
+    def _room(self, size):   # drop the oldest until size more bytes fit
+        while self.pkts and self.used + size > self.maxBytes:
+            self._remove(0)
+            self.dropped += 1
+
+    def _remove(self, i):
+        p = self.pkts.pop(i)
+        self.used -= p[1]
+        if self.path is not None:
+            os.remove(self._name(p[0]))
+
+    def data(self, i):   # bytes of the i-th packet waiting
+        p = self.pkts[i]
+        if p[2] is not None:
+            return p[2]
+        with open(self._name(p[0]), "rb") as f:
+            return f.read()
+
+    def send(self, i, sock):   # the i-th packet waiting, out on sock; from flash a buffer at a time
+        p = self.pkts[i]
+        if p[2] is not None:
+            sock.sendall(p[2])
+            return
+        with open(self._name(p[0]), "rb") as f:
+            while True:
+                n = f.readinto(self.buf)
+                if not n:
+                    break
+                sock.sendall(self.mvBuf[:n])
+
+    def ack(self, n):    # packets up to n have arrived
+        while self.pkts and self.pkts[0][0] <= n:
+            self._remove(0)
+
+    def waiting(self):
+        return len(self.pkts)
+
+# -----------------------------------------
+class forwarder:
+
+    def __init__(self, sp, host, port, device, version="", window=4, acks=True,
+                 ackMs=3000, connectMs=2000, backoffMs=500, backoffMaxMs=30000):
+        self.sp = sp
+        self.addr = (host, port)
+        self.hello = ("# HELLO %s %d %s\n" % (device, sp.boot, version)).encode()
+        self.window = window       # packets sent ahead of the acknowledgements
+        self.acks = acks
+        self.ackMs = ackMs
+        self.connectMs = connectMs
+        self.backoff0 = backoffMs
+        self.backoffMaxMs = backoffMaxMs
+        self.backoff = backoffMs
+        self.sock = None
+        self.sentTo = 0            # last packet number sent on this connection
+        self.sentMax = 0           # highest packet number ever sent
+        self.tAck = 0              # ticks_ms when we started waiting for an ACK
+        self.tRetry = ticks_ms()   # no new connection before this
+        self.rx = b""              # partial ACK line
+        self.sent = 0              # packets sent (counting resends)
+        self.resent = 0
+        self.connects = 0
+        self.failures = 0          # connections lost or refused
+
+    def _open(self):
+        if ticks_diff(ticks_ms(), self.tRetry) < 0:
+            return False
+        try:
+            s = socket.socket()
+            s.settimeout(self.connectMs / 1000)
+            s.connect(self.addr)
+            s.sendall(self.hello)
+        except OSError:
+            try:
+                s.close()
+            except Exception:
+                pass
+            self._fail(None)
+            return False
+        self.sock = s
+        self.connects += 1
+        self.sentTo = 0
+        self.rx = b""
+        return True
+
+    def _fail(self, s):   # drop the connection; try again after the backoff
+        if s is not None:
+            try:
+                s.close()
+            except Exception:
+                pass
+        self.sock = None
+        self.failures += 1
+        self.tRetry = ticks_add(ticks_ms(), self.backoff)
+        self.backoff = min(2 * self.backoff, self.backoffMaxMs)
+
+    def _readAcks(self, waitMs):   # take in '# ACK n' lines, waiting up to waitMs for the first
+        s = self.sock
+        s.settimeout(waitMs / 1000)
+        try:
+            d = s.recv(256)
+        except OSError as e:
+            if again(e):           # nothing yet
+                return
+            raise
+        if not d:
+            raise OSError("closed by receiver")
+        lines = (self.rx + d).split(b"\n")
+        self.rx = lines.pop()
+        n = 0
+        for ln in lines:
+            if ln.startswith(b"# ACK "):
+                try:
+                    n = max(n, int(ln[6:]))
+                except ValueError:
+                    pass           # garbled or cut short: the next ACK covers it
+        if n:
+            self.sp.ack(n)
+            self.backoff = self.backoff0
+            self.tAck = ticks_ms()
+
+    def pump(self, budgetMs=0):
+        # send what is waiting and collect ACKs, for up to budgetMs; returns packets still waiting
+        t0 = ticks_ms()
+        sp = self.sp
+        while sp.waiting():
+            if self.sock is None and not self._open():
+                break
+            s = self.sock
+            try:
+                pk = sp.pkts
+                i = 0                              # first packet not yet sent on this connection
+                while i < len(pk) and pk[i][0] <= self.sentTo:
+                    i += 1
+                if i < len(pk) and i < self.window:
+                    if i == 0:
+                        self.tAck = ticks_ms()         # ACK clock runs from the oldest in flight
+                    s.settimeout(self.connectMs / 1000)
+                    sp.send(i, s)
+                    self.sentTo = pk[i][0]
+                    if self.sentTo <= self.sentMax:
+                        self.resent += 1
+                    else:
+                        self.sentMax = self.sentTo
+                    self.sent += 1
+                    if not self.acks:
+                        sp.ack(self.sentTo)
+                        continue
+                    self._readAcks(0)
+                else:
+                    left = budgetMs - ticks_diff(ticks_ms(), t0)
+                    self._readAcks(max(1, min(left, 50)))
+                    if sp.waiting() and ticks_diff(ticks_ms(), self.tAck) > self.ackMs:
+                        self._fail(s)              # no ACK: start over on a new connection
+            except OSError:
+                self._fail(s)
+            if ticks_diff(ticks_ms(), t0) >= budgetMs:
+                break
+        return sp.waiting()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+# -----------------------------------------
+if __name__ == "__main__":
+    import random
+    import sys
+    import threading
+    import time
+
+    class standIn:   # receiver that acknowledges packets, and drops connections now and then
+        def __init__(self, dropRate=0.0, seed=1):
+            self.ls = socket.socket()
+            self.ls.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.ls.bind(("127.0.0.1", 0))
+            self.ls.listen(8)
+            self.port = self.ls.getsockname()[1]
+            self.rng = random.Random(seed)
+            self.dropRate = dropRate   # chance, per packet, of dropping the connection
+            self.got = {}              # (device, boot) -> {packet number: line count}
+            self.dups = 0
+            self.cuts = 0
+            self.acks = True
+            threading.Thread(target=self.serve, daemon=True).start()
+
+        def serve(self):
+            while True:
+                c, _ = self.ls.accept()
+                threading.Thread(target=self.client, args=(c,), daemon=True).start()
+
+        def client(self, c):
+            f = c.makefile("rb")
+            key = ("?", 0)
+            lines = 0
+            with c:
+              try:
+                  for ln in f:
+                      if ln.startswith(b"# HELLO "):
+                          w = ln.split()
+                          key = (w[2], int(w[3]))
+                          continue
+                      lines += 1
+                      if self.rng.random() < self.dropRate / 20:     # mid-packet: the rest is lost
+                          self.cuts += 1
+                          c.shutdown(socket.SHUT_RDWR)
+                          return
+                      if not ln.startswith(b"# END_PACKET "):
+                          continue
+                      n = int(ln[13:])
+                      pk = self.got.setdefault(key, {})
+                      if n in pk:
+                          self.dups += 1
+                      pk[n] = lines
+                      lines = 0
+                      if self.rng.random() < self.dropRate / 2:      # stored, but the ACK never goes
+                          self.cuts += 1
+                          c.shutdown(socket.SHUT_RDWR)
+                          return
+                      if self.acks:
+                          c.sendall(b"# ACK %d\n" % n)
+              except OSError:
+                pass                   # the sender went away
+
+    def packet(i, rng):   # a UART packet as ESP8266-Serial2Net.py builds it
+        n = rng.randint(10, 60)
+        return ("# START 2021-03-18 17:01:%02d\n" % (i % 60)
+                + "".join("%d,%d, 0.015, 0.0163, %d\n" % (669402085 + i, j, rng.getrandbits(32)) for j in range(n))
+                ).encode(), n + 2
+
+    def perPacket(srv, N, rng):   # the old way: new connection, a send() per line, packet lost on error
+        srv.acks = False           # as 'nc -l'
+        lost = 0
+        t0 = time.perf_counter()
+        for i in range(N):
+            data, _ = packet(i, rng)
+            try:
+                s = socket.create_connection(("127.0.0.1", srv.port))
+                for ln in data.split(b"\n")[:-1]:
+                    s.send(ln + b"\n")
+                s.send(b"# END_PACKET %d\n" % (i + 1))
+                s.close()
+            except OSError:
+                lost += 1
+        time.sleep(0.2)
+        got = srv.got.get(("?", 0), {})
+        return N / (time.perf_counter() - t0), N - len(got)
+
+    def spooled(srv, N, rng, path=None, window=4):
+        sp = spool(path, maxBytes=1 << 23)     # room for the whole run: packets come faster than any UART
+        fwd = forwarder(sp, "127.0.0.1", srv.port, "esp1", "test", window=window,
+                        ackMs=500, backoffMs=20, backoffMaxMs=200)
+        want = {}
+        t0 = time.perf_counter()
+        for i in range(N):
+            data, n = packet(i, rng)
+            want[sp.put(data)] = n
+            fwd.pump(0)
+        while fwd.pump(100):
+            pass
+        dt = time.perf_counter() - t0
+        got = srv.got.get((b"esp1", sp.boot), {})
+        bad = sum(1 for k in want if got.get(k) != want[k])
+        fwd.close()
+        return N / dt, bad, fwd, sp
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--test":
+        N = 2000
+        for drop in (0.0, 0.01, 0.05):
+            print("disconnects at %.0f%% of packets:" % (drop * 100))
+            srv = standIn(drop)
+            rate, lost = perPacket(srv, N // 10, random.Random(2))
+            print("  connection per packet, send() per line: %6.0f packets/s, %4d of %d lost (%.1f%%)"
+                  % (rate, lost, N // 10, 1000.0 * lost / N))
+            srv = standIn(drop)
+            rate, bad, fwd, sp = spooled(srv, N, random.Random(2))
+            print("  spool, one connection, sendall + ACK:    %6.0f packets/s, %4d of %d lost; "
+                  "%d reconnects, %d resent, %d duplicates dropped by the receiver"
+                  % (rate, bad, N, fwd.connects - 1, fwd.resent, srv.dups))
+            assert bad == 0 and sp.dropped == 0
+        # on flash: packets left unsent at a reset go out after it
+        import tempfile
+        d = tempfile.mkdtemp()
+        srv = standIn(0.0)
+        sp = spool(d, maxBytes=65536)
+        for i in range(20):
+            sp.put(packet(i, random.Random(i))[0])
+        sp2 = spool(d, maxBytes=65536)      # power cycle: the files are still there
+        fwd = forwarder(sp2, "127.0.0.1", srv.port, "esp1")
+        while fwd.pump(100):
+            pass
+        assert sp2.boot == sp.boot and sorted(srv.got[(b"esp1", sp.boot)]) == list(range(1, 21))
+        assert os.listdir(d) == ["boot"]
+        print("flash spool: 20 packets from before a reset delivered after it")
+        # a packet put in pieces is the same packet
+        for path in (None, d):
+            sp = spool(path, maxBytes=65536)
+            data = packet(1, random.Random(1))[0]
+            sp.put(data)
+            sp.put(memoryview(data)[i:i + 100] for i in range(0, len(data), 100))
+            assert sp.data(0)[:-2] == sp.data(1)[:-2] and sp.pkts[0][1] == sp.pkts[1][1]
+            sp.ack(2)
+        os.remove(d + "/boot")
+        os.rmdir(d)
+        # the spool is bounded: with the receiver away, the oldest go first
+        sp = spool(None, maxBytes=20000)
+        for i in range(100):
+            sp.put(packet(i, random.Random(i))[0])
+        assert sp.used <= 20000 and sp.dropped + sp.waiting() == 100 and sp.pkts[-1][0] == 100
+        print("RAM spool of 20000 bytes: kept the newest %d of 100 packets" % sp.waiting())
@@ -0,0 +1,230 @@
+# Adaptive UART receive polling for the ESP8266 serial bridge (ESP8266-Serial2Net.py)
+# MicroPython for ESP8266; runs under CPython too, with a simulated UART
+# Drains the UART for as long as bytes are waiting, and sleeps only when it
+# is empty, each time twice as long up to maxMs, instead of sleep_ms(15) per line.
+
+"""
+At 115200 baud a byte comes every 87 us: a 64-byte rxbuf is full in 5.5 ms,
+and what comes after that is dropped without a word.  So:
+  - rxbufFor(baud, stallMs) sizes rxbuf for the longest time the loop is away
+    from the UART while a packet comes in (a flash write of an arena part),
+    plus one poll sleep, rounded up to a power of two.
+  - read() takes whatever is waiting, at once, and is called again at once;
+    when nothing is there it sleeps minMs, 2*minMs, ... up to maxMs, which is
+    at most half the time the rxbuf takes to fill.
+  - The driver has no overflow flag, so a read that finds rxbuf full (any()
+    of rxbuf-1 or more) is counted in 'overflows': bytes were probably lost.
+    'most' is the largest any() seen: how close it came.
+
+    rxbuf = rxbufFor(115200, 100)
+    uart = machine.UART(0, rxbuf=rxbuf)
+    uart.init(115200, timeout=100)
+    poll = uartPoll(uart, 115200, rxbuf)
+    ...
+    n = poll.read(rx)          # 0 after a sleep when there was nothing
+
+    python3 UartPoll.py --sim      (simulated UART at full line rate: bytes lost,
+                                    old loop vs. fixed sleep vs. adaptive)
+"""
+
+try:
+    from time import sleep_ms
+except ImportError:          # CPython
+    import time
+    def sleep_ms(ms):
+        time.sleep(ms / 1000)
+
+def rxbufFor(baud, stallMs=100, bits=10, maxMs=50):
+    # rxbuf bytes for stallMs away from the UART at 'baud' (10 bits a byte, 8N1)
+    need = baud // bits * (stallMs + maxMs) // 1000
+    size = 64
+    while size < need:
+        size *= 2
+    return size
+
+class uartPoll:
+
+    def __init__(self, uart, baud=115200, rxbuf=64, minMs=1, maxMs=50, sleep=sleep_ms, bits=10):
+        self.uart = uart
+        self.rxbuf = rxbuf
+        fillMs = rxbuf * bits * 1000 // baud       # rxbuf full from empty
+        self.minMs = minMs
+        self.maxMs = max(minMs, min(maxMs, fillMs // 2))
+        self.sleep = sleep
+        self.ms = minMs            # next sleep
+        self.bytes = 0             # bytes read
+        self.reads = 0
+        self.sleeps = 0
+        self.overflows = 0         # reads that found rxbuf full
+        self.most = 0              # largest any() seen
+
+    def read(self, buf):   # bytes waiting into buf (up to its size); returns how many, 0 after a sleep
+        k = self.uart.any()
+        if k:
+            if k > self.most:
+                self.most = k
+            if k >= self.rxbuf - 1:
+                self.overflows += 1
+            n = self.uart.readinto(buf, min(k, len(buf))) or 0
+            self.bytes += n
+            self.reads += 1
+            self.ms = self.minMs
+            return n
+        self.sleep(self.ms)
+        self.sleeps += 1
+        self.ms = min(2 * self.ms, self.maxMs)
+        return 0
+
+    def report(self):
+        return "# UART %d bytes, %d reads, %d sleeps, rxbuf %d, most waiting %d, overflows %d" % (
+            self.bytes, self.reads, self.sleeps, self.rxbuf, self.most, self.overflows)
+
+# -----------------------------------------
+if __name__ == "__main__":
+    import sys
+    from LineArena import lineArena, HALT
+
+    # ESP8266 costs in MicroPython, roughly: the loop is not free
+    READ_US = 150              # one uart.any() + readinto()
+    BYTE_US = 8                # lineArena.feed() per byte
+    LINE_US = 250              # and per line
+    OLD_LINE_US = 600          # readline, decode, rstrip, str, append
+    FLASH_MS = 80              # an 8 KB arena part written to the spool on flash
+
+    class clock:   # virtual time, s
+        def __init__(self):
+            self.t = 0.0
+        def sleep_ms(self, ms):
+            self.t += ms / 1000
+        def time(self):
+            return int(self.t)
+
+    class simUart:   # bytes arrive back to back at 'baud'; a full rxbuf (rxbuf-1 bytes) drops the rest
+        def __init__(self, data, baud, rxbuf, clk):
+            self.data = data
+            self.rate = baud / 10
+            self.cap = rxbuf - 1
+            self.clk = clk
+            self.q = bytearray()
+            self.src = 0           # bytes sent so far
+            self.lost = 0
+        def _arrive(self):
+            k = min(len(self.data), int(self.clk.t * self.rate))
+            if k > self.src:
+                new = self.data[self.src:k]
+                room = self.cap - len(self.q)
+                self.q += new[:room]
+                self.lost += max(0, len(new) - room)
+                self.src = k
+        def any(self):
+            self._arrive()
+            return len(self.q)
+        def done(self):
+            return self.src == len(self.data) and not self.any()
+        def readinto(self, buf, nbytes):
+            self._arrive()
+            n = min(nbytes, len(self.q))
+            buf[:n] = self.q[:n]
+            del self.q[:n]
+            self.clk.t += READ_US * 1e-6
+            return n
+        def readline(self, n):   # waits for the rest of a line, as with timeout=100
+            t0 = self.clk.t
+            while True:
+                self._arrive()
+                q = self.q.find(b"\n", 0, n)
+                if q >= 0 or len(self.q) >= min(n, self.cap) or self.clk.t - t0 > 0.1 \
+                   or self.src == len(self.data):
+                    q = min(n, len(self.q)) if q < 0 else q + 1
+                    b = bytes(self.q[:q])
+                    del self.q[:q]
+                    return b
+                self.clk.t = (self.src + 1) / self.rate
+
+    def stream(seconds, baud, seed=1):   # the Pico sending lines back to back, then '**HALT'
+        import random
+        rng = random.Random(seed)
+        out = []
+        size = 0
+        i = 0
+        while size < seconds * baud / 10:
+            ln = b"%d, 0.015, 0.0163, %d, %d, %d, %d\r\n" % (
+                i, rng.getrandbits(32), rng.getrandbits(32), rng.getrandbits(32), rng.getrandbits(32))
+            out.append(ln)
+            size += len(ln)
+            i += 1
+        return b"".join(out) + b"**HALT\n", out
+
+    def oldLoop(uart, clk):   # ESP8266-Serial2Net.py before: readline(120), sleep_ms(15)
+        got = []
+        while not uart.done():
+            if uart.any():
+                ln = uart.readline(120)
+                clk.t += OLD_LINE_US * 1e-6
+                if ln.rstrip() == b"**HALT":
+                    break
+                got.append(ln.rstrip())
+            clk.sleep_ms(15)
+        return got
+
+    def arenaLoop(uart, clk, poll=None):   # now: LineArena, read all that waits; fixed sleep_ms(15) if no poll
+        arena = lineArena(8192)
+        rx = bytearray(256); mvRx = memoryview(rx)
+        got = []
+        while not uart.done():
+            if poll is not None:
+                n = poll.read(rx)
+            else:
+                k = uart.any()
+                n = uart.readinto(rx, min(k, len(rx))) if k else 0
+            p = 0
+            while p < n:
+                p0 = p
+                p = arena.feed(mvRx, p, n, clk.time())
+                clk.t += (BYTE_US * (p - p0) + LINE_US) * 1e-6
+                if arena.event:
+                    got += [ln.split(b",", 1)[1] for ln in b"".join(bytes(c) for c in arena.chunks()).split(b"\n")[:-1]]
+                    if arena.event == HALT:
+                        return got
+                    clk.t += FLASH_MS / 1000             # to the spool, on flash
+                    arena.clear()
+            if poll is None:
+                clk.sleep_ms(15)
+        return got
+
+    def run(name, loop, baud, rxbuf, data, sent, adaptive=False):
+        clk = clock()
+        uart = simUart(data, baud, rxbuf, clk)
+        poll = uartPoll(uart, baud, rxbuf, sleep=clk.sleep_ms) if adaptive else None
+        got = loop(uart, clk, poll) if poll is not None else loop(uart, clk)
+        want = set(ln.rstrip() for ln in sent)
+        lost = len(want - set(got))
+        print("%-34s rxbuf %5d: %6d bytes dropped, %5d of %d lines lost%s"
+              % (name, rxbuf, uart.lost, lost, len(sent),
+                 ", %d overflows counted, most waiting %d" % (poll.overflows, poll.most) if poll else ""))
+        return uart.lost, lost, poll
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--sim":
+        for baud in (115200, 230400):
+            data, sent = stream(20, baud)
+            rxbuf = rxbufFor(baud, FLASH_MS)
+            print("%d baud, %.0f s of lines back to back (%d lines):" % (baud, len(data) * 10 / baud, len(sent)))
+            run("readline + sleep_ms(15) (before)", oldLoop, baud, 64, data, sent)
+            run("arena + sleep_ms(15)", arenaLoop, baud, 64, data, sent)
+            run("arena + adaptive poll", arenaLoop, baud, 64, data, sent, True)
+            drop, lost, poll = run("arena + adaptive poll", arenaLoop, baud, rxbuf, data, sent, True)
+            assert drop == 0 and lost == 0 and poll.overflows == 0
+        # the counter sees what is lost: too small an rxbuf for the flash writes
+        data, sent = stream(20, 115200)
+        drop, lost, poll = run("adaptive, rxbuf too small", arenaLoop, 115200, 256, data, sent, True)
+        assert drop > 0 and poll.overflows > 0
+        # idle: the sleeps grow, so an idle bridge wakes ~1000/maxMs times a second, not 66
+        clk = clock()
+        uart = simUart(b"", 115200, 2048, clk)
+        poll = uartPoll(uart, 115200, 2048, sleep=clk.sleep_ms)
+        rx = bytearray(256)
+        while clk.t < 10:
+            poll.read(rx)
+        print("idle 10 s: %d wakeups (sleep_ms(15): %d), longest sleep %d ms"
+              % (poll.sleeps, 10000 // 15, poll.maxMs))
+        assert poll.sleeps < 10000 // 15
@@ -0,0 +1,137 @@
+# Sliding-window encoder velocity from PIO edge times, O(1) per edge
+# MicroPython for Raspberry Pi Pico (RP2040) main loop; runs under CPython too
+# python3 VelEst.py   (replays QuadHoru1-data1.csv against a brute-force sum)
+
+"""
+Each edge adds its position change (+1/-1/0) and its tick count, and the
+edge leaving the window is taken back out, so the window sums cost the
+same for 4, 16 or 64 edges.  Every 'decim' edges, once the window is full,
+add() returns (pos, vel, acc):
+    vel  edges/s over the last 'window' edges = sumP / (sumT / countRate)
+    acc  edges/s^2, change in vel since the last output, over the time
+         between the two windows' midpoints
+Otherwise it returns None.
+
+    ve = velEst(window=16, decim=16)
+    ...
+    r = ve.add(dec.step(bits), tval)
+    if r:
+        print("%d,%.3f,%.2f" % r)
+"""
+
+import array
+
+class velEst:
+
+    def __init__(self, window=16, decim=16, countRate=100e6):
+        n = 1
+        while n < window:
+            n <<= 1
+        self.window = n            # 4, 16, 64, ...: rounded up to a power of 2
+        self.mask = n - 1
+        self.decim = decim         # edges per output
+        self.countRate = countRate # PIO counts/sec: 200 MHz, 2 cycles per count
+        self.dt = array.array("I", [0]*n)   # ticks of each edge in the window
+        self.dp = array.array("b", [0]*n)   # position change of each edge
+        self.k = 0                 # next slot to replace
+        self.sumT = 0              # ticks over the window
+        self.sumP = 0              # position change over the window
+        self.pos = 0
+        self.edges = 0
+        self.left = decim          # edges until the next output
+        self.since = 0             # ticks since the last output
+        self.vel = 0.0
+        self.acc = 0.0
+        self.lastSum = 0           # sumT at the last output (0: none yet)
+
+    def add(self, inc, ticks):   # one edge: position change, ticks since the last edge
+        k = self.k
+        self.sumT += ticks - self.dt[k]
+        self.sumP += inc - self.dp[k]
+        self.dt[k] = ticks
+        self.dp[k] = inc
+        self.k = (k + 1) & self.mask
+        self.pos += inc
+        self.edges += 1
+        self.since += ticks
+        self.left -= 1
+        if self.left > 0 or self.edges < self.window or self.sumT <= 0:
+            return None
+        self.left = self.decim
+        v = self.sumP * self.countRate / self.sumT
+        if self.lastSum:         # window midpoints: now - sumT/2, and last output - lastSum/2
+            dMid = self.since - (self.sumT - self.lastSum) / 2
+            if dMid > 0:
+                self.acc = (v - self.vel) * self.countRate / dMid
+        self.vel = v
+        self.lastSum = self.sumT
+        self.since = 0
+        return (self.pos, self.vel, self.acc)
+
+    def period(self):   # mean ticks per edge over the window
+        return self.sumT / self.window
+
+# -----------------------------------------
+if __name__ == "__main__":   # replay QuadHoru1-data1.csv; compare with brute-force sums
+    import os
+    from QuadDecode import quadDecoder
+    rows = []
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "QuadHoru1-data1.csv")) as f:
+        for line in f:
+            v = line.strip().split(",")
+            if len(v) == 6:
+                rows.append([int(x) for x in v])
+    # per-edge records: the file has the (A,B) bits of 4 edges and their summed
+    # ticks, so split each sum into 4 parts that add up to it exactly
+    dec = quadDecoder(rows[0][1])
+    bits = []; ticks = []; inc = []
+    for r in rows:
+        q, rem = divmod(r[5], 4)
+        for j in range(4):
+            bits.append(r[1+j])
+            ticks.append(q + (rem if j == 3 else 0))
+            inc.append(dec.step(r[1+j]))
+    n = len(ticks)
+    print("%d rows, %d edges, final position %d" % (len(rows), n, dec.pos))
+
+    def brute(W, decim, cr=100e6):   # the old way: walk back over the window at each output
+        out = []; pos = 0; vPrev = None; tPrev = 0; tNow = 0; acc = 0.0
+        for i in range(n):
+            pos += inc[i]
+            tNow += ticks[i]
+            if i + 1 < W or (i + 1) % decim:
+                continue
+            sT = 0; sP = 0
+            for j in range(W):
+                sT += ticks[(i - j) % n]
+                sP += inc[(i - j) % n]
+            v = sP * cr / sT
+            mid = tNow - sT / 2
+            if vPrev is not None:
+                acc = (v - vPrev) * cr / (mid - tPrev)
+            vPrev = v; tPrev = mid
+            out.append((pos, v, acc))
+        return out
+
+    for W in (4, 16, 64):
+        decim = W               # one output per window's worth of edges
+        ve = velEst(W, decim)
+        got = [r for r in map(ve.add, inc, ticks) if r]
+        ref = brute(W, decim)
+        assert len(got) == len(ref), (len(got), len(ref))
+        for g, r in zip(got, ref):
+            assert g[0] == r[0]
+            assert abs(g[1] - r[1]) <= 1e-9 * max(1.0, abs(r[1])), (g, r)
+            assert abs(g[2] - r[2]) <= 1e-6 * max(1.0, abs(r[2])), (g, r)
+        vmax = max(abs(g[1]) for g in got)
+        print("window %2d: %4d outputs agree with the brute-force sums; |vel| up to %.1f edges/s"
+              % (W, len(got), vmax))
+
+    # every edge, window 4: sumT + 2 is QuadEnc-Full.py's old 4-reading 'sum'
+    ve = velEst(4, 1)
+    last = [0]*4
+    for i in range(n):
+        ve.add(inc[i], ticks[i])
+        last[i & 3] = ticks[i]
+        assert ve.sumT + 2 == 2 + sum(last)
+    print("window 4, every edge: running sum matches the 4-reading sum")
@@ -1,20 +1,14 @@
 # Python3 host code to find connected Pico boards
 # tested only from Raspberry Pi 4 host
-#  needs PyUSB to find Pico in bootloader mode
+#  bootloader mode Picos are found from /sys (see PicoDevices.py);
+#  PyUSB is only needed on hosts without it:
 #  'sudo apt install python-usb python3-usb'
 # 14-March-2021 J.Beale
 
-import usb.core
+from PicoDevices import findBoot, findPicos
 
-VID      = 0x2e8a  # Vendor Id: Raspberry Pi Pico device
-BootID   = 0x0003  # Pico bootloader mode
-PythonID = 0x0005  # Pico in MicroPython Serial Device mode
-
-device = usb.core.find(idVendor=VID, idProduct=BootID, find_all=1)
-pCountBoot = sum(1 for _ in device)   
-
-device = usb.core.find(idVendor=VID, idProduct=PythonID, find_all=1)
-pCountSerial = sum(1 for _ in device)   
+pCountBoot = len(findBoot())
+pCountSerial = len(findPicos())
 
 print("%d Pico bootloader devices" % pCountBoot)
 print("%d Pico serial devices" % pCountSerial)